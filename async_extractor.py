@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Async Facade for Email Metadata Extractor
+
+This module lets asyncio services use the extractor and the database without
+blocking their event loop:
+
+  - extract() parses messages with EmailMetadataExtractor on a process pool,
+    since parsing is CPU-bound and would otherwise hold the GIL
+  - save_batch() runs save_metadata_batch() on a single dedicated writer
+    thread, so SQLite writes from one process never contend with each other
+  - search() and the other reads run on a small pool of reader threads, which
+    WAL mode lets proceed while the writer commits
+
+A semaphore bounds the number of messages being parsed at once, so callers
+can submit thousands of messages and simply wait their turn instead of
+queueing unbounded work (and memory) in the pool.
+
+Example:
+    async with AsyncEmailMetadataService() as service:
+        metadata = await asyncio.gather(*(service.extract(email_content=raw) for raw in messages))
+        ids = await service.save_batch(metadata)
+        results = await service.search('example.com', 'sender')
+"""
+
+import os
+import json
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+import database_config
+import streaming_analytics
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+
+def extract_metadata_dict(email_path: str = None, email_content: bytes = None) -> Dict[str, Any]:
+    """
+    Extract the metadata of one message as plain JSON types.
+
+    Module-level so it can run in worker processes.
+
+    Args:
+        email_path: Path to the email file
+        email_content: Raw email content
+
+    Returns:
+        Dict[str, Any]: The extracted metadata
+    """
+    extractor = EmailMetadataExtractor(email_path=email_path, email_content=email_content)
+    extractor.extract_metadata()
+    return json.loads(extractor.to_json())
+
+
+class AsyncEmailMetadataService:
+    """Asyncio facade over the extractor and the metadata database."""
+
+    def __init__(self, workers: int = None, max_concurrency: int = None,
+                 executor: Optional[Executor] = None, reader_threads: int = 4):
+        """Initialize the service.
+
+        Args:
+            workers: Number of parsing processes, defaults to the CPU count
+            max_concurrency: Messages parsed at once, defaults to twice the number of workers
+            executor: Executor for parsing, defaults to a process pool
+            reader_threads: Number of threads for database reads
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or self.workers * 2
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers)
+        self._owns_executor = executor is None
+        # Sketches updated in a worker process would be lost, so record them here
+        self._record_in_parent = isinstance(self.executor, ProcessPoolExecutor)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metadata-writer')
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix='metadata-reader')
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Shut down the worker pools once their pending work is done."""
+        loop = asyncio.get_running_loop()
+        pools = [self._writer, self._readers] + ([self.executor] if self._owns_executor else [])
+        await asyncio.gather(*(loop.run_in_executor(None, pool.shutdown) for pool in pools))
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it belongs to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def extract(self, email_path: str = None, email_content: bytes = None) -> Dict[str, Any]:
+        """
+        Extract the metadata of one message on the parsing pool.
+
+        Args:
+            email_path: Path to the email file
+            email_content: Raw email content
+
+        Returns:
+            Dict[str, Any]: The extracted metadata
+        """
+        async with self._get_semaphore():
+            metadata = await asyncio.get_running_loop().run_in_executor(
+                self.executor, extract_metadata_dict, email_path, email_content
+            )
+        if self._record_in_parent:
+            streaming_analytics.record_metadata(metadata)
+        return metadata
+
+    async def extract_many(self, contents: List[bytes],
+                           return_exceptions: bool = False) -> List[Any]:
+        """
+        Extract the metadata of many raw messages, at most max_concurrency at a time.
+
+        Args:
+            contents: Raw email contents
+            return_exceptions: Return exceptions in place of failed messages instead of raising
+
+        Returns:
+            List[Any]: Metadata of each message, in order
+        """
+        return await asyncio.gather(
+            *(self.extract(email_content=content) for content in contents),
+            return_exceptions=return_exceptions
+        )
+
+    async def save_batch(self, metadata_list: List[Dict[str, Any]]) -> List[Optional[int]]:
+        """
+        Save extracted metadata in one transaction on the writer thread.
+
+        Returns:
+            List[Optional[int]]: The ID of each metadata record, or None for messages that failed
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._writer, save_metadata_batch, metadata_list
+        )
+
+    async def search(self, search_term: str, search_type: str = 'sender',
+                     start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Search stored email metadata on a reader thread.
+
+        Returns:
+            List[Dict[str, Any]]: Matching email metadata records
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, database_config.search_email_metadata, search_term, search_type, start, end
+        )
+
+    async def search_domain_info(self, domain: str) -> Dict[str, Any]:
+        """Get stored information about a domain on a reader thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, database_config.search_domain_info, domain
+        )
+
+    async def search_related_emails(self, domain: str) -> List[Dict[str, Any]]:
+        """Get the related emails of a domain on a reader thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, database_config.search_related_emails, domain
+        )
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Attachment Inventory for Email Metadata Extractor
+
+This module lists the attachments of a message (filename, content type,
+decoded size and SHA-256) without building the message in memory. The raw
+message is fed to AttachmentScanner in chunks; MIME boundaries are located
+with bytes.find, and attachment bodies are decoded from base64 or
+quoted-printable and hashed a chunk at a time, so peak memory per message is
+bounded by the chunk size rather than by the size of the attachments.
+"""
+
+import time
+import hashlib
+import binascii
+import sqlite3
+from email.parser import BytesHeaderParser
+from email.policy import default
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+import database_config
+
+# Bytes read from the source and decoded per step
+CHUNK_SIZE = 64 * 1024
+
+# Parts whose header block is larger than this are skipped, so a header line
+# without line breaks is never buffered past it
+MAX_PART_HEADER_BYTES = 64 * 1024
+
+# Multiparts nested deeper than this are not descended into
+MAX_MIME_DEPTH = 32
+
+# Attachments inventoried per message
+MAX_ATTACHMENTS = 1000
+
+# Longest line examined as a potential boundary delimiter (RFC 2046 limits
+# boundaries to 70 characters)
+_MAX_DELIMITER_LINE = 1024
+
+_HEADERS, _BODY, _SKIP = range(3)
+
+
+class _PartDecoder:
+    """Decode and hash the body of one MIME part incrementally."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self._held = b''
+        self._base64 = bytearray()
+
+    def _emit(self, data: bytes):
+        if data:
+            self.sha256.update(data)
+            self.size += len(data)
+
+    def write(self, data: bytes):
+        """Add a piece of the encoded body, which always ends at a line boundary or a flush."""
+        data = self._held + data
+        # The final line break before a boundary belongs to the delimiter, so
+        # hold back the trailing one (with a quoted-printable soft break marker)
+        held = 0
+        if data.endswith(b'\r\n'):
+            held = 2
+        elif data.endswith(b'\n'):
+            held = 1
+        if self.encoding == 'quoted-printable':
+            if held and data[:-held].endswith(b'='):
+                held += 1
+            elif not held:
+                # An overlong line was flushed part way; keep an unfinished =XX escape
+                escape = data.rfind(b'=', len(data) - 2)
+                held = len(data) - escape if escape != -1 else 0
+        self._held = data[len(data) - held:] if held else b''
+        data = data[:len(data) - held] if held else data
+
+        if self.encoding == 'base64':
+            # Drop line breaks and other non-alphabet bytes so that the
+            # 4-character groups line up across chunks
+            self._base64 += data.translate(None, _BASE64_NOISE)
+            usable = len(self._base64) - len(self._base64) % 4
+            if usable:
+                self._decode_base64(bytes(self._base64[:usable]))
+                del self._base64[:usable]
+        elif self.encoding == 'quoted-printable':
+            self._emit(binascii.a2b_qp(data))
+        else:
+            self._emit(data)
+
+    def _decode_base64(self, data: bytes):
+        try:
+            self._emit(binascii.a2b_base64(data))
+        except binascii.Error:
+            # Incorrect padding; decode what can be decoded
+            usable = len(data.rstrip(b'=')) // 4 * 4
+            if usable:
+                self._emit(binascii.a2b_base64(data[:usable]))
+
+    def finish(self) -> Dict[str, Any]:
+        """Flush the remaining input and return the decoded size and digest."""
+        if self.encoding == 'base64' and self._base64:
+            self._decode_base64(bytes(self._base64))
+            self._base64.clear()
+        return {'size': self.size, 'sha256': self.sha256.hexdigest()}
+
+
+_BASE64_NOISE = bytes(
+    b for b in range(256)
+    if b not in b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+)
+
+
+class AttachmentScanner:
+    """Push-style MIME walker that inventories attachments in bounded memory."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, max_depth: int = MAX_MIME_DEPTH,
+                 max_attachments: int = MAX_ATTACHMENTS,
+                 max_header_section_bytes: Optional[int] = MAX_PART_HEADER_BYTES):
+        """Initialize the scanner for one message."""
+        self.chunk_size = chunk_size
+        self.max_depth = max_depth
+        self.max_attachments = max_attachments
+        self.max_header_section_bytes = max_header_section_bytes
+        self.attachments = []
+        # Name of the limit that cut the inventory short, if any
+        self.truncated = None
+        self._buffer = bytearray()
+        self._state = _HEADERS
+        self._header_bytes = bytearray()
+        self._at_line_start = True
+        # Open multiparts: [delimiter, part path, number of children seen]
+        self._multiparts = []
+        self._path = '1'
+        self._decoder = None
+        self._current = None
+
+    def feed(self, data: Union[bytes, memoryview]):
+        """Feed the next piece of the raw message."""
+        self._buffer += data
+        self._process(final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the message and return its attachments."""
+        self._process(final=True)
+        if self._state == _HEADERS and self._header_bytes:
+            self._start_part()
+        self._finish_part()
+        return self.attachments
+
+    def _process(self, final: bool):
+        buffer = self._buffer
+        while buffer:
+            if self._state == _HEADERS:
+                end = buffer.find(b'\n')
+                size = len(self._header_bytes) + (end + 1 if end != -1 else len(buffer))
+                if self.max_header_section_bytes is not None and size > self.max_header_section_bytes:
+                    # Skip the part as if it were a body; the buffer is then
+                    # passed on a chunk at a time however long the line is
+                    self.truncated = 'max_header_section_bytes'
+                    self._header_bytes.clear()
+                    self._state = _SKIP
+                    self._at_line_start = True
+                    continue
+                if end == -1:
+                    if not final:
+                        break
+                    end = len(buffer) - 1
+                line = bytes(buffer[:end + 1])
+                del buffer[:end + 1]
+                if line.strip():
+                    self._header_bytes += line
+                else:
+                    self._start_part()
+                continue
+
+            # Body, preamble or epilogue: a line starting with "--" may be a delimiter
+            if self._at_line_start and buffer[:2] == b'--' and self._multiparts:
+                end = buffer.find(b'\n', 0, _MAX_DELIMITER_LINE)
+                if end == -1 and len(buffer) < _MAX_DELIMITER_LINE and not final:
+                    break
+                line = bytes(buffer[:end + 1] if end != -1 else buffer[:_MAX_DELIMITER_LINE])
+                if self._delimiter(line.rstrip()):
+                    del buffer[:len(line)]
+                    self._at_line_start = True
+                    continue
+
+            # Pass on data up to the next line that starts with "--"
+            end = buffer.find(b'\n--', 1 if self._at_line_start and buffer[:2] == b'--' else 0)
+            if end != -1:
+                end += 1
+            else:
+                end = buffer.rfind(b'\n') + 1
+                if len(buffer) - end >= self.chunk_size or final:
+                    end = len(buffer)
+                elif end == 0:
+                    break
+            self._body(bytes(buffer[:end]))
+            self._at_line_start = buffer[end - 1:end] == b'\n'
+            del buffer[:end]
+
+    def _delimiter(self, line: bytes) -> bool:
+        """Handle a boundary delimiter line; returns False if line is ordinary data."""
+        for level in range(len(self._multiparts) - 1, -1, -1):
+            delimiter = self._multiparts[level][0]
+            if not line.startswith(delimiter):
+                continue
+            rest = line[len(delimiter):]
+            if rest and rest != b'--':
+                continue
+            self._finish_part()
+            # A delimiter of an outer multipart also closes the inner ones
+            del self._multiparts[level + 1:]
+            if rest == b'--':
+                self._multiparts.pop()
+                self._state = _SKIP
+            else:
+                parent = self._multiparts[level]
+                parent[2] += 1
+                self._path = f"{parent[1]}.{parent[2]}" if parent[1] else str(parent[2])
+                self._state = _HEADERS
+            return True
+        return False
+
+    def _start_part(self):
+        """Parse the collected part headers and prepare for its body."""
+        headers = BytesHeaderParser(policy=default).parsebytes(bytes(self._header_bytes))
+        self._header_bytes.clear()
+        self._state = _BODY
+        self._at_line_start = True
+
+        content_type = headers.get_content_type()
+        if headers.get_content_maintype() == 'multipart' and headers.get_boundary():
+            if self.max_depth is not None and len(self._multiparts) >= self.max_depth:
+                # Deeper parts are skipped as the body of this one
+                self.truncated = 'max_mime_depth'
+                self._state = _SKIP
+                return
+            # Children of the top-level multipart are numbered 1, 2, ...
+            parent_path = '' if self._path == '1' and not self._multiparts else self._path
+            self._multiparts.append([b'--' + headers.get_boundary().encode('utf-8', 'replace'),
+                                     parent_path, 0])
+            self._state = _SKIP
+            return
+
+        filename = headers.get_filename()
+        disposition = headers.get_content_disposition()
+        if not (filename or disposition == 'attachment'
+                or headers.get_content_maintype() not in ('text', 'multipart')):
+            return
+        if self.max_attachments is not None and len(self.attachments) >= self.max_attachments:
+            self.truncated = 'max_attachments'
+            return
+
+        encoding = str(headers.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+        self._decoder = _PartDecoder(encoding)
+        self._current = {
+            'part': self._path,
+            'filename': filename or '',
+            'content_type': content_type,
+            'disposition': disposition or '',
+            'encoding': encoding,
+        }
+
+    def _body(self, data: bytes):
+        if self._state == _BODY and self._decoder is not None:
+            self._decoder.write(data)
+
+    def _finish_part(self):
+        if self._decoder is not None:
+            self._current.update(self._decoder.finish())
+            self.attachments.append(self._current)
+        self._decoder = None
+        self._current = None
+
+
+def scan_attachments(source: Union[str, bytes, memoryview], chunk_size: int = CHUNK_SIZE) -> List[Dict[str, Any]]:
+    """
+    Inventory the attachments of a message.
+
+    Args:
+        source: Path to the message file, or the raw message as a bytes-like object
+        chunk_size: Bytes processed per step
+
+    Returns:
+        List[Dict[str, Any]]: Attachments with part, filename, content_type,
+        disposition, encoding, size and sha256
+    """
+    return scan_attachments_with_limits(source, chunk_size)[0]
+
+
+def scan_attachments_with_limits(source: Union[str, bytes, memoryview], chunk_size: int = CHUNK_SIZE,
+                                 deadline: Optional[float] = None, max_depth: int = MAX_MIME_DEPTH,
+                                 max_attachments: int = MAX_ATTACHMENTS,
+                                 max_header_section_bytes: Optional[int] = MAX_PART_HEADER_BYTES
+                                 ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Inventory the attachments of a message within resource limits.
+
+    Args:
+        source: Path to the message file, or the raw message as a bytes-like object
+        chunk_size: Bytes processed per step
+        deadline: time.monotonic() value after which scanning stops
+        max_depth: Multipart nesting depth descended into, None for no limit
+        max_attachments: Attachments inventoried, None for no limit
+        max_header_section_bytes: Header block size of a part (or the message)
+            above which the part is skipped, None for no limit
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[str]]: The attachments found, and the
+        limit that cut the inventory short ('time_budget', 'max_mime_depth',
+        'max_attachments' or 'max_header_section_bytes') or None
+    """
+    scanner = AttachmentScanner(chunk_size, max_depth, max_attachments, max_header_section_bytes)
+    if isinstance(source, str):
+        f = open(source, 'rb')
+        chunks = iter(lambda: f.read(chunk_size), b'')
+    else:
+        f = None
+        view = memoryview(source)
+        chunks = (view[start:start + chunk_size] for start in range(0, len(view), chunk_size))
+    try:
+        for chunk in chunks:
+            if deadline is not None and time.monotonic() > deadline:
+                # Drop the part being decoded rather than report a partial hash
+                scanner.truncated = 'time_budget'
+                scanner._decoder = None
+                scanner._buffer.clear()
+                break
+            scanner.feed(chunk)
+    finally:
+        if f is not None:
+            f.close()
+    return scanner.close(), scanner.truncated
+
+
+def create_attachment_tables(cursor: sqlite3.Cursor):
+    """
+    Create the attachment inventory table and its indexes.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attachments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metadata_id INTEGER NOT NULL,
+        part TEXT NOT NULL,
+        filename TEXT,
+        content_type TEXT,
+        size INTEGER,
+        sha256 TEXT,
+        FOREIGN KEY (metadata_id) REFERENCES email_metadata (id)
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256, metadata_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attachments_metadata ON attachments (metadata_id)"
+    )
+
+
+def insert_attachments(cursor: sqlite3.Cursor, metadata_id: int, attachments: List[Dict[str, Any]]):
+    """
+    Replace the stored attachment inventory of a record without committing.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata_id (int): The ID of the email_metadata record
+        attachments (List[Dict[str, Any]]): Attachments from scan_attachments()
+    """
+    cursor.execute("DELETE FROM attachments WHERE metadata_id = ?", (metadata_id,))
+    cursor.executemany(
+        """INSERT INTO attachments (metadata_id, part, filename, content_type, size, sha256)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(metadata_id, a['part'], a['filename'], a['content_type'], a['size'], a['sha256'])
+         for a in attachments]
+    )
+
+
+def search_attachments(sha256: Optional[str] = None, metadata_id: Optional[int] = None,
+                       limit: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Search the attachment inventory by content hash or by message.
+
+    Args:
+        sha256 (Optional[str]): Hex SHA-256 of the decoded attachment
+        metadata_id (Optional[int]): The ID of the email_metadata record
+        limit (int): Maximum number of attachments to return
+
+    Returns:
+        List[Dict[str, Any]]: Attachments with the message_id and subject of their email
+    """
+    query = """SELECT metadata_id, part, filename, content_type, size, sha256
+               FROM attachments
+               WHERE 1 = 1"""
+    params = []
+    if sha256:
+        query += " AND sha256 = ?"
+        params.append(sha256.lower())
+    if metadata_id is not None:
+        query += " AND metadata_id = ?"
+        params.append(metadata_id)
+    query += " ORDER BY metadata_id, part LIMIT ?"
+    params.append(limit)
+
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(query, params)
+
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    # Messages are stored in the main database or their monthly partition;
+    # those of archived partitions are left out
+    records = database_config.get_email_metadata_by_ids(
+        [row['metadata_id'] for row in rows], ('message_id', 'subject')
+    )
+    attachments = []
+    for row in rows:
+        record = records.get(row['metadata_id'])
+        if record:
+            row['message_id'] = record['message_id']
+            row['subject'] = record['subject']
+            attachments.append(row)
+    return attachments
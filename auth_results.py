@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Authentication Results for Email Metadata Extractor
+
+This module turns the DKIM-Signature, Received-SPF and Authentication-Results
+headers kept by EmailMetadataExtractor into structured per-mechanism verdicts
+(mechanism, result, domain, selector). Verdicts are stored in an indexed table
+when a message is saved, so queries such as "all dmarc=fail from domain X" are
+index lookups instead of string matching over every row's metadata_json.
+"""
+
+import re
+import sqlite3
+from typing import Dict, List, Any, Optional
+
+import database_config
+
+# Innermost RFC 5322 comments, removed repeatedly to handle nesting
+_COMMENT_RE = re.compile(r'\([^()]*\)')
+_METHOD_RE = re.compile(r'^\s*([A-Za-z][\w-]*)\s*(?:/\s*[\w.]+\s*)?=\s*([A-Za-z][\w-]*)')
+_PROPERTY_RE = re.compile(r'([A-Za-z][\w-]*)\.([A-Za-z][\w-]*)\s*=\s*("[^"]*"|[^\s;]+)')
+_TAG_RE = re.compile(r'(?:^|;)\s*([A-Za-z][\w]*)\s*=\s*([^;]*)')
+_SPF_RESULT_RE = re.compile(r'^\s*([A-Za-z]+)')
+_KEY_VALUE_RE = re.compile(r'([\w-]+)\s*=\s*("[^"]*"|[^\s;]+)')
+
+
+def _strip_comments(value: str) -> str:
+    """Remove (possibly nested) comments from a header value."""
+    previous = None
+    while previous != value:
+        previous = value
+        value = _COMMENT_RE.sub(' ', value)
+    return value
+
+
+def _domain_of(value: Optional[str]) -> str:
+    """Get the lowercase domain of an address or domain property value."""
+    if not value:
+        return ''
+    value = value.strip().strip('"<>').lower()
+    return value.rsplit('@', 1)[-1]
+
+
+def parse_authentication_results(header_value: str) -> List[Dict[str, str]]:
+    """
+    Parse an Authentication-Results header into per-mechanism verdicts.
+
+    Args:
+        header_value (str): The header value, e.g.
+            "mx.example.com; dkim=pass header.d=example.com header.s=s1; dmarc=fail header.from=example.com"
+
+    Returns:
+        List[Dict[str, str]]: Verdicts with mechanism, result, domain and selector
+    """
+    verdicts = []
+    if not header_value:
+        return verdicts
+
+    # The first element is the authserv-id, the remaining ones are results
+    for resinfo in _strip_comments(str(header_value)).split(';')[1:]:
+        match = _METHOD_RE.match(resinfo)
+        if not match:
+            continue
+        mechanism, result = match.group(1).lower(), match.group(2).lower()
+        properties = {f"{ptype.lower()}.{prop.lower()}": value.strip('"')
+                      for ptype, prop, value in _PROPERTY_RE.findall(resinfo[match.end():])}
+
+        if mechanism == 'dkim':
+            domain = _domain_of(properties.get('header.d') or properties.get('header.i'))
+            selector = properties.get('header.s', '').lower()
+        elif mechanism == 'spf':
+            domain = _domain_of(properties.get('smtp.mailfrom') or properties.get('smtp.helo'))
+            selector = ''
+        else:
+            domain = _domain_of(properties.get('header.from') or properties.get('header.d'))
+            selector = ''
+
+        verdicts.append({'mechanism': mechanism, 'result': result,
+                         'domain': domain, 'selector': selector})
+    return verdicts
+
+
+def parse_dkim_signature(header_value: str) -> Dict[str, str]:
+    """
+    Get the signing domain and selector from a DKIM-Signature header.
+
+    Args:
+        header_value (str): The header value
+
+    Returns:
+        Dict[str, str]: The 'domain' (d= tag) and 'selector' (s= tag), empty if absent
+    """
+    tags = {tag.lower(): value.strip() for tag, value in _TAG_RE.findall(str(header_value or ''))}
+    return {'domain': tags.get('d', '').lower(), 'selector': tags.get('s', '').lower()}
+
+
+def parse_received_spf(header_value: str) -> Optional[Dict[str, str]]:
+    """
+    Parse a Received-SPF header into an SPF verdict.
+
+    Args:
+        header_value (str): The header value, e.g. "pass (...) client-ip=192.0.2.1; envelope-from=a@example.com"
+
+    Returns:
+        Optional[Dict[str, str]]: The SPF verdict, or None if the header is empty
+    """
+    if not header_value:
+        return None
+    value = str(header_value)
+    match = _SPF_RESULT_RE.match(value)
+    if not match:
+        return None
+    pairs = {key.lower(): val.strip('"') for key, val in _KEY_VALUE_RE.findall(_strip_comments(value))}
+    return {'mechanism': 'spf', 'result': match.group(1).lower(),
+            'domain': _domain_of(pairs.get('envelope-from') or pairs.get('helo')), 'selector': ''}
+
+
+def extract_verdicts(metadata: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Build the structured authentication verdicts of an extracted message.
+
+    Authentication-Results takes precedence; Received-SPF is used when it has
+    no SPF result, and the DKIM-Signature fills in the signing domain and
+    selector of DKIM results that lack them.
+
+    Args:
+        metadata (Dict[str, Any]): The extracted metadata of the message
+
+    Returns:
+        List[Dict[str, str]]: Verdicts with mechanism, result, domain and selector
+    """
+    verdicts = parse_authentication_results(metadata.get('authentication_results', ''))
+
+    if not any(v['mechanism'] == 'spf' for v in verdicts):
+        spf = parse_received_spf(metadata.get('spf', ''))
+        if spf:
+            verdicts.append(spf)
+
+    signature = parse_dkim_signature(metadata.get('dkim', ''))
+    if signature['domain']:
+        dkim_verdicts = [v for v in verdicts if v['mechanism'] == 'dkim']
+        for verdict in dkim_verdicts:
+            if not verdict['domain']:
+                verdict['domain'] = signature['domain']
+            if not verdict['selector'] and verdict['domain'] == signature['domain']:
+                verdict['selector'] = signature['selector']
+        if not dkim_verdicts:
+            # Signed, but no receiving server has evaluated the signature
+            verdicts.append({'mechanism': 'dkim', 'result': 'none', **signature})
+
+    return verdicts
+
+
+def create_verdict_tables(cursor: sqlite3.Cursor):
+    """
+    Create the authentication verdict table and its indexes.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS auth_verdicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metadata_id INTEGER NOT NULL,
+        mechanism TEXT NOT NULL,
+        result TEXT NOT NULL,
+        domain TEXT NOT NULL DEFAULT '',
+        selector TEXT NOT NULL DEFAULT '',
+        FOREIGN KEY (metadata_id) REFERENCES email_metadata (id)
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_auth_verdicts_lookup "
+        "ON auth_verdicts (mechanism, result, domain, metadata_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_auth_verdicts_metadata "
+        "ON auth_verdicts (metadata_id)"
+    )
+
+
+def save_verdicts(metadata_id: int, verdicts: List[Dict[str, str]]) -> bool:
+    """
+    Replace the stored authentication verdicts of an email metadata record.
+
+    Args:
+        metadata_id (int): The ID of the email_metadata record
+        verdicts (List[Dict[str, str]]): Verdicts from extract_verdicts()
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        insert_verdicts(cursor, metadata_id, verdicts)
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving authentication verdicts: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def insert_verdicts(cursor: sqlite3.Cursor, metadata_id: int, verdicts: List[Dict[str, str]]):
+    """
+    Replace the stored authentication verdicts of a record without committing.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata_id (int): The ID of the email_metadata record
+        verdicts (List[Dict[str, str]]): Verdicts from extract_verdicts()
+    """
+    cursor.execute("DELETE FROM auth_verdicts WHERE metadata_id = ?", (metadata_id,))
+    cursor.executemany(
+        """INSERT INTO auth_verdicts (metadata_id, mechanism, result, domain, selector)
+           VALUES (?, ?, ?, ?, ?)""",
+        [(metadata_id, v['mechanism'], v['result'], v['domain'], v['selector']) for v in verdicts]
+    )
+
+
+def search_verdicts(mechanism: str, result: Optional[str] = None, domain: Optional[str] = None,
+                    limit: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Search for emails by authentication outcome.
+
+    Args:
+        mechanism (str): The mechanism, e.g. 'dkim', 'spf' or 'dmarc'
+        result (Optional[str]): The result, e.g. 'pass' or 'fail'
+        domain (Optional[str]): The evaluated domain
+        limit (int): Maximum number of emails to return
+
+    Returns:
+        List[Dict[str, Any]]: Matching email metadata records with the verdict, without metadata_json
+    """
+    query = """SELECT mechanism, result, domain, selector, metadata_id
+               FROM auth_verdicts
+               WHERE mechanism = ?"""
+    params = [mechanism.lower()]
+    if result:
+        query += " AND result = ?"
+        params.append(result.lower())
+    if domain:
+        query += " AND domain = ?"
+        params.append(domain.lower())
+    query += " ORDER BY metadata_id DESC LIMIT ?"
+    params.append(limit)
+
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(query, params)
+
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    # Messages are stored in the main database or their monthly partition;
+    # those of archived partitions are left out
+    records = database_config.get_email_metadata_by_ids(
+        [row['metadata_id'] for row in rows], ('message_id', 'sender', 'recipient', 'subject', 'date')
+    )
+    verdicts = []
+    for row in rows:
+        record = records.get(row.pop('metadata_id'))
+        if record:
+            verdicts.append({**row, **record})
+    return verdicts
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the async facade against the synchronous extractor
+
+This script extracts, saves and searches the same messages twice: once with
+EmailMetadataExtractor and save_metadata_batch() called in a loop, and once
+through AsyncEmailMetadataService. For the async run it also measures the
+event loop lag, i.e. how late a 10 ms ticker wakes up while the work is in
+flight, which shows whether parsing or SQLite is blocking the loop.
+
+It runs against a temporary database unless --db is given.
+
+Example:
+    python benchmark_async.py --messages 2000 --workers 4 --concurrency 16
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Any
+
+import database_config
+from async_extractor import AsyncEmailMetadataService
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+SEARCH_TERMS = ('example', 'gmail', 'benchmark', 'report')
+
+
+def _messages(email_bytes: bytes, count: int) -> List[bytes]:
+    """Make count copies of a message with distinct Message-IDs."""
+    header, sep, body = email_bytes.partition(b'\n\n')
+    lines = [line for line in header.split(b'\n') if not line.lower().startswith(b'message-id:')]
+    return [b'\n'.join(lines + [f'Message-ID: <benchmark-{i}@example.com>'.encode()]) + sep + body
+            for i in range(count)]
+
+
+def _batches(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_sync(messages: List[bytes], batch_size: int, searches: int) -> Dict[str, float]:
+    """Extract, save and search on the calling thread."""
+    timings = {}
+
+    started = time.perf_counter()
+    metadata = []
+    for content in messages:
+        extractor = EmailMetadataExtractor(email_content=content)
+        extractor.extract_metadata()
+        metadata.append(json.loads(extractor.to_json()))
+    timings['extract'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for batch in _batches(metadata, batch_size):
+        save_metadata_batch(batch)
+    timings['save'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(searches):
+        database_config.search_email_metadata(SEARCH_TERMS[i % len(SEARCH_TERMS)], 'sender')
+    timings['search'] = time.perf_counter() - started
+    return timings
+
+
+async def _measure_lag(stop: asyncio.Event, lags: List[float], interval: float = 0.01):
+    """Record how late a periodic timer fires."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_async(messages: List[bytes], batch_size: int, searches: int,
+                    workers: int, concurrency: int) -> Dict[str, float]:
+    """Extract, save and search through the async facade."""
+    timings = {}
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_measure_lag(stop, lags))
+
+    async with AsyncEmailMetadataService(workers=workers, max_concurrency=concurrency) as service:
+        # Start the worker processes outside the timed section
+        await service.extract(email_content=messages[0])
+
+        started = time.perf_counter()
+        metadata = await service.extract_many(messages)
+        timings['extract'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(*(service.save_batch(batch) for batch in _batches(metadata, batch_size)))
+        timings['save'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(*(service.search(SEARCH_TERMS[i % len(SEARCH_TERMS)], 'sender')
+                               for i in range(searches)))
+        timings['search'] = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    lags.sort()
+    timings['loop_lag_p99_ms'] = lags[min(int(len(lags) * 0.99), len(lags) - 1)] * 1000 if lags else 0.0
+    timings['loop_lag_max_ms'] = lags[-1] * 1000 if lags else 0.0
+    return timings
+
+
+def _fresh_database(path: str):
+    """Point the configuration at an empty database."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    database_config.DATABASE_PATH = path
+    database_config.initialize_database()
+
+
+def main():
+    """Main function to run the benchmark from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor async benchmark')
+    parser.add_argument('--messages', '-n', type=int, default=1000, help='Number of messages')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1, help='Parsing processes')
+    parser.add_argument('--concurrency', '-c', type=int, default=None, help='Messages parsed at once')
+    parser.add_argument('--batch-size', '-b', type=int, default=200, help='Messages saved per transaction')
+    parser.add_argument('--searches', type=int, default=200, help='Number of searches')
+    parser.add_argument('--email', default='sample_email.eml', help='Message to replicate')
+    parser.add_argument('--db', help='Database to benchmark against (emptied first; default: a temporary file)')
+
+    args = parser.parse_args()
+
+    with open(args.email, 'rb') as f:
+        messages = _messages(f.read(), args.messages)
+
+    if args.db:
+        db_path = args.db
+    else:
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+    try:
+        _fresh_database(db_path)
+        sync = run_sync(messages, args.batch_size, args.searches)
+        _fresh_database(db_path)
+        asynchronous = asyncio.run(run_async(messages, args.batch_size, args.searches,
+                                             args.workers, args.concurrency))
+    finally:
+        if not args.db:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.unlink(db_path + suffix)
+
+    print(f"{'stage':8} {'sync':>12} {'async':>12} {'speedup':>8}")
+    for stage, count in (('extract', args.messages), ('save', args.messages), ('search', args.searches)):
+        print(f"{stage:8} {count / sync[stage]:8.1f} /s {count / asynchronous[stage]:8.1f} /s "
+              f"{sync[stage] / asynchronous[stage]:7.2f}x")
+    print(f"event loop lag: p99 {asynchronous['loop_lag_p99_ms']:.1f} ms, "
+          f"max {asynchronous['loop_lag_max_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
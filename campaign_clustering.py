@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Campaign Clustering for Email Metadata Extractor
+
+This module groups bulk and campaign mail that differs only in small details
+(tracking numbers in the subject, per-recipient X-headers, rotating relays).
+Each saved message gets a MinHash signature built from its subject shingles,
+X-headers and Received path. The signature is split into LSH bands which are
+stored in SQLite, so assigning a cluster to a new message costs a fixed number
+of primary key lookups no matter how many messages are already stored.
+"""
+
+import re
+import random
+import hashlib
+import sqlite3
+from array import array
+from typing import Dict, List, Any, Optional, Set
+
+import database_config
+
+# MinHash configuration. NUM_BANDS * ROWS_PER_BAND must equal NUM_PERMUTATIONS.
+# With 16 bands of 4 rows, pairs with a Jaccard similarity of about 0.5 or more
+# are likely to share at least one bucket.
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+
+# Minimum estimated Jaccard similarity between a message and a cluster's
+# representative for the message to join that cluster
+SIMILARITY_THRESHOLD = 0.6
+
+# Length of the character shingles taken from the normalized subject
+SUBJECT_SHINGLE_SIZE = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_DIGITS_RE = re.compile(r'\d+')
+_WHITESPACE_RE = re.compile(r'\s+')
+_REPLY_PREFIX_RE = re.compile(r'^(?:(?:re|fwd?|aw|tr)\s*:\s*)+', re.IGNORECASE)
+_RECEIVED_HOST_RE = re.compile(r'\b(from|by)\s+([^\s;()]+)', re.IGNORECASE)
+
+
+def _normalize(value: str) -> str:
+    """Lowercase a header value and mask the digits that vary between copies."""
+    value = _DIGITS_RE.sub('0', str(value).lower())
+    return _WHITESPACE_RE.sub(' ', value).strip()
+
+
+def _hash_token(token: str) -> int:
+    """Hash a feature token to a stable 64-bit integer."""
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class CampaignClusterer:
+    """MinHash signatures and LSH band keys for campaign clustering."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, num_bands: int = NUM_BANDS,
+                 threshold: float = SIMILARITY_THRESHOLD, seed: int = 1):
+        """Initialize the permutation coefficients used for the signatures."""
+        if num_permutations % num_bands:
+            raise ValueError("num_permutations must be a multiple of num_bands")
+        self.num_permutations = num_permutations
+        self.num_bands = num_bands
+        self.rows_per_band = num_permutations // num_bands
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self._coefficients = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+    def features(self, metadata: Dict[str, Any]) -> Set[str]:
+        """Build the feature set of a message from its extracted metadata."""
+        features = set()
+
+        # Subject shingles
+        subject = _REPLY_PREFIX_RE.sub('', _normalize(metadata.get('subject', '')))
+        if subject:
+            if len(subject) <= SUBJECT_SHINGLE_SIZE:
+                features.add(f"s:{subject}")
+            for i in range(len(subject) - SUBJECT_SHINGLE_SIZE + 1):
+                features.add(f"s:{subject[i:i + SUBJECT_SHINGLE_SIZE]}")
+
+        # X-headers, both by name and by normalized value
+        for name, value in (metadata.get('x_headers') or {}).items():
+            name = name.lower()
+            features.add(f"xn:{name}")
+            features.add(f"xv:{name}={_normalize(value)}")
+
+        # Received path, as the ordered list of from/by hosts
+        for hop, header in enumerate(metadata.get('received') or []):
+            for direction, host in _RECEIVED_HOST_RE.findall(str(header)):
+                features.add(f"r:{hop}:{direction.lower()}:{_normalize(host)}")
+
+        return features
+
+    def signature(self, metadata: Dict[str, Any]) -> List[int]:
+        """Compute the MinHash signature of a message, empty if it has no features."""
+        hashes = [_hash_token(token) for token in self.features(metadata)]
+        if not hashes:
+            return []
+
+        signature = []
+        for a, b in self._coefficients:
+            signature.append(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes))
+        return signature
+
+    def band_keys(self, signature: List[int]) -> List[int]:
+        """Split a signature into bands and hash each band to a signed 64-bit bucket key."""
+        keys = []
+        for band in range(self.num_bands):
+            start = band * self.rows_per_band
+            rows = array('I', signature[start:start + self.rows_per_band]).tobytes()
+            digest = hashlib.blake2b(rows, digest_size=8).digest()
+            keys.append(int.from_bytes(digest, 'big', signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(first: List[int], second: List[int]) -> float:
+        """Estimate the Jaccard similarity of two messages from their signatures."""
+        if not first or len(first) != len(second):
+            return 0.0
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+    def assign(self, cursor: sqlite3.Cursor, metadata_id: int, metadata: Dict[str, Any]) -> Optional[int]:
+        """Assign a cluster to a saved message and add it to the LSH index.
+
+        The message joins the most similar cluster found through its LSH
+        buckets, or starts a new cluster whose ID is its own metadata ID.
+        Messages without subject, X-headers or Received path have nothing to
+        compare and are not clustered; None is returned for them. A message
+        re-saved with other features is removed from its cluster and assigned
+        again.
+        """
+        signature = self.signature(metadata)
+        cursor.execute(
+            "SELECT cluster_id, signature FROM campaign_signatures WHERE metadata_id = ?",
+            (metadata_id,)
+        )
+        existing = cursor.fetchone()
+        if existing is not None:
+            if signature and _unpack_signature(existing[1]) == signature:
+                return existing[0]
+            # A re-saved message with other features leaves its cluster first,
+            # which renumbers the cluster if it was the representative
+            remove_messages(cursor, [metadata_id])
+        if not signature:
+            return None
+        keys = self.band_keys(signature)
+
+        # Candidate clusters sharing at least one band bucket
+        candidates = set()
+        for band, key in enumerate(keys):
+            cursor.execute(
+                "SELECT cluster_id FROM campaign_lsh_buckets WHERE band = ? AND bucket = ?",
+                (band, key)
+            )
+            row = cursor.fetchone()
+            if row:
+                candidates.add(row[0])
+
+        cluster_id = metadata_id
+        best_similarity = self.threshold
+        for candidate in sorted(candidates):
+            cursor.execute(
+                "SELECT signature FROM campaign_signatures WHERE metadata_id = ?",
+                (candidate,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                continue
+            similarity = self.similarity(signature, _unpack_signature(row[0]))
+            if similarity >= best_similarity:
+                cluster_id, best_similarity = candidate, similarity
+
+        cursor.execute(
+            """INSERT OR REPLACE INTO campaign_signatures
+               (metadata_id, cluster_id, signature) VALUES (?, ?, ?)""",
+            (metadata_id, cluster_id, _pack_signature(signature))
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO campaign_lsh_buckets (band, bucket, cluster_id) VALUES (?, ?, ?)",
+            [(band, key, cluster_id) for band, key in enumerate(keys)]
+        )
+        return cluster_id
+
+
+def _pack_signature(signature: List[int]) -> bytes:
+    """Serialize a signature for storage in a BLOB column."""
+    return array('I', signature).tobytes()
+
+
+def _unpack_signature(blob: bytes) -> List[int]:
+    """Deserialize a signature stored by _pack_signature()."""
+    signature = array('I')
+    signature.frombytes(blob)
+    return signature.tolist()
+
+
+# Shared clusterer so the permutation coefficients are only generated once
+_clusterer = CampaignClusterer()
+
+
+def create_cluster_tables(cursor: sqlite3.Cursor):
+    """
+    Create the tables backing the campaign clusters and the LSH index.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS campaign_signatures (
+        metadata_id INTEGER PRIMARY KEY,
+        cluster_id INTEGER NOT NULL,
+        signature BLOB NOT NULL,
+        FOREIGN KEY (metadata_id) REFERENCES email_metadata (id)
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_campaign_signatures_cluster "
+        "ON campaign_signatures (cluster_id)"
+    )
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS campaign_lsh_buckets (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        cluster_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_campaign_lsh_buckets_cluster "
+        "ON campaign_lsh_buckets (cluster_id)"
+    )
+
+
+def assign_cluster(metadata_id: int, metadata: Dict[str, Any]) -> Optional[int]:
+    """
+    Assign a campaign cluster to a saved email metadata record.
+
+    Args:
+        metadata_id (int): The ID of the email_metadata record
+        metadata (Dict[str, Any]): The extracted metadata of the message
+
+    Returns:
+        Optional[int]: The cluster ID, or None if the message has no features to cluster by or the operation failed
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cluster_id = add_message(cursor, metadata_id, metadata)
+        conn.commit()
+        return cluster_id
+    except Exception as e:
+        print(f"Error assigning campaign cluster: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def add_message(cursor: sqlite3.Cursor, metadata_id: int, metadata: Dict[str, Any]) -> Optional[int]:
+    """
+    Assign a campaign cluster to a saved record without committing.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata_id (int): The ID of the email_metadata record
+        metadata (Dict[str, Any]): The extracted metadata of the message
+
+    Returns:
+        Optional[int]: The cluster ID, or None if the message has no features to cluster by
+    """
+    return _clusterer.assign(cursor, metadata_id, metadata)
+
+
+def remove_messages(cursor: sqlite3.Cursor, metadata_ids: List[int]):
+    """
+    Remove deleted records from their clusters without committing.
+
+    A cluster whose representative is removed is renumbered to its oldest
+    remaining member, which becomes the representative new messages are
+    compared with, and its LSH buckets follow. The buckets of clusters with
+    no remaining member are deleted.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata_ids (List[int]): The IDs of the deleted email_metadata records
+    """
+    representatives = []
+    for start in range(0, len(metadata_ids), 500):
+        chunk = metadata_ids[start:start + 500]
+        cursor.execute(
+            f"""SELECT metadata_id FROM campaign_signatures
+                WHERE metadata_id IN ({','.join('?' * len(chunk))}) AND cluster_id = metadata_id""",
+            chunk
+        )
+        representatives.extend(row[0] for row in cursor.fetchall())
+
+    cursor.executemany(
+        "DELETE FROM campaign_signatures WHERE metadata_id = ?",
+        [(metadata_id,) for metadata_id in metadata_ids]
+    )
+
+    for cluster_id in representatives:
+        cursor.execute(
+            "SELECT MIN(metadata_id) FROM campaign_signatures WHERE cluster_id = ?",
+            (cluster_id,)
+        )
+        new_cluster_id = cursor.fetchone()[0]
+        if new_cluster_id is None:
+            cursor.execute("DELETE FROM campaign_lsh_buckets WHERE cluster_id = ?", (cluster_id,))
+        else:
+            cursor.execute(
+                "UPDATE campaign_signatures SET cluster_id = ? WHERE cluster_id = ?",
+                (new_cluster_id, cluster_id)
+            )
+            cursor.execute(
+                "UPDATE campaign_lsh_buckets SET cluster_id = ? WHERE cluster_id = ?",
+                (new_cluster_id, cluster_id)
+            )
+
+
+def get_cluster_id(metadata_id: int) -> Optional[int]:
+    """
+    Get the campaign cluster of an email metadata record.
+
+    Args:
+        metadata_id (int): The ID of the email_metadata record
+
+    Returns:
+        Optional[int]: The cluster ID, or None if the message has not been clustered
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT cluster_id FROM campaign_signatures WHERE metadata_id = ?",
+        (metadata_id,)
+    )
+
+    row = cursor.fetchone()
+    conn.close()
+
+    return row[0] if row else None
+
+
+def get_cluster_members(cluster_id: int) -> List[Dict[str, Any]]:
+    """
+    Get the messages belonging to a campaign cluster.
+
+    Args:
+        cluster_id (int): The cluster ID
+
+    Returns:
+        List[Dict[str, Any]]: The member email metadata records, without metadata_json
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT metadata_id FROM campaign_signatures WHERE cluster_id = ?",
+        (cluster_id,)
+    )
+
+    ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    # Messages are stored in the main database or their monthly partition
+    records = database_config.get_email_metadata_by_ids(
+        ids, ('message_id', 'sender', 'recipient', 'subject', 'date', 'processed_date')
+    )
+    return [records[metadata_id] for metadata_id in sorted(records)]
+
+
+def list_clusters(min_size: int = 2, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    List the largest campaign clusters.
+
+    Args:
+        min_size (int): Only return clusters with at least this many messages
+        limit (int): Maximum number of clusters to return
+
+    Returns:
+        List[Dict[str, Any]]: Clusters with their size and representative subject
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """SELECT cluster_id, COUNT(*) AS size
+           FROM campaign_signatures
+           GROUP BY cluster_id
+           HAVING COUNT(*) >= ?
+           ORDER BY size DESC, cluster_id
+           LIMIT ?""",
+        (min_size, limit)
+    )
+
+    clusters = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    # The cluster ID is the ID of its representative message
+    representatives = database_config.get_email_metadata_by_ids(
+        [cluster['cluster_id'] for cluster in clusters], ('subject', 'sender')
+    )
+    for cluster in clusters:
+        representative = representatives.get(cluster['cluster_id'], {})
+        cluster['subject'] = representative.get('subject')
+        cluster['sender'] = representative.get('sender')
+    return clusters
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Columnar Export for Email Metadata Extractor
+
+This module writes extracted metadata as a table with one row per message,
+for loading into dataframe tools without parsing the indented JSON of
+save_to_file() or metadata_json:
+
+  - Parquet (.parquet) or Arrow IPC (.arrow, .feather, .ipc) when the optional
+    pyarrow package is installed. List fields such as to_emails, domains,
+    ip_addresses and received become list<string> columns.
+  - CSV otherwise, or when asked for (.csv). List fields are written as JSON
+    arrays.
+
+Rows are buffered and written one row group (or record batch) at a time, so
+memory stays bounded by the row group size however many messages are
+exported. Metadata can come from the bulk CLI (see mbox_reader.py --export)
+or from the database (see main()).
+"""
+
+import os
+import csv
+import json
+import argparse
+from typing import Dict, List, Any, Iterable, Optional
+
+import database_config
+import date_parsing
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows buffered before a row group is written
+ROW_GROUP_SIZE = 10000
+
+# Output formats by file extension
+FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow', '.csv': 'csv'}
+
+# (column, type, metadata field); types are 'string', 'int' and 'list'
+COLUMNS = (
+    ('id', 'int', 'database_id'),
+    ('message_id', 'string', 'message_id'),
+    ('date', 'string', 'date'),
+    ('date_epoch', 'int', 'date_epoch'),
+    ('from', 'string', 'from'),
+    ('from_email', 'string', 'from_email'),
+    ('to', 'string', 'to'),
+    ('to_emails', 'list', 'to_emails'),
+    ('cc_emails', 'list', 'cc_emails'),
+    ('bcc_emails', 'list', 'bcc_emails'),
+    ('subject', 'string', 'subject'),
+    ('in_reply_to', 'string', 'in_reply_to'),
+    ('return_path', 'string', 'return_path'),
+    ('user_agent', 'string', 'user_agent'),
+    ('content_type', 'string', 'content_type'),
+    ('received', 'list', 'received'),
+    ('ip_addresses', 'list', 'ip_addresses'),
+    ('domains', 'list', 'domains'),
+    ('spf', 'string', 'spf'),
+    ('authentication_results', 'string', 'authentication_results'),
+    ('campaign_cluster_id', 'int', 'campaign_cluster_id'),
+    ('truncated', 'list', 'truncated'),
+    ('attachment_filenames', 'list', None),
+    ('attachment_sha256', 'list', None),
+)
+
+
+def metadata_row(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert extracted metadata to a row of COLUMNS.
+
+    Args:
+        metadata: Metadata dict as returned by extract_metadata() or stored in metadata_json
+
+    Returns:
+        Dict[str, Any]: Column values; strings, ints, lists of strings or None
+    """
+    row = {}
+    for column, kind, field in COLUMNS:
+        if field is None:
+            continue
+        value = metadata.get(field)
+        if kind == 'list':
+            row[column] = [str(item) for item in value] if value else []
+        elif kind == 'int':
+            row[column] = int(value) if value is not None and value != '' else None
+        else:
+            # Header values may be email.headerregistry objects
+            row[column] = str(value) if value is not None else None
+
+    attachments = metadata.get('attachments') or []
+    row['attachment_filenames'] = [a.get('filename') or '' for a in attachments]
+    row['attachment_sha256'] = [a.get('sha256') or '' for a in attachments]
+    return row
+
+
+def _arrow_schema():
+    types = {'string': pyarrow.string(), 'int': pyarrow.int64(), 'list': pyarrow.list_(pyarrow.string())}
+    return pyarrow.schema([(column, types[kind]) for column, kind, _ in COLUMNS])
+
+
+class ColumnarWriter:
+    """Write metadata rows to a Parquet, Arrow IPC or CSV file in row groups."""
+
+    def __init__(self, path: str, format: str = None, row_group_size: int = ROW_GROUP_SIZE):
+        """Open the output file.
+
+        Args:
+            path: Output file; the extension picks the format unless format is given
+            format: 'parquet', 'arrow' or 'csv'
+            row_group_size: Rows buffered before a row group is written
+        """
+        format = format or FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+        if format not in ('parquet', 'arrow', 'csv'):
+            raise ValueError(f"Unknown export format: {format}")
+        if format != 'csv' and pyarrow is None:
+            # Fall back to CSV next to the requested file
+            path = os.path.splitext(path)[0] + '.csv'
+            print(f"Warning: pyarrow is not installed, writing CSV to {path}")
+            format = 'csv'
+
+        self.path = path
+        self.format = format
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._columns = {column: [] for column, _, _ in COLUMNS}
+        self._buffered = 0
+
+        if format == 'csv':
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow([column for column, _, _ in COLUMNS])
+        else:
+            self._schema = _arrow_schema()
+            if format == 'parquet':
+                self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression='zstd')
+            else:
+                self._writer = pyarrow.ipc.new_file(path, self._schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, metadata: Dict[str, Any]):
+        """Add the metadata of one message."""
+        row = metadata_row(metadata)
+        for column, _, _ in COLUMNS:
+            self._columns[column].append(row[column])
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self.flush()
+
+    def write_many(self, metadata_list: Iterable[Dict[str, Any]]) -> int:
+        """Add the metadata of many messages; returns the number added."""
+        count = 0
+        for metadata in metadata_list:
+            self.write(metadata)
+            count += 1
+        return count
+
+    def flush(self):
+        """Write the buffered rows as one row group."""
+        if not self._buffered:
+            return
+        if self.format == 'csv':
+            kinds = [kind for _, kind, _ in COLUMNS]
+            columns = [self._columns[column] for column, _, _ in COLUMNS]
+            for values in zip(*columns):
+                self._csv.writerow([
+                    json.dumps(value, ensure_ascii=False) if kind == 'list'
+                    else ('' if value is None else value)
+                    for kind, value in zip(kinds, values)
+                ])
+        elif self.format == 'parquet':
+            self._writer.write_table(pyarrow.table(self._columns, schema=self._schema),
+                                     row_group_size=self._buffered)
+        else:
+            self._writer.write_batch(pyarrow.record_batch(self._columns, schema=self._schema))
+
+        self.rows_written += self._buffered
+        self._buffered = 0
+        for values in self._columns.values():
+            values.clear()
+
+    def close(self):
+        """Write the remaining rows and close the file."""
+        self.flush()
+        if self.format == 'csv':
+            self._file.close()
+        else:
+            self._writer.close()
+
+
+def export_database(path: str, start: Optional[int] = None, end: Optional[int] = None,
+                    format: str = None, row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Export the stored metadata of the messages in a date range.
+
+    Messages of archived partitions are not read. Rows left in the main
+    database by the older layout, whose body was archived with its partition
+    file, are skipped since only their row columns are left; the number
+    skipped is printed.
+
+    Args:
+        path: Output file
+        start: Only include emails dated at or after this UTC epoch time
+        end: Only include emails dated before this UTC epoch time
+        format: 'parquet', 'arrow' or 'csv', defaults to the extension of path
+        row_group_size: Rows per row group; also the database fetch size
+
+    Returns:
+        int: The number of messages exported
+    """
+    skipped = 0
+    with ColumnarWriter(path, format, row_group_size) as writer:
+        for record in database_config.iter_email_metadata(start, end, batch_size=row_group_size):
+            if record.get('metadata_json') is None:
+                skipped += 1
+                continue
+            try:
+                metadata = json.loads(record['metadata_json'])
+            except ValueError:
+                metadata = {}
+            # Columns stored on the row win over the body
+            metadata.update({
+                'database_id': record['id'],
+                'message_id': record['message_id'],
+                'subject': record['subject'],
+                'date': record['date'],
+                'date_epoch': record['date_epoch'],
+            })
+            metadata.setdefault('from', record['sender'])
+            metadata.setdefault('to', record['recipient'])
+            writer.write(metadata)
+    if skipped:
+        print(f"Warning: skipped {skipped} messages whose metadata body was archived or dropped")
+    return writer.rows_written
+
+
+def main():
+    """Main function to export stored metadata from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor - columnar export')
+    parser.add_argument('output', help='Output file (.parquet, .arrow or .csv)')
+    parser.add_argument('--format', '-f', choices=('parquet', 'arrow', 'csv'), help='Output format (default: from the extension)')
+    parser.add_argument('--start', help='Only export emails dated at or after this time (epoch seconds or ISO 8601)')
+    parser.add_argument('--end', help='Only export emails dated before this time (epoch seconds or ISO 8601)')
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help='Rows per row group')
+
+    args = parser.parse_args()
+
+    try:
+        start = date_parsing.parse_time_bound(args.start)
+        end = date_parsing.parse_time_bound(args.end)
+    except ValueError:
+        print("Error: invalid start or end date")
+        return
+
+    count = export_database(args.output, start, end, args.format, args.row_group_size)
+    print(f"Exported {count} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,18 +9,69 @@ It handles database initialization, connection, and operations for email metadat
 """
 
 import os
+import re
+import heapq
+import time
+import shutil
 import sqlite3
-from typing import Dict, List, Any, Optional, Tuple
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Iterable, Set
+
+from date_parsing import parse_date_header
+
+# Columns of email_metadata that can be searched by partial match
+SEARCH_TYPES = ('sender', 'recipient', 'subject', 'message_id')
+
+# Database files known to have the full-text search index
+_search_index_available = {}
 
 # Database configuration
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_metadata.db')
 
+# Directory of the monthly partition files, or None to keep every message in
+# the main database. Each file (email_metadata_YYYY_MM.db) holds the
+# email_metadata rows of the messages dated in that month (UTC), with their
+# indexes and search index, and is attached to read or write them. Undated
+# messages stay in the main database, which keeps the message_partitions
+# directory (allocating the IDs the other tables reference) and the verdict,
+# attachment, cluster and rollup tables. Dropping a month deletes its file.
+# Once messages have been partitioned the directory must stay configured.
+PARTITION_DIR = os.environ.get('EMAIL_METADATA_PARTITION_DIR') or None
+
+# Partitions attached to one connection at a time (SQLite allows 10 attached
+# databases in its default build)
+MAX_ATTACHED_PARTITIONS = 8
+
+# Columns of the email_metadata table, in the main database and the partitions
+METADATA_COLUMNS = ('id', 'message_id', 'sender', 'recipient', 'subject', 'date', 'date_epoch',
+                    'metadata_json', 'processed_date', 'body_partition')
+
+# Tables whose rows are deleted with the messages of a dropped partition.
+# Campaign signatures are removed by campaign_clustering.remove_messages(),
+# and volume_rollup_messages is kept so rebuilt rollups still count them.
+PARTITION_DEPENDENT_TABLES = ('auth_verdicts', 'attachments')
+
+_PARTITION_RE = re.compile(r'^(\d{4})_(\d{2})$')
+_PARTITION_FILE_RE = re.compile(r'^email_metadata_(\d{4}_\d{2})\.db$')
+
+# Seconds a connection waits for another process's write lock before failing
+# with "database is locked"
+BUSY_TIMEOUT = 30
+
 def get_db_connection():
     """
     Create and return a connection to the SQLite database.
+    
+    The database runs in WAL mode (set by initialize_database), so readers in
+    other processes are never blocked by a writer, and writers queue on the
+    busy timeout instead of failing immediately.
     """
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT, uri=True)
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    # WAL is durable across power loss with NORMAL except for the last commits
+    conn.execute("PRAGMA synchronous = NORMAL")
     return conn
 
 def initialize_database():
@@ -30,6 +81,10 @@ def initialize_database():
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Write-ahead logging lets several server workers read while one writes.
+    # The mode is stored in the database file, so this only needs to run once.
+    cursor.execute("PRAGMA journal_mode = WAL")
+    
     # Create domains table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS domains (
@@ -63,14 +118,63 @@ def initialize_database():
         recipient TEXT,
         subject TEXT,
         date TEXT,
+        date_epoch INTEGER,
         metadata_json TEXT,
-        processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        body_partition TEXT
     )
     ''')
     
-    # Create some sample data if tables are empty
-    cursor.execute("SELECT COUNT(*) FROM domains")
-    if cursor.fetchone()[0] == 0:
+    # Directory of the stored messages: allocates their IDs and records the
+    # partition holding each one (NULL for the main database)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS message_partitions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id TEXT UNIQUE,
+        partition_name TEXT
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_partitions_partition ON message_partitions (partition_name)"
+    )
+    
+    # Bring older databases up to date (date_epoch column, indexes, search index)
+    import schema_migrations
+    schema_migrations.apply_migrations(cursor)
+    schema_migrations.create_search_index(cursor)
+    
+    # Create campaign clustering tables (MinHash signatures and LSH buckets)
+    import campaign_clustering
+    campaign_clustering.create_cluster_tables(cursor)
+    
+    # Create per-hour and per-day volume rollup tables
+    import volume_rollups
+    volume_rollups.create_rollup_tables(cursor)
+    
+    # Create the top-K sketches shared by the server workers
+    import streaming_analytics
+    streaming_analytics.create_sketch_tables(cursor)
+    
+    # Create the DKIM/SPF/DMARC verdict table
+    import auth_results
+    auth_results.create_verdict_tables(cursor)
+    
+    # Create the checkpoint tables of the incremental directory watcher
+    import maildir_watcher
+    maildir_watcher.create_watcher_tables(cursor)
+    
+    # Create the attachment inventory table
+    import attachment_inventory
+    attachment_inventory.create_attachment_tables(cursor)
+    
+    # Create the write generation counter used for ETags and response caching
+    import response_cache
+    response_cache.create_generation_tables(cursor)
+    
+    # Create some sample data if tables are empty (MAX(id) reads one index
+    # entry where COUNT(*) would scan the table)
+    cursor.execute("SELECT MAX(id) FROM domains")
+    if cursor.fetchone()[0] is None:
         # Insert sample domains
         sample_domains = [
             ('gmail.com', 'Google LLC', '1995-08-13', '2030-01-01'),
@@ -106,10 +210,61 @@ def initialize_database():
     conn.commit()
     conn.close()
     
+    # Move messages saved before partitioning was enabled
+    if PARTITION_DIR:
+        partition_existing_rows()
+    
     print(f"Database initialized at {DATABASE_PATH}")
 
+def migrate_date_epoch(cursor: sqlite3.Cursor, batch_size: int = 1000) -> int:
+    """
+    Add and backfill the indexed date_epoch column of email_metadata.
+    
+    Runs once per database as schema migration 1, whose schema_version row
+    marks every existing row as attempted: rows whose Date header cannot be
+    parsed keep a NULL date_epoch and are not parsed again by later
+    initialize_database() calls. Rows saved afterwards are parsed on insert.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        batch_size (int): Number of rows parsed per UPDATE batch
+    
+    Returns:
+        int: The number of rows backfilled
+    """
+    cursor.execute("PRAGMA table_info(email_metadata)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'date_epoch' not in columns:
+        cursor.execute("ALTER TABLE email_metadata ADD COLUMN date_epoch INTEGER")
+    
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_email_metadata_date_epoch ON email_metadata (date_epoch)"
+    )
+    
+    # Backfill rows whose Date header has not been parsed yet, in id order
+    backfilled = 0
+    last_id = 0
+    while True:
+        cursor.execute(
+            """SELECT id, date FROM email_metadata
+               WHERE date_epoch IS NULL AND date != '' AND id > ?
+               ORDER BY id LIMIT ?""",
+            (last_id, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = [(parse_date_header(date), row_id) for row_id, date in rows]
+        updates = [update for update in updates if update[0] is not None]
+        cursor.executemany("UPDATE email_metadata SET date_epoch = ? WHERE id = ?", updates)
+        backfilled += len(updates)
+    
+    return backfilled
+
 def save_email_metadata(message_id: str, sender: str, recipient: str, 
-                      subject: str, date: str, metadata_json: str) -> Optional[int]:
+                      subject: str, date: str, metadata_json: str,
+                      date_epoch: Optional[int] = None) -> Optional[int]:
     """
     Save extracted email metadata to the database.
     
@@ -120,6 +275,7 @@ def save_email_metadata(message_id: str, sender: str, recipient: str,
         subject (str): The email subject
         date (str): The email date
         metadata_json (str): The full metadata as JSON string
+        date_epoch (Optional[int]): The email date in UTC epoch seconds, parsed from date if omitted
     
     Returns:
         Optional[int]: The ID of the newly added metadata record, or None if the operation failed
@@ -128,36 +284,646 @@ def save_email_metadata(message_id: str, sender: str, recipient: str,
     cursor = conn.cursor()
     
     try:
-        cursor.execute(
-            """INSERT INTO email_metadata 
-               (message_id, sender, recipient, subject, date, metadata_json) 
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (message_id, sender, recipient, subject, date, metadata_json)
+        if date_epoch is None:
+            date_epoch = parse_date_header(str(date or ''))
+        attach_partitions(cursor, partition_batches(cursor, [(message_id, date_epoch)])[0][1])
+        
+        metadata_id = insert_email_metadata(
+            cursor, message_id, sender, recipient, subject, date, metadata_json, date_epoch
         )
         conn.commit()
-        metadata_id = cursor.lastrowid
         return metadata_id
-    except sqlite3.IntegrityError:
-        # Metadata for this message_id already exists, update it
+    except Exception as e:
+        print(f"Error saving email metadata: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def insert_email_metadata(cursor: sqlite3.Cursor, message_id: str, sender: str, recipient: str,
+                          subject: str, date: str, metadata_json: str,
+                          date_epoch: Optional[int] = None) -> Optional[int]:
+    """
+    Insert or update an email metadata record without committing.
+    
+    Used by save_email_metadata() and by batched saves that write many
+    messages in one transaction. With PARTITION_DIR set, the record goes to
+    the partition of the message's month (the main database if it has no
+    date), which must have been attached with attach_partitions() before the
+    transaction started, like the partition the message moves out of when its
+    Date header changed month.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        message_id (str): The email message ID
+        sender (str): The email sender
+        recipient (str): The email recipient
+        subject (str): The email subject
+        date (str): The email date
+        metadata_json (str): The full metadata as JSON string
+        date_epoch (Optional[int]): The email date in UTC epoch seconds, parsed from date if omitted
+    
+    Returns:
+        Optional[int]: The ID of the inserted or updated metadata record
+    
+    Raises:
+        ValueError: If the message is dated in, or stored in, an archived partition
+    """
+    if date_epoch is None:
+        date_epoch = parse_date_header(str(date or ''))
+    
+    if not PARTITION_DIR:
+        try:
+            cursor.execute(
+                """INSERT INTO email_metadata 
+                   (message_id, sender, recipient, subject, date, date_epoch, metadata_json) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (message_id, sender, recipient, subject, date, date_epoch, metadata_json)
+            )
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Metadata for this message_id already exists, update it
+            cursor.execute(
+                """UPDATE email_metadata 
+                   SET sender=?, recipient=?, subject=?, date=?, date_epoch=?, metadata_json=?, 
+                       processed_date=CURRENT_TIMESTAMP 
+                   WHERE message_id=?""",
+                (sender, recipient, subject, date, date_epoch, metadata_json, message_id)
+            )
+            cursor.execute("SELECT id FROM email_metadata WHERE message_id = ?", (message_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    partition = partition_for(date_epoch)
+    cursor.execute("SELECT id, partition_name FROM message_partitions WHERE message_id = ?", (message_id,))
+    row = cursor.fetchone()
+    old_partition = row[1] if row else None
+    
+    # attach_partitions() creates missing partition files except for archived
+    # months, whose file would otherwise be replaced by a new one of the same name
+    for checked in {partition, old_partition} - {None}:
+        if not os.path.exists(partition_path(checked)):
+            raise ValueError(f"Partition {checked} is archived; move its file back to save messages of that month")
+    
+    table = _metadata_table(partition)
+    if row is None:
+        cursor.execute(
+            "INSERT INTO message_partitions (message_id, partition_name) VALUES (?, ?)",
+            (message_id, partition)
+        )
+        metadata_id = cursor.lastrowid
+    else:
+        metadata_id = row[0]
+        if old_partition == partition:
+            cursor.execute(
+                f"""UPDATE {table} 
+                    SET sender=?, recipient=?, subject=?, date=?, date_epoch=?, metadata_json=?, 
+                        processed_date=CURRENT_TIMESTAMP 
+                    WHERE id=?""",
+                (sender, recipient, subject, date, date_epoch, metadata_json, metadata_id)
+            )
+        else:
+            # The new Date header moved the message to another month
+            cursor.execute(f"DELETE FROM {_metadata_table(old_partition)} WHERE id = ?", (metadata_id,))
+            cursor.execute(
+                "UPDATE message_partitions SET partition_name = ? WHERE id = ?",
+                (partition, metadata_id)
+            )
+    
+    if row is None or old_partition != partition or not cursor.rowcount:
+        cursor.execute(
+            f"""INSERT INTO {table} 
+                (id, message_id, sender, recipient, subject, date, date_epoch, metadata_json, body_partition) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (metadata_id, message_id, sender, recipient, subject, date, date_epoch, metadata_json, partition)
+        )
+    
+    # The write generation triggers only see the tables of the main database
+    if partition or old_partition:
+        import response_cache
+        response_cache.bump_write_generation(cursor)
+    return metadata_id
+
+
+def partition_for(date_epoch: Optional[int]) -> Optional[str]:
+    """
+    Get the partition (YYYY_MM, in UTC) storing a message.
+    
+    Args:
+        date_epoch (Optional[int]): The email date in UTC epoch seconds
+        
+    Returns:
+        Optional[str]: The partition name, or None if the message is kept in the main database
+    """
+    if not PARTITION_DIR or date_epoch is None:
+        return None
+    return time.strftime('%Y_%m', time.gmtime(date_epoch))
+
+
+def partition_path(partition: str) -> str:
+    """Get the file of a partition."""
+    if not _PARTITION_RE.match(partition or ''):
+        raise ValueError(f"Invalid partition: {partition}")
+    return os.path.join(PARTITION_DIR, f'email_metadata_{partition}.db')
+
+
+def _partition_schema(partition: str) -> str:
+    """Get the schema name a partition is attached under."""
+    if not _PARTITION_RE.match(partition or ''):
+        raise ValueError(f"Invalid partition: {partition}")
+    return f'p_{partition}'
+
+
+def _metadata_table(partition: Optional[str]) -> str:
+    """Get the email_metadata table of a partition, or of the main database for None."""
+    return f'{_partition_schema(partition)}.email_metadata' if partition else 'email_metadata'
+
+
+def create_partition_tables(cursor: sqlite3.Cursor, schema: str):
+    """
+    Create the email_metadata table, its indexes and its search index in an attached partition.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        schema (str): The schema the partition is attached under
+    """
+    # IDs come from the message_partitions directory of the main database
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {schema}.email_metadata (
+        id INTEGER PRIMARY KEY,
+        message_id TEXT UNIQUE,
+        sender TEXT,
+        recipient TEXT,
+        subject TEXT,
+        date TEXT,
+        date_epoch INTEGER,
+        metadata_json TEXT,
+        processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        body_partition TEXT
+    )
+    ''')
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS {schema}.idx_email_metadata_date_epoch ON email_metadata (date_epoch)"
+    )
+    
+    # Partitions get the full-text index when the main database has one
+    if _has_search_index(cursor):
+        import schema_migrations
+        schema_migrations.create_search_index(cursor, schema)
+
+
+def attach_partitions(cursor: sqlite3.Cursor, partitions: Iterable[str]):
+    """
+    Attach partition files to a connection for writing, creating them as needed.
+    
+    SQLite cannot attach databases inside a transaction, so this must be
+    called before the writes that use the partitions. Archived partitions
+    (whose messages are in the directory but whose file is gone) are not
+    attached, so saving into them fails instead of starting a new file.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        partitions (Iterable[str]): Partition names (YYYY_MM)
+    """
+    partitions = set(partitions)
+    if not partitions:
+        return
+    cursor.execute("PRAGMA database_list")
+    attached = {row[1] for row in cursor.fetchall()}
+    for partition in sorted(partitions):
+        schema = _partition_schema(partition)
+        if schema in attached:
+            continue
+        path = partition_path(partition)
+        if not os.path.exists(path) and is_archived(cursor, partition):
+            continue
+        os.makedirs(PARTITION_DIR, exist_ok=True)
+        cursor.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        cursor.execute(f"PRAGMA {schema}.journal_mode = WAL")
+        create_partition_tables(cursor, schema)
+        # Building the search index opened a transaction
+        cursor.connection.commit()
+
+
+def _attach_for_reading(cursor: sqlite3.Cursor, partitions: Iterable[str]) -> List[str]:
+    """Attach existing partition files read-only; returns their schemas, skipping files that are gone."""
+    schemas = []
+    for partition in partitions:
+        schema = _partition_schema(partition)
+        uri = f"file:{urllib.parse.quote(os.path.abspath(partition_path(partition)))}?mode=ro"
+        try:
+            cursor.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+        except sqlite3.OperationalError:
+            # Archived or dropped since it was listed
+            continue
+        schemas.append(schema)
+    return schemas
+
+
+def detach_partitions(cursor: sqlite3.Cursor):
+    """Detach every partition attached to a connection (outside a transaction)."""
+    cursor.execute("PRAGMA database_list")
+    for schema in [row[1] for row in cursor.fetchall() if row[1].startswith('p_')]:
+        cursor.execute(f"DETACH DATABASE {schema}")
+
+
+def _attached_groups(cursor: sqlite3.Cursor, partitions: List[str], main: bool = True) -> Iterator[List[str]]:
+    """
+    Yield the schemas to read email_metadata from: the main database (unless
+    main is False), then the partitions attached read-only
+    MAX_ATTACHED_PARTITIONS at a time.
+    
+    A group is detached when the next one is requested, so its rows must have
+    been fetched by then.
+    """
+    if main:
+        yield ['main']
+    for start in range(0, len(partitions), MAX_ATTACHED_PARTITIONS):
+        detach_partitions(cursor)
+        yield _attach_for_reading(cursor, partitions[start:start + MAX_ATTACHED_PARTITIONS])
+
+
+def is_archived(cursor: sqlite3.Cursor, partition: str) -> bool:
+    """
+    Check whether a partition is archived: its messages are in the directory but its file is gone.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        partition (str): The partition name (YYYY_MM)
+        
+    Returns:
+        bool: True if the partition is archived
+    """
+    if os.path.exists(partition_path(partition)):
+        return False
+    cursor.execute("SELECT 1 FROM message_partitions WHERE partition_name = ? LIMIT 1", (partition,))
+    return cursor.fetchone() is not None
+
+
+def partition_batches(cursor: sqlite3.Cursor,
+                      messages: List[Tuple[str, Optional[int]]]) -> List[Tuple[List[int], Set[str]]]:
+    """
+    Group messages to save into batches that each need at most MAX_ATTACHED_PARTITIONS partitions.
+    
+    A message needs the partition of its date and, when it is already stored
+    in another month, that partition too so its old record can be removed.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        messages (List[Tuple[str, Optional[int]]]): (message_id, date_epoch) of each message
+        
+    Returns:
+        List[Tuple[List[int], Set[str]]]: Indexes into messages and the partitions each batch needs
+    """
+    if not PARTITION_DIR:
+        return [(list(range(len(messages))), set())]
+    
+    stored = {}
+    message_ids = [message_id for message_id, _ in messages if message_id]
+    for start in range(0, len(message_ids), 500):
+        chunk = message_ids[start:start + 500]
+        cursor.execute(
+            f"""SELECT message_id, partition_name FROM message_partitions
+                WHERE message_id IN ({','.join('?' * len(chunk))}) AND partition_name IS NOT NULL""",
+            chunk
+        )
+        stored.update((row[0], row[1]) for row in cursor.fetchall())
+    
+    batches = [([], set())]
+    for index, (message_id, date_epoch) in enumerate(messages):
+        partition = partition_for(date_epoch)
+        old_partition = stored.get(message_id)
+        needed = {partition} if partition else set()
+        if old_partition and old_partition != partition:
+            needed.add(old_partition)
+        indexes, partitions = batches[-1]
+        if indexes and len(partitions | needed) > MAX_ATTACHED_PARTITIONS:
+            batches.append(([], set()))
+            indexes, partitions = batches[-1]
+        indexes.append(index)
+        partitions |= needed
+    return batches
+
+
+def overlapping_partitions(start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+    """
+    Get the partition files holding messages that may be dated in a range, oldest first.
+    
+    Args:
+        start (Optional[int]): Inclusive lower bound in UTC epoch seconds
+        end (Optional[int]): Exclusive upper bound in UTC epoch seconds
+        
+    Returns:
+        List[str]: Partition names (YYYY_MM)
+    """
+    if not PARTITION_DIR:
+        return []
+    first = partition_for(start) if start is not None else None
+    last = partition_for(end - 1) if end is not None else None
+    return [info['partition'] for info in list_partitions()
+            if (first is None or info['partition'] >= first) and (last is None or info['partition'] <= last)]
+
+
+def get_email_metadata_by_ids(ids: Iterable[int],
+                              columns: Iterable[str] = METADATA_COLUMNS) -> Dict[int, Dict[str, Any]]:
+    """
+    Get email metadata records by ID from the main database and the partitions holding them.
+    
+    Used by the tables that reference messages by ID (verdicts, attachments,
+    campaign clusters) in place of a join. Records of archived partitions are
+    missing from the result.
+    
+    Args:
+        ids (Iterable[int]): The IDs of the email_metadata records
+        columns (Iterable[str]): Columns to return, from METADATA_COLUMNS
+        
+    Returns:
+        Dict[int, Dict[str, Any]]: The records by ID
+    """
+    ids = sorted(set(ids))
+    selected = ', '.join(dict.fromkeys(['id', *columns]))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        by_partition = defaultdict(list)
+        if PARTITION_DIR:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(
+                    f"""SELECT id, partition_name FROM message_partitions
+                        WHERE id IN ({','.join('?' * len(chunk))}) AND partition_name IS NOT NULL""",
+                    chunk
+                )
+                for row_id, partition in cursor.fetchall():
+                    by_partition[partition].append(row_id)
+        by_partition[None] = sorted(set(ids) - {row_id for row_ids in by_partition.values() for row_id in row_ids})
+        
+        records = {}
+        partitions = sorted(partition for partition in by_partition if partition)
+        for schemas in _attached_groups(cursor, partitions):
+            for schema in schemas:
+                partition = None if schema == 'main' else schema[2:]
+                row_ids = by_partition[partition]
+                for start in range(0, len(row_ids), 500):
+                    chunk = row_ids[start:start + 500]
+                    cursor.execute(
+                        f"SELECT {selected} FROM {_metadata_table(partition)} WHERE id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    )
+                    records.update((row['id'], dict(row)) for row in cursor.fetchall())
+        return records
+    finally:
+        conn.close()
+
+
+def partition_existing_rows(batch_size: int = 1000) -> int:
+    """
+    Move the dated messages of the main database into their monthly partitions.
+    
+    initialize_database() runs this when PARTITION_DIR is set, so messages
+    saved before partitioning was enabled are moved on the next start, with
+    the bodies older versions kept in a metadata_bodies table of the
+    partition. Every message of the main database is also entered in the
+    message_partitions directory, so new IDs do not collide with theirs.
+    Messages whose month is archived stay in the main database.
+    
+    Args:
+        batch_size (int): Number of messages read per batch
+        
+    Returns:
+        int: The number of messages moved
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    moved = 0
+    columns = ', '.join(METADATA_COLUMNS[:-1])
+    
+    try:
         cursor.execute(
-            """UPDATE email_metadata 
-               SET sender=?, recipient=?, subject=?, date=?, metadata_json=?, 
-                   processed_date=CURRENT_TIMESTAMP 
-               WHERE message_id=?""",
-            (sender, recipient, subject, date, metadata_json, message_id)
+            "INSERT OR IGNORE INTO message_partitions (id, message_id) SELECT id, message_id FROM email_metadata"
         )
         conn.commit()
-        cursor.execute("SELECT id FROM email_metadata WHERE message_id = ?", (message_id,))
-        row = cursor.fetchone()
-        return row[0] if row else None
+        
+        last_id = 0
+        while True:
+            cursor.execute(
+                """SELECT id, date_epoch, body_partition FROM email_metadata
+                   WHERE date_epoch IS NOT NULL AND id > ? ORDER BY id LIMIT ?""",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            
+            by_partition = defaultdict(list)
+            for row_id, date_epoch, body_partition in rows:
+                # The body is in a partition file that has been archived
+                if body_partition and not os.path.exists(partition_path(body_partition)):
+                    continue
+                by_partition[partition_for(date_epoch)].append(row_id)
+            
+            partitions = sorted(by_partition)
+            for start in range(0, len(partitions), MAX_ATTACHED_PARTITIONS):
+                group = partitions[start:start + MAX_ATTACHED_PARTITIONS]
+                detach_partitions(cursor)
+                attach_partitions(cursor, group)
+                cursor.execute("PRAGMA database_list")
+                attached = {row[1] for row in cursor.fetchall()}
+                
+                cursor.execute("BEGIN IMMEDIATE")
+                for partition in group:
+                    schema = _partition_schema(partition)
+                    if schema not in attached:
+                        # Archived month
+                        continue
+                    cursor.execute(
+                        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'metadata_bodies'"
+                    )
+                    legacy_bodies = cursor.fetchone() is not None
+                    body = (f"COALESCE(em.metadata_json, (SELECT b.metadata_json FROM {schema}.metadata_bodies b"
+                            f" WHERE b.id = em.id))" if legacy_bodies else 'em.metadata_json')
+                    row_ids = by_partition[partition]
+                    placeholders = ','.join('?' * len(row_ids))
+                    cursor.execute(
+                        f"""INSERT INTO {schema}.email_metadata ({columns}, body_partition)
+                            SELECT {columns.replace('metadata_json', body)}, ?
+                            FROM email_metadata em WHERE em.id IN ({placeholders})""",
+                        (partition, *row_ids)
+                    )
+                    cursor.execute(f"DELETE FROM email_metadata WHERE id IN ({placeholders})", row_ids)
+                    cursor.execute(
+                        f"UPDATE message_partitions SET partition_name = ? WHERE id IN ({placeholders})",
+                        (partition, *row_ids)
+                    )
+                    moved += len(row_ids)
+                    
+                    cursor.execute("SELECT 1 FROM email_metadata WHERE body_partition = ? LIMIT 1", (partition,))
+                    if legacy_bodies and cursor.fetchone() is None:
+                        cursor.execute(f"DROP TABLE {schema}.metadata_bodies")
+                conn.commit()
+        
+        detach_partitions(cursor)
+        return moved
     except Exception as e:
-        print(f"Error saving email metadata: {e}")
+        print(f"Error moving messages into partitions: {e}")
         conn.rollback()
-        return None
+        return moved
+    finally:
+        conn.close()
+
+
+def list_partitions() -> List[Dict[str, Any]]:
+    """
+    List the partition files, oldest first.
+    
+    Returns:
+        List[Dict[str, Any]]: Partition name, path and size in bytes of each file
+    """
+    if not PARTITION_DIR or not os.path.isdir(PARTITION_DIR):
+        return []
+    partitions = []
+    for name in sorted(os.listdir(PARTITION_DIR)):
+        match = _PARTITION_FILE_RE.match(name)
+        if match:
+            path = os.path.join(PARTITION_DIR, name)
+            partitions.append({'partition': match.group(1), 'path': path, 'size': os.path.getsize(path)})
+    return partitions
+
+
+def _close_partition_file(path: str):
+    """Checkpoint a partition's write-ahead log into the file so it can be moved alone."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+
+
+def archive_partition(partition: str, archive_dir: str) -> bool:
+    """
+    Move a partition file to an archive directory.
+    
+    The messages of the partition leave searches and exports with the file;
+    their entries in the message directory and their verdicts, attachments,
+    clusters and rollups stay, so moving the file back into PARTITION_DIR
+    restores them. Until then saving a message of that month fails.
+    
+    Args:
+        partition (str): The partition name (YYYY_MM)
+        archive_dir (str): Directory to move the file to
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        path = partition_path(partition)
+        _close_partition_file(path)
+        os.makedirs(archive_dir, exist_ok=True)
+        shutil.move(path, os.path.join(archive_dir, os.path.basename(path)))
+        
+        # No table of the main database changes, but cached responses list the archived messages
+        conn = get_db_connection()
+        try:
+            import response_cache
+            response_cache.bump_write_generation(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+        return True
+    except Exception as e:
+        print(f"Error archiving partition {partition}: {e}")
+        return False
+
+
+def drop_partition(partition: str) -> bool:
+    """
+    Delete a partition file together with the rows referencing its messages.
+    
+    The messages go with the file; in the main database their directory
+    entries, verdicts and attachments are deleted. Volume rollups keep
+    counting the dropped messages, also when they are rebuilt. Campaign
+    clusters whose representative is dropped continue with their oldest
+    remaining member.
+    
+    Args:
+        partition (str): The partition name (YYYY_MM)
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    path = partition_path(partition)
+    # Set aside first, so the month reads as archived (and refuses new
+    # messages) until the directory entries are gone
+    dropped_path = f"{path}.dropped"
+    
+    try:
+        if os.path.exists(path):
+            _close_partition_file(path)
+            os.replace(path, dropped_path)
+        
+        cursor.execute("SELECT id FROM message_partitions WHERE partition_name = ?", (partition,))
+        import campaign_clustering
+        campaign_clustering.remove_messages(cursor, [row[0] for row in cursor.fetchall()])
+        for table in PARTITION_DEPENDENT_TABLES:
+            cursor.execute(
+                f"""DELETE FROM {table} WHERE metadata_id IN
+                    (SELECT id FROM message_partitions WHERE partition_name = ?)""",
+                (partition,)
+            )
+        cursor.execute("DELETE FROM message_partitions WHERE partition_name = ?", (partition,))
+        import response_cache
+        response_cache.bump_write_generation(cursor)
+        conn.commit()
+        
+        if os.path.exists(dropped_path):
+            os.remove(dropped_path)
+        return True
+    except Exception as e:
+        print(f"Error dropping partition {partition}: {e}")
+        conn.rollback()
+        if os.path.exists(dropped_path) and not os.path.exists(path):
+            os.replace(dropped_path, path)
+        return False
     finally:
         conn.close()
 
 
+def apply_retention(keep_months: int, archive_dir: Optional[str] = None,
+                    now: Optional[float] = None) -> List[str]:
+    """
+    Archive or drop the partitions older than the retention period.
+    
+    Args:
+        keep_months (int): Number of months to keep, including the current one
+        archive_dir (Optional[str]): Archive old partitions here instead of dropping them
+        now (Optional[float]): Current time in epoch seconds, for testing
+        
+    Returns:
+        List[str]: The partitions that were archived or dropped
+    """
+    current = time.gmtime(now if now is not None else time.time())
+    month_index = current.tm_year * 12 + current.tm_mon - 1 - (keep_months - 1)
+    cutoff = f"{month_index // 12:04d}_{month_index % 12 + 1:02d}"
+    
+    removed = []
+    for info in list_partitions():
+        if info['partition'] >= cutoff:
+            continue
+        if archive_dir:
+            ok = archive_partition(info['partition'], archive_dir)
+        else:
+            ok = drop_partition(info['partition'])
+        if ok:
+            removed.append(info['partition'])
+    return removed
+
+
 def search_domain_info(domain: str) -> Dict[str, Any]:
     """
     Search for information about a domain in the database.
@@ -210,6 +976,145 @@ def search_related_emails(domain: str) -> List[Dict[str, Any]]:
     return [dict(row) for row in rows]
 
 
+def create_email_update_table(cursor: sqlite3.Cursor):
+    """
+    Create the temporary table that update_related_emails() stages updates in.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS related_email_updates (
+        seq INTEGER PRIMARY KEY,
+        old_email TEXT NOT NULL,
+        new_email TEXT NOT NULL,
+        row_id INTEGER,
+        status TEXT
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS temp.idx_related_email_updates_row "
+        "ON related_email_updates (row_id, status)"
+    )
+
+
+def update_related_emails(updates) -> Optional[List[Dict[str, Any]]]:
+    """
+    Rename many related email addresses in one transaction.
+    
+    The updates are staged in a temporary table and applied with joins, so
+    the cost does not grow with a query per address. Conflicts are resolved
+    in input order, so the same input always gives the same result:
+    
+      - 'duplicate': the old address was already listed earlier
+      - 'not_found': no related email has the old address
+      - 'unchanged': the new address is the old one
+      - 'conflict': an earlier update renames to the same new address, or a
+        related email that is not renamed away already has it
+      - 'updated': the address was renamed
+    
+    Renames among the listed addresses (a -> b with b -> c, or swaps) are
+    allowed as long as every address is unique afterwards.
+    
+    Args:
+        updates: Mapping of old to new addresses, or (old, new) pairs
+    
+    Returns:
+        Optional[List[Dict[str, Any]]]: One result per update in input order with
+        original_email, new_email, status and the related email id, or None if
+        the transaction failed
+    """
+    pairs = list(updates.items() if isinstance(updates, dict) else updates)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        create_email_update_table(cursor)
+        cursor.execute("DELETE FROM temp.related_email_updates")
+        cursor.executemany(
+            "INSERT INTO temp.related_email_updates (seq, old_email, new_email) VALUES (?, ?, ?)",
+            [(seq, old, new) for seq, (old, new) in enumerate(pairs)]
+        )
+    
+        # Look up the rows holding the old and the new addresses
+        cursor.execute(
+            """SELECT u.seq, u.old_email, u.new_email, old.id, new.id
+               FROM temp.related_email_updates u
+               LEFT JOIN related_emails old ON old.email_address = u.old_email
+               LEFT JOIN related_emails new ON new.email_address = u.new_email
+               ORDER BY u.seq"""
+        )
+        staged = cursor.fetchall()
+    
+        statuses = {}
+        seen_old = set()
+        claimed_new = set()
+        for seq, old, new, row_id, _ in staged:
+            if old in seen_old:
+                statuses[seq] = 'duplicate'
+            elif row_id is None:
+                statuses[seq] = 'not_found'
+            elif old == new:
+                statuses[seq] = 'unchanged'
+            elif new in claimed_new:
+                statuses[seq] = 'conflict'
+            else:
+                statuses[seq] = 'updated'
+                claimed_new.add(new)
+            seen_old.add(old)
+    
+        # A new address is free only if the row holding it is renamed too. A
+        # conflicting update keeps its row, which makes the updates waiting
+        # for that row's address conflict in turn; each update is visited once.
+        moving = {row[3] for row in staged if statuses[row[0]] == 'updated'}
+        waiting = defaultdict(list)
+        conflicts = []
+        for seq, _, _, _, target_id in staged:
+            if statuses[seq] == 'updated' and target_id is not None:
+                if target_id in moving:
+                    waiting[target_id].append(seq)
+                else:
+                    conflicts.append(seq)
+        row_ids = {row[0]: row[3] for row in staged}
+        while conflicts:
+            seq = conflicts.pop()
+            statuses[seq] = 'conflict'
+            conflicts.extend(waiting.pop(row_ids[seq], ()))
+    
+        cursor.executemany(
+            "UPDATE temp.related_email_updates SET row_id = ?, status = ? WHERE seq = ?",
+            [(row_id, statuses[seq], seq) for seq, _, _, row_id, _ in staged]
+        )
+    
+        # Move the renamed rows to placeholder addresses first, so renames
+        # among them never collide halfway through. Correlated subqueries
+        # rather than UPDATE ... FROM, which needs SQLite 3.33.
+        cursor.execute(
+            """UPDATE related_emails SET email_address = char(0) || id
+               WHERE id IN (SELECT row_id FROM temp.related_email_updates WHERE status = 'updated')"""
+        )
+        cursor.execute(
+            """UPDATE related_emails
+               SET email_address = (SELECT u.new_email FROM temp.related_email_updates u
+                                    WHERE u.row_id = related_emails.id AND u.status = 'updated'),
+                   last_updated = CURRENT_TIMESTAMP
+               WHERE id IN (SELECT row_id FROM temp.related_email_updates WHERE status = 'updated')"""
+        )
+    
+        conn.commit()
+        return [
+            {'original_email': old, 'new_email': new, 'status': statuses[seq], 'id': row_id}
+            for seq, old, new, row_id, _ in staged
+        ]
+    except Exception as e:
+        print(f"Error updating related emails: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
 def add_or_update_domain(domain: str, registrar: str = "Unknown", 
                         creation_date: str = None, expiration_date: str = None) -> Optional[int]:
     """
@@ -266,13 +1171,42 @@ def add_or_update_domain(domain: str, registrar: str = "Unknown",
         conn.close()
 
 
-def search_email_metadata(search_term: str, search_type: str) -> List[Dict[str, Any]]:
+def ensure_domain(cursor: sqlite3.Cursor, domain: str):
+    """
+    Add a domain with placeholder registration data if it is not in the database yet.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        domain (str): The domain name
+    """
+    now = datetime.now()
+    cursor.execute(
+        """INSERT OR IGNORE INTO domains 
+           (domain_name, registrar, creation_date, expiration_date) 
+           VALUES (?, ?, ?, ?)""",
+        (domain, "Unknown", now.strftime("%Y-%m-%d"),
+         now.replace(year=now.year + 1).strftime("%Y-%m-%d"))
+    )
+
+
+def search_email_metadata(search_term: str, search_type: str,
+                          start: Optional[int] = None, end: Optional[int] = None,
+                          limit: Optional[int] = None, offset: int = 0,
+                          after_id: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Search for email metadata in the database based on search term and type.
     
+    With PARTITION_DIR set, the main database and the partitions overlapping
+    the date range are searched, and their matches merged in ID order.
+    
     Args:
         search_term (str): The term to search for
         search_type (str): The type of search (sender, recipient, subject, message_id)
+        start (Optional[int]): Only include emails dated at or after this UTC epoch time
+        end (Optional[int]): Only include emails dated before this UTC epoch time
+        limit (Optional[int]): Return one page of at most this many records, ordered by ID
+        offset (int): Number of records skipped before the page
+        after_id (Optional[int]): Only include records with a greater ID, e.g. the last ID of the previous page
         
     Returns:
         List[Dict[str, Any]]: List of matching email metadata records
@@ -281,22 +1215,233 @@ def search_email_metadata(search_term: str, search_type: str) -> List[Dict[str,
     cursor = conn.cursor()
     
     # Validate search_type to prevent SQL injection
-    valid_search_types = ['sender', 'recipient', 'subject', 'message_id']
-    if search_type not in valid_search_types:
+    if search_type not in SEARCH_TYPES:
         search_type = 'sender'  # Default to sender if invalid type
     
-    # Use parameterized query with LIKE for partial matching
-    cursor.execute(
-        f"SELECT * FROM email_metadata WHERE {search_type} LIKE ?", 
-        (f'%{search_term}%',)
+    try:
+        partitions = overlapping_partitions(start, end)
+        if not partitions:
+            cursor.execute(*build_search_query(cursor, search_term, search_type, start, end, limit, offset,
+                                               after_id=after_id))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        # Each database returns its first offset + limit matches; the page is
+        # cut from the merged ones
+        schema_limit = offset + limit if limit is not None else None
+        rows = []
+        for schemas in _attached_groups(cursor, partitions):
+            for schema in schemas:
+                cursor.execute(*build_search_query(cursor, search_term, search_type, start, end, schema_limit,
+                                                   after_id=after_id, schema=schema))
+                rows.extend(dict(row) for row in cursor.fetchall())
+        
+        if limit is None:
+            return sorted(rows, key=lambda row: row['id'])
+        return heapq.nsmallest(schema_limit, rows, key=lambda row: row['id'])[offset:]
+    finally:
+        conn.close()
+
+
+def count_email_metadata(search_term: str, search_type: str,
+                         start: Optional[int] = None, end: Optional[int] = None) -> int:
+    """
+    Count the email metadata records matching a search.
+    
+    Args:
+        search_term (str): The term to search for
+        search_type (str): The type of search (sender, recipient, subject, message_id)
+        start (Optional[int]): Only include emails dated at or after this UTC epoch time
+        end (Optional[int]): Only include emails dated before this UTC epoch time
+        
+    Returns:
+        int: The number of matching records
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if search_type not in SEARCH_TYPES:
+        search_type = 'sender'  # Default to sender if invalid type
+    
+    try:
+        count = 0
+        for schemas in _attached_groups(cursor, overlapping_partitions(start, end)):
+            for schema in schemas:
+                cursor.execute(*build_search_query(cursor, search_term, search_type, start, end,
+                                                   columns='COUNT(*)', schema=schema))
+                count += cursor.fetchone()[0]
+        return count
+    finally:
+        conn.close()
+
+
+def build_search_query(cursor: sqlite3.Cursor, search_term: str, search_type: str,
+                       start: Optional[int] = None, end: Optional[int] = None,
+                       limit: Optional[int] = None, offset: int = 0,
+                       columns: str = '*', after_id: Optional[int] = None,
+                       schema: str = 'main') -> Tuple[str, List[Any]]:
+    """
+    Build the query for a partial-match search of email metadata.
+    
+    Uses the trigram full-text index when it exists and the term is long
+    enough for it (three characters), otherwise a LIKE scan of the table.
+    
+    The next page is best requested with after_id set to the last ID of the
+    current one: the search then starts at that ID in the primary key,
+    whereas an offset makes SQLite step over every skipped row.
+    
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        search_term (str): The term to search for
+        search_type (str): The column to search, one of SEARCH_TYPES
+        start (Optional[int]): Only include emails dated at or after this UTC epoch time
+        end (Optional[int]): Only include emails dated before this UTC epoch time
+        limit (Optional[int]): Return one page of at most this many rows, ordered by ID
+        offset (int): Number of rows skipped before the page
+        columns (str): Result columns, e.g. 'COUNT(*)' to count the matches
+        after_id (Optional[int]): Only include rows with a greater ID (keyset paging)
+        schema (str): The database searched: 'main' or an attached partition
+        
+    Returns:
+        Tuple[str, List[Any]]: The SQL and its parameters
+    """
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"Invalid search type: {search_type}")
+    
+    date_filter, date_params = date_range_clause(start, end)
+    if after_id is not None:
+        date_filter += ' AND id > ?'
+        date_params.append(after_id)
+    pattern = f'%{search_term}%'
+    prefix = '' if schema == 'main' else f'{schema}.'
+    
+    if len(search_term) >= 3 and _has_search_index(cursor, schema):
+        sql = f"""SELECT {columns} FROM {prefix}email_metadata
+                WHERE id IN (SELECT rowid FROM {prefix}email_metadata_fts WHERE {search_type} LIKE ?){date_filter}"""
+    else:
+        # Use parameterized query with LIKE for partial matching
+        sql = f"SELECT {columns} FROM {prefix}email_metadata WHERE {search_type} LIKE ?{date_filter}"
+    params = [pattern, *date_params]
+    
+    if limit is not None:
+        # Pages must come in a stable order to be stitched together
+        sql += " ORDER BY id LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    return sql, params
+
+
+def _has_search_index(cursor: sqlite3.Cursor, schema: str = 'main') -> bool:
+    """Check once per database file whether the full-text search index exists."""
+    path = DATABASE_PATH if schema == 'main' else partition_path(schema[2:])
+    if path not in _search_index_available:
+        cursor.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'email_metadata_fts'")
+        available = cursor.fetchone() is not None
+        if not available:
+            # Not migrated yet; check again next time
+            return False
+        _search_index_available[path] = available
+    return _search_index_available[path]
+
+
+def date_range_clause(start: Optional[int], end: Optional[int]) -> Tuple[str, List[int]]:
+    """
+    Build the SQL condition restricting email_metadata to a date_epoch range.
+    
+    Args:
+        start (Optional[int]): Inclusive lower bound in UTC epoch seconds
+        end (Optional[int]): Exclusive upper bound in UTC epoch seconds
+        
+    Returns:
+        Tuple[str, List[int]]: The " AND ..." condition (empty without bounds) and its parameters
+    """
+    clause = ''
+    params = []
+    if start is not None:
+        clause += ' AND date_epoch >= ?'
+        params.append(start)
+    if end is not None:
+        clause += ' AND date_epoch < ?'
+        params.append(end)
+    return clause, params
+
+
+def iter_email_metadata(start: Optional[int] = None, end: Optional[int] = None,
+                        batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over stored email metadata in date order, for exports.
+    
+    With PARTITION_DIR set, the partitions overlapping the date range are
+    read one after the other, merged with the messages of the main database.
+    
+    Args:
+        start (Optional[int]): Only include emails dated at or after this UTC epoch time
+        end (Optional[int]): Only include emails dated before this UTC epoch time
+        batch_size (int): Number of rows fetched at a time
+        
+    Returns:
+        Iterator[Dict[str, Any]]: Email metadata records ordered by date_epoch, undated ones first
+    """
+    partitions = overlapping_partitions(start, end)
+    if not partitions:
+        yield from _iter_schemas(start, end, batch_size)
+        return
+    
+    # Months do not overlap, so only the main database needs merging
+    yield from heapq.merge(
+        _iter_schemas(start, end, batch_size),
+        _iter_schemas(start, end, batch_size, partitions),
+        key=lambda row: (row['date_epoch'] is not None, row['date_epoch'], row['id'])
     )
+
+
+def _iter_schemas(start: Optional[int], end: Optional[int], batch_size: int,
+                  partitions: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Iterate over the email metadata of the main database, or of partitions in month order."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
-    rows = cursor.fetchall()
-    conn.close()
+    # Without a date range, messages whose Date header could not be parsed are
+    # included (first, as NULL sorts first)
+    date_filter, date_params = date_range_clause(start, end)
+    columns = ', '.join(METADATA_COLUMNS)
+    try:
+        for schemas in _attached_groups(cursor, partitions or [], main=not partitions):
+            for schema in schemas:
+                cursor.execute(
+                    f"""SELECT {columns} FROM {'' if schema == 'main' else schema + '.'}email_metadata
+                        {date_filter.replace(' AND ', 'WHERE ', 1)} ORDER BY date_epoch, id""",
+                    date_params
+                )
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from (dict(row) for row in rows)
+    finally:
+        conn.close()
+
+
+def main():
+    """Initialize the database, and list or expire partitions from command line."""
+    import argparse
     
-    return [dict(row) for row in rows]
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor database')
+    parser.add_argument('--list-partitions', action='store_true', help='List the monthly partition files')
+    parser.add_argument('--keep-months', type=int, help='Archive or drop partitions older than this many months')
+    parser.add_argument('--archive-dir', help='Move expired partitions here instead of deleting them')
+    
+    args = parser.parse_args()
+    
+    initialize_database()
+    
+    if args.keep_months:
+        for partition in apply_retention(args.keep_months, args.archive_dir):
+            print(f"{'Archived' if args.archive_dir else 'Dropped'} partition {partition}")
+    
+    if args.list_partitions:
+        for info in list_partitions():
+            print(f"{info['partition']}  {info['size']:>12}  {info['path']}")
 
 
-# Initialize the database when this module is imported
+# Initialize the database when this module is run
 if __name__ == "__main__":
-    initialize_database()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Date Parsing for Email Metadata Extractor
+
+This module turns Date header values into UTC epoch seconds. Well-formed
+RFC 5322 dates are handled by a compiled regular expression; anything else
+falls back to email.utils, and headers that cannot be parsed at all give None
+instead of raising. Results are cached because campaign and list mail often
+repeats the exact same Date header.
+"""
+
+import re
+import calendar
+from datetime import datetime, timezone
+from email.utils import parsedate_tz, mktime_tz
+from functools import lru_cache
+from typing import Any, Optional
+
+_MONTHS = {name: index for index, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1
+)}
+
+# "Mon, 01 Jan 2023 12:00:00 +0000", with optional weekday and seconds
+_RFC5322_DATE_RE = re.compile(
+    r'^\s*(?:[A-Za-z]{3},\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+'
+    r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([+-])(\d{2})(\d{2})\b'
+)
+
+
+def _timegm(year: int, month: int, day: int, hour: int, minute: int, second: int) -> Optional[int]:
+    """Convert UTC date fields to epoch seconds, or None if a field is out of range.
+
+    calendar.timegm() alone would roll "31 Feb" over into March.
+    """
+    try:
+        return calendar.timegm(datetime(year, month, day, hour, minute, second).timetuple())
+    except (ValueError, OverflowError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def parse_date_header(date_header: str) -> Optional[int]:
+    """Parse a Date header to UTC epoch seconds, or None if it cannot be parsed."""
+    if not date_header:
+        return None
+
+    match = _RFC5322_DATE_RE.match(date_header)
+    if match:
+        day, month, year, hour, minute, second, sign, tz_hours, tz_minutes = match.groups()
+        month_number = _MONTHS.get(month.lower())
+        if month_number:
+            local = _timegm(int(year), month_number, int(day), int(hour), int(minute), int(second or 0))
+            if local is None:
+                return None
+            offset = int(tz_hours) * 3600 + int(tz_minutes) * 60
+            return local - offset if sign == '+' else local + offset
+
+    # Obsolete zone names, two-digit years and other variants
+    try:
+        parsed = parsedate_tz(date_header)
+        if not parsed or _timegm(*parsed[:6]) is None:
+            return None
+        return mktime_tz(parsed)
+    except (TypeError, ValueError, OverflowError, IndexError):
+        return None
+
+
+def parse_time_bound(value: Any) -> Optional[int]:
+    """
+    Parse a query time bound given as epoch seconds or an ISO 8601 date/time.
+
+    Naive ISO values are interpreted as UTC.
+
+    Args:
+        value (Any): The bound, e.g. 1672531200, "2023-01-01" or "2023-01-01T12:00:00"
+
+    Returns:
+        Optional[int]: Epoch seconds, or None if no bound was given
+
+    Raises:
+        ValueError: If the value cannot be parsed
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) or str(value).lstrip('-').isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
@@ -10,6 +10,19 @@
 let currentMetadata = null;
 let alternateEmails = [];
 
+// Search results are fetched from the server in pages of this many rows
+const SEARCH_PAGE_SIZE = 200;
+
+// Delay after the last keystroke before a search runs (milliseconds)
+const SEARCH_DEBOUNCE_MS = 300;
+
+// Aborts the requests of the search currently filling the results container
+let searchController = null;
+let searchDebounceTimer = null;
+
+// Result tables currently shown, so they can be stopped when replaced
+let resultTables = [];
+
 /**
  * Initialize the application when the DOM is fully loaded
  */
@@ -54,6 +67,16 @@ function setupEventListeners() {
     if (databaseSearchForm) {
         databaseSearchForm.addEventListener('submit', handleDatabaseSearch);
     }
+    
+    // Search as the user types, once they pause
+    const searchTermInput = document.getElementById('search-term');
+    if (searchTermInput) {
+        searchTermInput.addEventListener('input', scheduleDatabaseSearch);
+    }
+    const searchTypeSelect = document.getElementById('search-type');
+    if (searchTypeSelect) {
+        searchTypeSelect.addEventListener('change', scheduleDatabaseSearch);
+    }
 }
 
 /**
@@ -290,6 +313,7 @@ async function searchRelatedDatabases() {
         // Use the real database if the checkbox is checked
         const useRealDb = document.getElementById('use-real-db').checked;
         
+        const signal = startSearch();
         const response = await fetch('/api/search-databases', {
             method: 'POST',
             headers: {
@@ -298,7 +322,8 @@ async function searchRelatedDatabases() {
             body: JSON.stringify({ 
                 domains: domains,
                 use_real_db: useRealDb
-            })
+            }),
+            signal: signal
         });
         
         if (!response.ok) {
@@ -314,21 +339,78 @@ async function searchRelatedDatabases() {
             showStatusMessage('Database search failed', 'error');
         }
     } catch (error) {
+        if (error.name === 'AbortError') {
+            return;  // Superseded by a newer search
+        }
         showStatusMessage(`Error searching databases: ${error.message}`, 'error');
         console.error('Database search error:', error);
     }
 }
 
+/**
+ * Run the database search once the user stops typing
+ */
+function scheduleDatabaseSearch() {
+    clearTimeout(searchDebounceTimer);
+    
+    // Shorter terms cannot use the search index, so wait for a submit
+    const searchTerm = document.getElementById('search-term').value.trim();
+    if (searchTerm.length < 3) {
+        return;
+    }
+    
+    searchDebounceTimer = setTimeout(() => handleDatabaseSearch(), SEARCH_DEBOUNCE_MS);
+}
+
+/**
+ * Cancel the search in progress and start a new one
+ * @returns {AbortSignal} Signal aborted when the next search starts
+ */
+function startSearch() {
+    if (searchController) {
+        searchController.abort();
+    }
+    searchController = new AbortController();
+    return searchController.signal;
+}
+
+/**
+ * Fetch one page of email metadata search results
+ * @param {Object} params - The search_term and search_type
+ * @param {Number} offset - Index of the first result
+ * @param {AbortSignal} signal - Signal cancelling the request
+ * @param {Number} [afterId] - ID of the result before the page; the server seeks to it
+ *                             instead of skipping offset results
+ * @returns {Promise<Object>} The server response
+ */
+async function fetchEmailMetadataPage(params, offset, signal, afterId) {
+    const paging = afterId === undefined ? { offset: offset } : { after_id: afterId };
+    const query = new URLSearchParams({ ...params, limit: SEARCH_PAGE_SIZE, ...paging });
+    const response = await fetch(`/api/search-email-metadata?${query}`, { signal: signal });
+    
+    if (!response.ok) {
+        throw new Error(`Server responded with status: ${response.status}`);
+    }
+    
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.error || 'Unknown error');
+    }
+    return data;
+}
+
 /**
  * Handle database search form submission
- * @param {Event} event - The form submit event
+ * @param {Event} [event] - The form submit event, absent for searches run while typing
  */
 async function handleDatabaseSearch(event) {
-    event.preventDefault();
+    if (event) {
+        event.preventDefault();
+    }
+    clearTimeout(searchDebounceTimer);
     
     const searchTerm = document.getElementById('search-term').value.trim();
     const searchType = document.getElementById('search-type').value;
-    const useRealDb = document.getElementById('use-real-db').checked;
     
     if (!searchTerm) {
         showStatusMessage('Please enter a search term', 'error');
@@ -337,37 +419,244 @@ async function handleDatabaseSearch(event) {
     
     showStatusMessage(`Searching for ${searchType} containing "${searchTerm}"...`, 'info');
     
+    const signal = startSearch();
+    const params = { search_term: searchTerm, search_type: searchType };
+    
     try {
-        const response = await fetch('/api/search-email-metadata', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ 
-                search_term: searchTerm,
-                search_type: searchType,
-                use_real_db: useRealDb
-            })
-        });
+        // The first page carries the total; later pages are fetched as they scroll into view
+        const data = await fetchEmailMetadataPage(params, 0, signal);
+        const fetchPage = (offset, afterId) =>
+            fetchEmailMetadataPage(params, offset, signal, afterId).then(page => page.results);
         
-        if (!response.ok) {
-            throw new Error(`Server responded with status: ${response.status}`);
+        displayEmailMetadataSearchResults(data.results, data.total, fetchPage);
+        showStatusMessage(`Found ${data.total} results for ${searchType} containing "${searchTerm}"`, 'success');
+    } catch (error) {
+        if (error.name === 'AbortError') {
+            return;  // Superseded by a newer search
+        }
+        showStatusMessage(`Error searching database: ${error.message}`, 'error');
+        console.error('Database search error:', error);
+    }
+}
+
+/**
+ * Replace the contents of the results container, stopping the tables shown there
+ * @param {HTMLElement} resultsContainer - The results container
+ */
+function clearResults(resultsContainer) {
+    resultTables.forEach(table => table.destroy());
+    resultTables = [];
+    resultsContainer.innerHTML = '';
+}
+
+/**
+ * A table that renders only the rows in view, so it stays responsive with
+ * hundreds of thousands of rows.
+ * 
+ * Rows come either from an in-memory array (options.rows) or from
+ * options.fetchPage(offset, afterId), which resolves to the rows starting at
+ * offset, SEARCH_PAGE_SIZE at a time; afterId is the ID of the row before
+ * offset when the previous page is cached, so scrolling on uses keyset paging. Fetched pages are kept in a bounded cache, and
+ * pages are only requested once scrolling pauses on them.
+ */
+class VirtualTable {
+    /**
+     * @param {HTMLElement} container - Element the table is appended to
+     * @param {Object} options - columns ({label, value(row)} or {label, render(row)}),
+     *                           and either rows, or total, fetchPage and optionally firstPage
+     */
+    constructor(container, options) {
+        this.columns = options.columns;
+        this.rows = options.rows || null;
+        this.total = this.rows ? this.rows.length : options.total;
+        this.fetchPage = options.fetchPage;
+        this.pageSize = options.pageSize || SEARCH_PAGE_SIZE;
+        this.pages = new Map();
+        this.pending = new Set();
+        this.destroyed = false;
+        this.frame = null;
+        this.loadTimer = null;
+        if (options.firstPage) {
+            this.pages.set(0, options.firstPage);
         }
         
-        const data = await response.json();
+        // Column header, outside the scrolling viewport so it stays visible
+        const header = document.createElement('table');
+        header.className = 'results-table virtual-table';
+        const headerRow = header.createTHead().insertRow();
+        this.columns.forEach(column => {
+            const th = document.createElement('th');
+            th.textContent = column.label;
+            headerRow.appendChild(th);
+        });
         
-        if (data.success) {
-            displayEmailMetadataSearchResults(data.results, data.count);
-            showStatusMessage(`Found ${data.count} results for ${searchType} containing "${searchTerm}"`, 'success');
+        // The spacer gives the viewport the scroll height of all rows; the
+        // body table holding the rendered rows is moved to the scroll position
+        this.viewport = document.createElement('div');
+        this.viewport.className = 'virtual-table-viewport';
+        this.viewport.style.height = `${Math.min(this.total * VirtualTable.ROW_HEIGHT, VirtualTable.VIEWPORT_HEIGHT)}px`;
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'virtual-table-spacer';
+        this.body = document.createElement('table');
+        this.body.className = 'results-table virtual-table';
+        this.tbody = this.body.createTBody();
+        this.spacer.appendChild(this.body);
+        this.viewport.appendChild(this.spacer);
+        
+        this.viewport.addEventListener('scroll', () => this.scheduleRender(), { passive: true });
+        
+        container.appendChild(header);
+        container.appendChild(this.viewport);
+        this.render();
+    }
+    
+    /**
+     * Stop rendering and ignore pages still being fetched
+     */
+    destroy() {
+        this.destroyed = true;
+        cancelAnimationFrame(this.frame);
+        clearTimeout(this.loadTimer);
+    }
+    
+    /**
+     * Render on the next animation frame, at most once per frame
+     */
+    scheduleRender() {
+        if (this.frame === null && !this.destroyed) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.render();
+            });
+        }
+    }
+    
+    /**
+     * Get a row, or undefined if its page has not been fetched yet
+     * @param {Number} index - Index of the row
+     */
+    getRow(index) {
+        if (this.rows) {
+            return this.rows[index];
+        }
+        const page = this.pages.get(Math.floor(index / this.pageSize));
+        return page ? page[index % this.pageSize] : undefined;
+    }
+    
+    /**
+     * Fetch a page of rows unless it is cached or already being fetched
+     * @param {Number} page - Index of the page
+     */
+    async loadPage(page) {
+        if (this.pages.has(page) || this.pending.has(page)) {
+            return;
+        }
+        this.pending.add(page);
+        try {
+            const previous = this.pages.get(page - 1);
+            const afterId = previous && previous.length ? previous[previous.length - 1].id : undefined;
+            const rows = await this.fetchPage(page * this.pageSize, afterId);
+            if (this.destroyed) {
+                return;
+            }
+            this.pages.set(page, rows);
+            // Forget the oldest pages; they are fetched again if scrolled back to
+            while (this.pages.size > VirtualTable.MAX_CACHED_PAGES) {
+                this.pages.delete(this.pages.keys().next().value);
+            }
+            this.scheduleRender();
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                showStatusMessage(`Error loading results: ${error.message}`, 'error');
+                console.error('Result page error:', error);
+            }
+        } finally {
+            this.pending.delete(page);
+        }
+    }
+    
+    /**
+     * Render the rows in view, plus a few above and below
+     */
+    render() {
+        if (this.destroyed) {
+            return;
+        }
+        const rowHeight = VirtualTable.ROW_HEIGHT;
+        const viewportHeight = this.viewport.clientHeight || VirtualTable.VIEWPORT_HEIGHT;
+        const fullHeight = this.total * rowHeight;
+        const spacerHeight = Math.min(fullHeight, VirtualTable.MAX_SCROLL_HEIGHT);
+        const visible = Math.ceil(viewportHeight / rowHeight) + 1;
+        const scrollTop = this.viewport.scrollTop;
+        this.spacer.style.height = `${spacerHeight}px`;
+        
+        let first;
+        let top;
+        if (fullHeight <= spacerHeight) {
+            first = Math.floor(scrollTop / rowHeight);
+            top = first * rowHeight;
         } else {
-            showStatusMessage(`Error searching database: ${data.error || 'Unknown error'}`, 'error');
+            // Taller than browsers can scroll: map the scroll position proportionally onto the rows
+            const maxScroll = Math.max(1, spacerHeight - viewportHeight);
+            first = Math.floor(Math.min(1, scrollTop / maxScroll) * Math.max(0, this.total - visible));
+            top = scrollTop;
+        }
+        // Start on an even row so the striping does not flicker while scrolling
+        let start = Math.max(0, first - VirtualTable.OVERSCAN);
+        start -= start % 2;
+        const end = Math.min(this.total, first + visible + VirtualTable.OVERSCAN);
+        this.body.style.transform = `translateY(${top - (first - start) * rowHeight}px)`;
+        
+        const fragment = document.createDocumentFragment();
+        const missingPages = new Set();
+        for (let index = start; index < end; index++) {
+            const rowData = this.getRow(index);
+            const row = document.createElement('tr');
+            row.style.height = `${rowHeight}px`;
+            
+            if (rowData === undefined) {
+                row.className = 'virtual-table-loading';
+                const cell = row.insertCell();
+                cell.colSpan = this.columns.length;
+                cell.textContent = 'Loading...';
+                missingPages.add(Math.floor(index / this.pageSize));
+            } else {
+                this.columns.forEach(column => {
+                    const cell = row.insertCell();
+                    if (column.render) {
+                        cell.appendChild(column.render(rowData));
+                    } else {
+                        cell.textContent = column.value(rowData);
+                        cell.title = cell.textContent;
+                    }
+                });
+            }
+            fragment.appendChild(row);
+        }
+        this.tbody.replaceChildren(fragment);
+        
+        // Fetch the missing pages once scrolling pauses, not for every page scrolled past
+        clearTimeout(this.loadTimer);
+        if (missingPages.size > 0) {
+            this.loadTimer = setTimeout(() => missingPages.forEach(page => this.loadPage(page)),
+                                        VirtualTable.LOAD_DELAY_MS);
         }
-    } catch (error) {
-        showStatusMessage(`Error searching database: ${error.message}`, 'error');
-        console.error('Database search error:', error);
     }
 }
 
+// Height of every row in pixels; rows are clipped to one line so positions can be computed
+VirtualTable.ROW_HEIGHT = 36;
+// Maximum height of the scrolling viewport in pixels
+VirtualTable.VIEWPORT_HEIGHT = 480;
+// Largest scroll height used; browsers cannot lay out much taller elements
+VirtualTable.MAX_SCROLL_HEIGHT = 8000000;
+// Rows rendered above and below the viewport
+VirtualTable.OVERSCAN = 10;
+// Fetched pages kept per table
+VirtualTable.MAX_CACHED_PAGES = 50;
+// Time scrolling must pause on missing rows before they are fetched (milliseconds)
+VirtualTable.LOAD_DELAY_MS = 100;
+
 /**
  * Display database search results in the UI
  * @param {Object} results - The database search results
@@ -376,7 +665,7 @@ function displayDatabaseResults(results) {
     const resultsContainer = document.getElementById('database-results-container');
     
     // Clear previous content
-    resultsContainer.innerHTML = '';
+    clearResults(resultsContainer);
     
     // Create header
     const header = document.createElement('h3');
@@ -430,53 +719,47 @@ function displayDatabaseResults(results) {
             emailsHeader.textContent = 'Related Email Addresses:';
             domainSection.appendChild(emailsHeader);
             
-            const emailsList = document.createElement('ul');
-            domainResults.related_emails.forEach(email => {
-                const listItem = document.createElement('li');
-                // Check if email is an object with email_address property (from real DB)
-                let emailAddress;
-                let description = '';
-                
-                if (typeof email === 'object' && email.email_address) {
-                    emailAddress = email.email_address;
-                    description = email.description || '';
-                    listItem.textContent = emailAddress;
-                    if (description) {
-                        listItem.textContent += ` (${description})`;
-                    }
-                    // Add to alternateEmails if not already there
-                    if (!alternateEmails.includes(emailAddress)) {
-                        alternateEmails.push(emailAddress);
-                    }
-                } else {
-                    // Simple string email (from simulated DB)
-                    emailAddress = email;
-                    listItem.textContent = emailAddress;
-                    // Add to alternateEmails if not already there
-                    if (!alternateEmails.includes(emailAddress)) {
-                        alternateEmails.push(emailAddress);
-                    }
+            // Entries are objects with email_address (real DB) or plain strings (simulated DB)
+            const emails = domainResults.related_emails.map(email =>
+                typeof email === 'object' && email.email_address
+                    ? { email_address: email.email_address, description: email.description || '' }
+                    : { email_address: email, description: '' }
+            );
+            
+            // Add them to alternateEmails if not already there
+            const knownEmails = new Set(alternateEmails);
+            emails.forEach(email => {
+                if (!knownEmails.has(email.email_address)) {
+                    knownEmails.add(email.email_address);
+                    alternateEmails.push(email.email_address);
                 }
-                
-                // Add button to add to alternate emails list
-                const addButton = document.createElement('button');
-                addButton.textContent = 'Add to Alternates';
-                addButton.className = 'btn-small';
-                addButton.addEventListener('click', () => {
-                    if (!alternateEmails.includes(emailAddress)) {
-                        alternateEmails.push(emailAddress);
-                        updateAlternateEmailsList();
-                        showStatusMessage(`Added ${emailAddress} to alternate emails list`, 'success');
-                    } else {
-                        showStatusMessage(`${emailAddress} is already in the alternate emails list`, 'info');
-                    }
-                });
-                
-                listItem.appendChild(addButton);
-                emailsList.appendChild(listItem);
             });
             
-            domainSection.appendChild(emailsList);
+            const emailsTable = new VirtualTable(domainSection, {
+                rows: emails,
+                columns: [
+                    { label: 'Email Address', value: email => email.email_address },
+                    { label: 'Description', value: email => email.description },
+                    { label: 'Actions', render: email => {
+                        // Add button to add to alternate emails list
+                        const emailAddress = email.email_address;
+                        const addButton = document.createElement('button');
+                        addButton.textContent = 'Add to Alternates';
+                        addButton.className = 'btn-small';
+                        addButton.addEventListener('click', () => {
+                            if (!alternateEmails.includes(emailAddress)) {
+                                alternateEmails.push(emailAddress);
+                                updateAlternateEmailsList();
+                                showStatusMessage(`Added ${emailAddress} to alternate emails list`, 'success');
+                            } else {
+                                showStatusMessage(`${emailAddress} is already in the alternate emails list`, 'info');
+                            }
+                        });
+                        return addButton;
+                    } }
+                ]
+            });
+            resultTables.push(emailsTable);
         }
         
         resultsContainer.appendChild(domainSection);
@@ -490,17 +773,21 @@ function displayDatabaseResults(results) {
 
 /**
  * Display email metadata search results from the database
- * @param {Array} results - The search results array
- * @param {Number} count - The number of results found
+ * @param {Array} results - The first page of search results
+ * @param {Number} [count] - The total number of results found, defaults to the length of results
+ * @param {Function} [fetchPage] - Resolves to the results starting at an offset, or after an ID; without it
+ *                                 results must hold every result
  */
-function displayEmailMetadataSearchResults(results, count) {
+function displayEmailMetadataSearchResults(results, count, fetchPage) {
     const resultsContainer = document.getElementById('database-results-container');
     
     // Clear previous content
-    resultsContainer.innerHTML = '';
+    clearResults(resultsContainer);
+    
+    const total = count === undefined ? (results ? results.length : 0) : count;
     
     // Check if we have results
-    if (!results || results.length === 0) {
+    if (!results || total === 0) {
         resultsContainer.innerHTML = '<p>No matching emails found in the database.</p>';
         return;
     }
@@ -512,56 +799,32 @@ function displayEmailMetadataSearchResults(results, count) {
     // Add a header with search info
     const searchInfo = document.createElement('div');
     searchInfo.className = 'search-info';
-    searchInfo.innerHTML = `<p>Found <strong>${results.length}</strong> matching emails</p>`;
+    searchInfo.innerHTML = `<p>Found <strong>${total.toLocaleString()}</strong> matching emails</p>`;
     resultsDiv.appendChild(searchInfo);
+    resultsContainer.appendChild(resultsDiv);
     
-    // Create a table for the results
-    const table = document.createElement('table');
-    table.className = 'results-table';
-    
-    // Add table header
-    const thead = document.createElement('thead');
-    const headerRow = document.createElement('tr');
-    ['Sender', 'Recipient', 'Subject', 'Date', 'Actions'].forEach(text => {
-        const th = document.createElement('th');
-        th.textContent = text;
-        headerRow.appendChild(th);
-    });
-    thead.appendChild(headerRow);
-    table.appendChild(thead);
-    
-    // Add table body
-    const tbody = document.createElement('tbody');
-    
-    results.forEach(result => {
-        const row = document.createElement('tr');
-        
-        // Add cells for each property
-        ['sender', 'recipient', 'subject', 'date'].forEach(prop => {
-            const cell = document.createElement('td');
-            cell.textContent = result[prop] || '';
-            row.appendChild(cell);
-        });
-        
-        // Add actions cell
-        const actionsCell = document.createElement('td');
-        
-        const viewButton = document.createElement('button');
-        viewButton.textContent = 'View Details';
-        viewButton.className = 'btn-small';
-        viewButton.addEventListener('click', () => {
-            viewEmailDetails(result);
-        });
-        
-        actionsCell.appendChild(viewButton);
-        row.appendChild(actionsCell);
-        
-        tbody.appendChild(row);
+    // Only the rows in view are rendered; the rest are fetched as they scroll into view
+    const columns = ['sender', 'recipient', 'subject', 'date'].map(prop => ({
+        label: prop.charAt(0).toUpperCase() + prop.slice(1),
+        value: result => result[prop] || ''
+    }));
+    columns.push({
+        label: 'Actions',
+        render: result => {
+            const viewButton = document.createElement('button');
+            viewButton.textContent = 'View Details';
+            viewButton.className = 'btn-small';
+            viewButton.addEventListener('click', () => {
+                viewEmailDetails(result);
+            });
+            return viewButton;
+        }
     });
     
-    table.appendChild(tbody);
-    resultsDiv.appendChild(table);
-    resultsContainer.appendChild(resultsDiv);
+    const table = fetchPage
+        ? new VirtualTable(resultsDiv, { total: total, firstPage: results, fetchPage: fetchPage, columns: columns })
+        : new VirtualTable(resultsDiv, { rows: results, columns: columns });
+    resultTables.push(table);
 }
 
 /**
@@ -680,77 +943,6 @@ function viewEmailDetails(emailData) {
         }
     });
 }
-    
-    // Check if there are any results
-    if (!results || results.length === 0) {
-        resultsContainer.innerHTML = '<p>No matching emails found in the database.</p>';
-        return;
-    }
-    
-    // Create a container for the results
-    const resultsDiv = document.createElement('div');
-    resultsDiv.className = 'email-metadata-results';
-    
-    // Add a header with the count
-    const header = document.createElement('h3');
-    header.textContent = `Found ${count} matching email(s)`;
-    resultsDiv.appendChild(header);
-    
-    // Create a table for the results
-    const table = document.createElement('table');
-    table.className = 'results-table';
-    
-    // Add table header
-    const thead = document.createElement('thead');
-    const headerRow = document.createElement('tr');
-    ['Sender', 'Recipient', 'Subject', 'Date', 'Actions'].forEach(text => {
-        const th = document.createElement('th');
-        th.textContent = text;
-        headerRow.appendChild(th);
-    });
-    thead.appendChild(headerRow);
-    table.appendChild(thead);
-    
-    // Add table body
-    const tbody = document.createElement('tbody');
-    
-    // Add a row for each result
-    results.forEach(email => {
-        const row = document.createElement('tr');
-        
-        // Add cells for each property
-        const senderCell = document.createElement('td');
-        senderCell.textContent = email.sender || 'N/A';
-        row.appendChild(senderCell);
-        
-        const recipientCell = document.createElement('td');
-        recipientCell.textContent = email.recipient || 'N/A';
-        row.appendChild(recipientCell);
-        
-        const subjectCell = document.createElement('td');
-        subjectCell.textContent = email.subject || 'N/A';
-        row.appendChild(subjectCell);
-        
-        const dateCell = document.createElement('td');
-        dateCell.textContent = email.date || 'N/A';
-        row.appendChild(dateCell);
-        
-        // Add a view details button
-        const actionsCell = document.createElement('td');
-        const viewButton = document.createElement('button');
-        viewButton.textContent = 'View Details';
-        viewButton.className = 'btn-secondary';
-        viewButton.onclick = () => viewEmailDetails(email);
-        actionsCell.appendChild(viewButton);
-        row.appendChild(actionsCell);
-        
-        tbody.appendChild(row);
-    });
-    
-    table.appendChild(tbody);
-    resultsDiv.appendChild(table);
-    resultsContainer.appendChild(resultsDiv);
-}
 
 /**
  * View detailed information about an email from the database
@@ -11,26 +11,96 @@ and provides functionality to discover and modify alternate email addresses.
 import email
 import os
 import re
+import ipaddress
+import sys
 import json
+import time
 import argparse
 import sqlite3
 import requests
-from email.parser import BytesParser
+from collections import Counter
+from itertools import chain, islice
+from email.parser import BytesParser, Parser
 from email.policy import default
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 
 # Import database configuration
 import database_config
+import campaign_clustering
+import streaming_analytics
+import volume_rollups
+import auth_results
+import attachment_inventory
+import ip_enrichment
+import profiling
+from date_parsing import parse_date_header
+
+# Guardrails against pathological messages (thousands of Received headers,
+# megabyte-long address lists, deeply nested MIME). A message reaching a
+# limit is processed up to it, and metadata['truncated'] maps each affected
+# field to the limit it hit. None disables a limit.
+DEFAULT_LIMITS = {
+    # Bytes of the header section read; the body is only streamed by the
+    # attachment scan, so this bounds the memory used per message
+    'max_header_section_bytes': 1024 * 1024,
+    # Bytes of a single header value parsed
+    'max_header_bytes': 16 * 1024,
+    # Received headers kept
+    'max_hops': 100,
+    # X- headers kept
+    'max_x_headers': 200,
+    # Addresses kept per address header
+    'max_addresses': 1000,
+    # IP addresses kept from the Received headers
+    'max_ip_addresses': 200,
+    # Seconds after which the remaining optional steps (IP enrichment,
+    # authentication verdicts, attachment inventory) are skipped
+    'time_budget': 2.0,
+    # Multipart nesting depth and attachments inventoried
+    'max_mime_depth': attachment_inventory.MAX_MIME_DEPTH,
+    'max_attachments': attachment_inventory.MAX_ATTACHMENTS,
+}
+
+# Messages extracted and limits hit in this process, by limit name
+limit_metrics = Counter()
+
+# Starts of address candidates are required to follow a non-address
+# character, so a long run without "@" is scanned once instead of once per
+# position
+_ADDRESS_RE = re.compile(r'(?<![\w.-])[\w.-]+@[\w.-]+')
+
+# Headers holding address lists, which are cut between entries
+_ADDRESS_HEADERS = ('from', 'to', 'cc', 'bcc', 'reply-to', 'sender')
+
+# IPv4 dotted quads, and IPv6 candidates (optionally after an "IPv6:" address
+# literal prefix) that are checked with ipaddress before they are kept, since
+# times like 10:23:45 have the same shape
+_IP_RE = re.compile(
+    r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+    r'|(?:(?<=[Ii][Pp][Vv]6:)|(?<![\w:.]))'
+    r'(?:[0-9A-Fa-f]{0,4}:){2,7}(?:[0-9A-Fa-f]{1,4}|(?:\d{1,3}\.){3}\d{1,3})?(?![\w:.])'
+)
+
+# Bytes read at a time while looking for the end of the header section
+_HEADER_READ_SIZE = 64 * 1024
 
 
 class EmailMetadataExtractor:
     """Class for extracting metadata from email files."""
 
-    def __init__(self, email_path: str = None, email_content: bytes = None):
-        """Initialize with either a path to an email file or raw email content."""
+    def __init__(self, email_path: str = None, email_content: bytes = None,
+                 limits: Dict[str, Any] = None):
+        """Initialize with either a path to an email file or raw email content.
+        
+        email_content may be bytes or any bytes-like object such as a memoryview.
+        limits overrides entries of DEFAULT_LIMITS.
+        """
         self.email_path = email_path
         self.email_content = email_content
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.truncated = {}
+        self._cut_headers = set()
         self.metadata = {}
         self.related_emails = []
         self.db_connection = None
@@ -48,87 +118,272 @@ class EmailMetadataExtractor:
             with open(self.email_path, 'rb') as fp:
                 return BytesParser(policy=default).parse(fp)
         elif self.email_content:
-            return BytesParser(policy=default).parsebytes(self.email_content)
+            # Decode straight from the buffer (same as BytesParser.parsebytes) so
+            # memoryview slices, e.g. of an mmap'ed mbox, are not copied to bytes first
+            text = str(self.email_content, 'ascii', 'surrogateescape')
+            return Parser(policy=default).parsestr(text)
         else:
             raise ValueError("No valid email source provided")
 
     def extract_metadata(self) -> Dict[str, Any]:
-        """Extract all metadata from the email."""
-        msg = self.load_email()
+        """Extract all metadata from the email, within the limits of self.limits."""
+        time_budget = self.limits['time_budget']
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        self.truncated = {}
+        self._cut_headers = set()
+        msg = self._load_headers()
         
         # Basic headers
         self.metadata = {
-            'from': msg.get('From', ''),
-            'to': msg.get('To', ''),
-            'cc': msg.get('Cc', ''),
-            'bcc': msg.get('Bcc', ''),
-            'subject': msg.get('Subject', ''),
-            'date': msg.get('Date', ''),
-            'message_id': msg.get('Message-ID', ''),
-            'in_reply_to': msg.get('In-Reply-To', ''),
-            'references': msg.get('References', ''),
-            'return_path': msg.get('Return-Path', ''),
+            'from': self._get_header(msg, 'From'),
+            'to': self._get_header(msg, 'To'),
+            'cc': self._get_header(msg, 'Cc'),
+            'bcc': self._get_header(msg, 'Bcc'),
+            'subject': self._get_header(msg, 'Subject'),
+            'date': self._get_header(msg, 'Date'),
+            'message_id': self._get_header(msg, 'Message-ID'),
+            'in_reply_to': self._get_header(msg, 'In-Reply-To'),
+            'references': self._get_header(msg, 'References'),
+            'return_path': self._get_header(msg, 'Return-Path'),
             'received': self._parse_received_headers(msg),
             'x_headers': self._extract_x_headers(msg),
-            'dkim': msg.get('DKIM-Signature', ''),
-            'spf': msg.get('Received-SPF', ''),
-            'authentication_results': msg.get('Authentication-Results', ''),
-            'content_type': msg.get('Content-Type', ''),
-            'user_agent': msg.get('User-Agent', ''),
-            'mime_version': msg.get('MIME-Version', ''),
+            'dkim': self._get_header(msg, 'DKIM-Signature'),
+            'spf': self._get_header(msg, 'Received-SPF'),
+            'authentication_results': self._get_header(msg, 'Authentication-Results'),
+            'content_type': self._get_header(msg, 'Content-Type'),
+            'user_agent': self._get_header(msg, 'User-Agent'),
+            'mime_version': self._get_header(msg, 'MIME-Version'),
         }
         
+        # Parse the Date header to UTC epoch seconds (None if malformed)
+        self.metadata['date_epoch'] = parse_date_header(str(self.metadata['date']))
+        
         # Extract email addresses
         self.metadata['from_email'] = self._extract_email_address(self.metadata['from'])
-        self.metadata['to_emails'] = self._extract_email_addresses(self.metadata['to'])
-        self.metadata['cc_emails'] = self._extract_email_addresses(self.metadata['cc'])
-        self.metadata['bcc_emails'] = self._extract_email_addresses(self.metadata['bcc'])
+        self.metadata['to_emails'] = self._extract_email_addresses(self.metadata['to'], 'to_emails')
+        self.metadata['cc_emails'] = self._extract_email_addresses(self.metadata['cc'], 'cc_emails')
+        self.metadata['bcc_emails'] = self._extract_email_addresses(self.metadata['bcc'], 'bcc_emails')
         
         # Extract IP addresses from received headers
         self.metadata['ip_addresses'] = self._extract_ip_addresses(self.metadata['received'])
         
+        # ASN, organization and country of each hop IP from the local range file
+        self.metadata['ip_enrichment'] = (
+            {} if self._over_budget(deadline, 'ip_enrichment')
+            else ip_enrichment.enrich(self.metadata['ip_addresses'])
+        )
+        
         # Extract domains
         self.metadata['domains'] = self._extract_domains()
         
+        # Structured DKIM/SPF/DMARC verdicts
+        self.metadata['auth_verdicts'] = (
+            [] if self._over_budget(deadline, 'auth_verdicts')
+            else auth_results.extract_verdicts(self.metadata)
+        )
+        
+        # Attachment names, types, sizes and hashes, streamed from the raw message
+        self.metadata['attachments'] = (
+            [] if self._over_budget(deadline, 'attachments')
+            else self._inventory_attachments(deadline)
+        )
+        
+        # Fields cut short by a limit, and the limit they hit
+        self.metadata['truncated'] = self.truncated
+        limit_metrics['messages'] += 1
+        if self.truncated:
+            limit_metrics['truncated_messages'] += 1
+            limit_metrics.update(self.truncated.values())
+        
+        # Feed the top senders/domains/relays sketches
+        streaming_analytics.record_metadata(self.metadata)
+        
         return self.metadata
 
+    def _truncate(self, field: str, limit: str):
+        """Mark a field as cut short by a limit."""
+        self.truncated.setdefault(field, limit)
+
+    def _over_budget(self, deadline: Optional[float], field: str) -> bool:
+        """Check whether the time budget is spent, marking the skipped field if so."""
+        if deadline is not None and time.monotonic() > deadline:
+            self._truncate(field, 'time_budget')
+            return True
+        return False
+
+    def _read_header_section(self) -> bytes:
+        """
+        Read the raw header section.
+        
+        Each header is cut to max_header_bytes and the rest of it is skipped,
+        so the headers after an oversized one are still read. Reading stops
+        at max_header_section_bytes in total.
+        """
+        if self.email_path and os.path.exists(self.email_path):
+            f = open(self.email_path, 'rb')
+            chunks = iter(lambda: f.read(_HEADER_READ_SIZE), b'')
+        elif self.email_content:
+            f = None
+            view = memoryview(self.email_content)
+            chunks = (view[i:i + _HEADER_READ_SIZE] for i in range(0, len(view), _HEADER_READ_SIZE))
+        else:
+            raise ValueError("No valid email source provided")
+        
+        section_limit = self.limits['max_header_section_bytes']
+        header_limit = self.limits['max_header_bytes']
+        head = bytearray()
+        pending = bytearray()
+        name = ''          # lowercase name of the current header
+        header_size = 0    # bytes of the current header read so far
+        line_start = True  # whether pending starts a line
+        try:
+            # None marks the end of the message
+            for chunk in chain(chunks, [None]):
+                if chunk is not None:
+                    pending += chunk
+                pos = 0
+                while pos < len(pending):
+                    end = pending.find(b'\n', pos)
+                    if end != -1:
+                        piece = bytes(pending[pos:end + 1])
+                    elif chunk is None or len(pending) - pos >= _HEADER_READ_SIZE:
+                        # Part of a long line, or a last line without a newline
+                        piece = bytes(pending[pos:])
+                    else:
+                        break
+                    pos += len(piece)
+                    
+                    if line_start:
+                        if piece in (b'\n', b'\r\n'):
+                            # The header section ends at the first empty line
+                            return bytes(head)
+                        if piece[:1] not in (b' ', b'\t'):
+                            name = str(piece.split(b':', 1)[0], 'ascii', 'replace').strip().lower()
+                            header_size = 0
+                    
+                    header_size += len(piece)
+                    keep = len(piece)
+                    if header_limit is not None and header_size > header_limit:
+                        keep = max(header_limit - (header_size - len(piece)), 0)
+                        self._cut_headers.add(name)
+                        self._truncate(name.replace('-', '_'), 'max_header_bytes')
+                    
+                    if section_limit is not None and len(head) + keep > section_limit:
+                        # Keep the complete lines within the limit
+                        del head[head.rfind(b'\n') + 1:]
+                        self._truncate('headers', 'max_header_section_bytes')
+                        return bytes(head)
+                    
+                    head += piece[:keep]
+                    line_start = piece.endswith(b'\n')
+                    if line_start and keep < len(piece) and head[-1:] != b'\n':
+                        # End the cut header where its line ends
+                        head += b'\n'
+                del pending[:pos]
+        finally:
+            if f is not None:
+                f.close()
+        return bytes(head)
+
+    def _load_headers(self) -> email.message.Message:
+        """Parse the header section of the email; the body is not loaded."""
+        text = str(self._read_header_section(), 'ascii', 'surrogateescape')
+        return Parser(policy=default).parsestr(text, headersonly=True)
+
+    def _parse_header(self, msg: email.message.Message, name: str, value: str):
+        """Parse a raw header value; a cut address list ends at its last whole entry."""
+        if name.lower() in self._cut_headers and name.lower() in _ADDRESS_HEADERS:
+            cut = value.rfind(',')
+            if cut > 0:
+                value = value[:cut]
+        return msg.policy.header_fetch_parse(name, value)
+
+    def _get_header(self, msg: email.message.Message, name: str):
+        """Get the first header called name like msg.get(name, '')."""
+        lower = name.lower()
+        for key, value in msg.raw_items():
+            if key.lower() == lower:
+                return self._parse_header(msg, key, value)
+        return ''
+
+    def _inventory_attachments(self, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """List the attachments of the email without decoding them in memory."""
+        if self.email_path and os.path.exists(self.email_path):
+            source = self.email_path
+        else:
+            source = self.email_content
+        attachments, truncated = attachment_inventory.scan_attachments_with_limits(
+            source, deadline=deadline,
+            max_depth=self.limits['max_mime_depth'],
+            max_attachments=self.limits['max_attachments'],
+            max_header_section_bytes=self.limits['max_header_section_bytes']
+        )
+        if truncated:
+            self._truncate('attachments', truncated)
+        return attachments
+
     def _parse_received_headers(self, msg: email.message.Message) -> List[str]:
-        """Extract all 'Received' headers as they contain routing information."""
+        """Extract the 'Received' headers (up to max_hops) as they contain routing information."""
+        limit = self.limits['max_hops']
         received_headers = []
-        for header in msg.items():
-            if header[0].lower() == 'received':
-                received_headers.append(header[1])
+        for name, value in msg.raw_items():
+            if name.lower() == 'received':
+                if limit is not None and len(received_headers) >= limit:
+                    self._truncate('received', 'max_hops')
+                    break
+                received_headers.append(self._parse_header(msg, name, value))
         return received_headers
 
     def _extract_x_headers(self, msg: email.message.Message) -> Dict[str, str]:
-        """Extract all X-headers which often contain custom metadata."""
+        """Extract the X-headers (up to max_x_headers) which often contain custom metadata."""
+        limit = self.limits['max_x_headers']
         x_headers = {}
-        for header in msg.items():
-            if header[0].lower().startswith('x-'):
-                x_headers[header[0]] = header[1]
+        for name, value in msg.raw_items():
+            if name.lower().startswith('x-'):
+                if limit is not None and len(x_headers) >= limit and name not in x_headers:
+                    self._truncate('x_headers', 'max_x_headers')
+                    break
+                x_headers[name] = self._parse_header(msg, name, value)
         return x_headers
 
     def _extract_email_address(self, header_value: str) -> str:
         """Extract a single email address from a header value."""
         if not header_value:
             return ""
-        match = re.search(r'[\w\.-]+@[\w\.-]+', header_value)
+        match = _ADDRESS_RE.search(header_value)
         return match.group(0) if match else ""
 
-    def _extract_email_addresses(self, header_value: str) -> List[str]:
-        """Extract all email addresses from a header value."""
+    def _extract_email_addresses(self, header_value: str, field: str = None) -> List[str]:
+        """Extract the email addresses (up to max_addresses) from a header value."""
         if not header_value:
             return []
-        return re.findall(r'[\w\.-]+@[\w\.-]+', header_value)
+        limit = self.limits['max_addresses']
+        matches = _ADDRESS_RE.finditer(header_value)
+        if limit is None:
+            return [match.group(0) for match in matches]
+        addresses = [match.group(0) for match in islice(matches, limit + 1)]
+        if len(addresses) > limit:
+            del addresses[limit:]
+            self._truncate(field or 'addresses', 'max_addresses')
+        return addresses
 
     def _extract_ip_addresses(self, received_headers: List[str]) -> List[str]:
-        """Extract IP addresses from received headers."""
+        """Extract IP addresses (up to max_ip_addresses) from received headers."""
+        limit = self.limits['max_ip_addresses']
         ip_addresses = []
-        ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
         
         for header in received_headers:
-            ips = re.findall(ip_pattern, header)
-            ip_addresses.extend(ips)
+            for match in _IP_RE.finditer(header):
+                address = match.group(0)
+                if ':' in address:
+                    try:
+                        address = str(ipaddress.IPv6Address(address))
+                    except ValueError:
+                        continue
+                if limit is not None and len(ip_addresses) >= limit:
+                    self._truncate('ip_addresses', 'max_ip_addresses')
+                    return ip_addresses
+                ip_addresses.append(address)
             
         return ip_addresses
 
@@ -316,39 +571,123 @@ class EmailMetadataExtractor:
             # Ensure metadata has been extracted
             if not hasattr(self, 'metadata') or not self.metadata:
                 self.extract_metadata()
-                
-            # Get required fields for database
-            message_id = self.metadata.get('message_id', '')
-            sender = self.metadata.get('from', '')
-            recipient = self.metadata.get('to', '')
-            subject = self.metadata.get('subject', '')
-            date = self.metadata.get('date', '')
             
-            # Convert metadata to JSON string
-            metadata_json = self.to_json()
+            return save_metadata_batch([self.metadata])[0]
+        except Exception as e:
+            print(f"Error saving to database: {e}")
+            return None
+
+
+def save_metadata_batch(metadata_list: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Save the metadata of many emails to the database in a single transaction.
+    
+    Each message also registers its domains, joins a campaign cluster, updates
+    the volume rollups and shared top-K sketches and indexes its authentication
+    verdicts and attachments. A message that fails is rolled back on its own
+    without affecting the rest of the batch.
+    With monthly partitions enabled, a batch spanning more months than can be
+    attached at once is written in one transaction per group of months.
+    
+    Args:
+        metadata_list: Metadata dicts as returned by extract_metadata()
+        
+    Returns:
+        List[Optional[int]]: The ID of each metadata record, or None for messages that failed
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+    metadata_ids = [None] * len(metadata_list)
+    
+    date_epochs = [
+        metadata.get('date_epoch') if metadata.get('date_epoch') is not None
+        else parse_date_header(str(metadata.get('date', '')))
+        for metadata in metadata_list
+    ]
+    
+    try:
+        batches = database_config.partition_batches(
+            cursor, [(metadata.get('message_id', ''), date_epoch)
+                     for metadata, date_epoch in zip(metadata_list, date_epochs)]
+        )
+    except Exception as e:
+        print(f"Error saving metadata batch: {e}")
+        conn.close()
+        return metadata_ids
+    
+    try:
+        for indexes, partitions in batches:
+            if len(batches) > 1:
+                database_config.detach_partitions(cursor)
+            database_config.attach_partitions(cursor, partitions)
             
-            # Save to database using the database_config module
-            metadata_id = database_config.save_email_metadata(
-                message_id, sender, recipient, subject, date, metadata_json
+            try:
+                # Take the write lock up front so concurrent writers wait on the busy
+                # timeout; upgrading a read transaction later could fail immediately
+                cursor.execute("BEGIN IMMEDIATE")
+                for index in indexes:
+                    metadata_ids[index] = _save_message(cursor, metadata_list[index], date_epochs[index])
+                conn.commit()
+            except Exception as e:
+                print(f"Error saving metadata batch: {e}")
+                conn.rollback()
+                for index in indexes:
+                    metadata_ids[index] = None
+        
+        return metadata_ids
+    finally:
+        conn.close()
+
+
+def _save_message(cursor: sqlite3.Cursor, metadata: Dict[str, Any],
+                  date_epoch: Optional[int]) -> Optional[int]:
+    """Save one message inside a save_metadata_batch() transaction; returns None if it failed."""
+    cursor.execute("SAVEPOINT save_message")
+    try:
+        if 'auth_verdicts' not in metadata:
+            metadata['auth_verdicts'] = auth_results.extract_verdicts(metadata)
+        
+        metadata_id = database_config.insert_email_metadata(
+            cursor,
+            metadata.get('message_id', ''),
+            metadata.get('from', ''),
+            metadata.get('to', ''),
+            metadata.get('subject', ''),
+            metadata.get('date', ''),
+            json.dumps(metadata, indent=2, default=str),
+            date_epoch
+        )
+        
+        if metadata_id:
+            # Add domains that are not in the database yet with placeholder data
+            for domain in metadata.get('domains', []):
+                database_config.ensure_domain(cursor, domain)
+            
+            # Group near-duplicate campaign mail
+            metadata['campaign_cluster_id'] = campaign_clustering.add_message(
+                cursor, metadata_id, metadata
             )
             
-            # If successful, also save any domains and related emails found
-            if metadata_id:
-                # Extract domains from email addresses
-                domains = self.metadata.get('domains', [])
-                
-                # For each domain, check if it exists in the database
-                for domain in domains:
-                    domain_info = database_config.search_domain_info(domain)
-                    if not domain_info:  # Domain doesn't exist, add it
-                        # In a real application, you might want to fetch real domain info
-                        # For now, we'll just add the domain with placeholder data
-                        domain_id = database_config.add_or_update_domain(domain)
+            # Update the hourly and daily volume rollups
+            volume_rollups.add_message(cursor, metadata_id, metadata)
             
-            return metadata_id
-        except Exception as e:
-            print(f"Error saving to database: {e}")
-            return None
+            # Count the message in the top-K sketches shared by all processes
+            streaming_analytics.add_message(cursor, metadata)
+            
+            # Index the authentication verdicts
+            auth_results.insert_verdicts(cursor, metadata_id, metadata['auth_verdicts'])
+            
+            # Index the attachment inventory
+            attachment_inventory.insert_attachments(
+                cursor, metadata_id, metadata.get('attachments') or []
+            )
+        
+        cursor.execute("RELEASE save_message")
+        return metadata_id
+    except Exception as e:
+        print(f"Error saving email metadata: {e}")
+        cursor.execute("ROLLBACK TO save_message")
+        cursor.execute("RELEASE save_message")
+        return None
 
 
 def main():
@@ -359,6 +698,8 @@ def main():
     parser.add_argument('--discover', '-d', action='store_true', help='Discover alternate emails')
     parser.add_argument('--modify', '-m', nargs=2, metavar=('ORIGINAL', 'NEW'), help='Modify alternate email')
     parser.add_argument('--save-to-db', '-s', action='store_true', help='Save extracted metadata to database')
+    parser.add_argument('--profile', nargs='?', const='email_metadata_profile', metavar='PREFIX',
+                        help='Profile the run and write PREFIX.prof, PREFIX.folded (flame graph) and PREFIX.txt')
     
     args = parser.parse_args()
     
@@ -368,23 +709,30 @@ def main():
         return
     
     extractor = EmailMetadataExtractor(email_path=args.email)
+    profiler = profiling.Profiler() if args.profile else None
+    if profiler:
+        profiler.start()
     
     try:
-        metadata = extractor.extract_metadata()
+        size = os.path.getsize(args.email) if os.path.exists(args.email) else 0
+        with profiling.stage('extract'), profiling.message(args.email, size):
+            metadata = extractor.extract_metadata()
         print("Metadata extracted successfully")
         
         if args.save_to_db:
-            metadata_id = extractor.save_to_database()
+            with profiling.stage('save'):
+                metadata_id = extractor.save_to_database()
             if metadata_id:
                 print(f"Metadata saved to database with ID: {metadata_id}")
             else:
                 print("Failed to save metadata to database")
         
-        if args.output:
-            extractor.save_to_file(args.output)
-            print(f"Metadata saved to {args.output}")
-        elif not args.save_to_db:
-            print(extractor.to_json())
+        with profiling.stage('output'):
+            if args.output:
+                extractor.save_to_file(args.output)
+                print(f"Metadata saved to {args.output}")
+            elif not args.save_to_db:
+                print(extractor.to_json())
             
         if args.discover:
             alternates = extractor.discover_alternate_emails()
@@ -402,6 +750,12 @@ def main():
                 
     except Exception as e:
         print(f"Error: {str(e)}")
+    finally:
+        if profiler:
+            profiler.stop()
+            paths = profiler.write(args.profile)
+            print(profiler.summary(), file=sys.stderr)
+            print(f"Profile written to {', '.join(paths)}", file=sys.stderr)
 
 
 if __name__ == "__main__":
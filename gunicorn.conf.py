@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Production serving configuration for the Email Metadata Extractor server
+
+Run with:
+
+    gunicorn -c gunicorn.conf.py
+
+This starts a preforked pool of worker processes, one per CPU core by default,
+each running its own app from server.create_app(). The database schema is
+created once in the master before any worker starts. Workers share the SQLite
+database through WAL mode, where reads never wait on writes and concurrent
+writes wait for each other on the busy timeout (database_config.BUSY_TIMEOUT).
+
+Settings can be overridden with environment variables:
+    EMAIL_ANALYZER_BIND     Address to listen on (default 0.0.0.0:5000)
+    EMAIL_ANALYZER_WORKERS  Number of worker processes (default: CPU count)
+    EMAIL_ANALYZER_THREADS  Threads per worker (default 4)
+"""
+
+import os
+import multiprocessing
+
+wsgi_app = 'server:create_app(init_db=False)'
+
+bind = os.environ.get('EMAIL_ANALYZER_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('EMAIL_ANALYZER_WORKERS', multiprocessing.cpu_count()))
+
+# Threads let a worker serve searches while another request is parsing or
+# waiting on the database write lock
+worker_class = 'gthread'
+threads = int(os.environ.get('EMAIL_ANALYZER_THREADS', 4))
+
+# Parsing large uploads can take a while
+timeout = 120
+graceful_timeout = 30
+
+# Recycle workers now and then to bound memory growth from the parser caches
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Workers import the app after forking, so no SQLite handle or lock state is
+# ever inherited from the master
+preload_app = False
+
+accesslog = '-'
+
+
+def on_starting(server):
+    """Create the schema and switch the database to WAL once, before the workers start."""
+    import database_config
+    database_config.initialize_database()
+    server.log.info("Database initialized at %s", database_config.DATABASE_PATH)
+
+
+def post_fork(server, worker):
+    """Log the worker's database settings.
+
+    Database connections are opened per request. /api/top-k answers from the
+    sketches in the database, which every worker updates when it saves mail.
+    """
+    import database_config
+    server.log.info("Worker %s using %s (busy timeout %ss)",
+                    worker.pid, database_config.DATABASE_PATH, database_config.BUSY_TIMEOUT)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IP Enrichment for Email Metadata Extractor
+
+This module maps the hop IP addresses found in Received headers to their
+autonomous system (ASN and organization) and country using a locally loaded
+range file, so no network lookups are made during extraction.
+
+Supported range files:
+  - CSV with a header row, keyed either by network (CIDR) or by start/end
+    address, e.g. GeoLite2-ASN-Blocks-IPv4.csv
+    (network, autonomous_system_number, autonomous_system_organization)
+    or a file with columns start, end, asn, org, country
+  - Tab-separated ip2asn dumps without a header
+    (range_start, range_end, AS_number, country_code, AS_description)
+  - MaxMind MMDB databases, when the optional maxminddb package is installed
+
+CSV/TSV ranges are kept in two sorted arrays of start addresses (IPv4 and
+IPv6) and looked up with binary search; results are memoized per IP in an
+LRU cache, since the same relays appear in most messages. Nested or
+overlapping ranges are flattened into disjoint ones when loaded, with the
+innermost (latest starting) range winning where they overlap.
+"""
+
+import os
+import csv
+import socket
+import ipaddress
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+# Default range file, loaded on first use if it exists
+RANGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ip_ranges.csv')
+
+# Number of distinct IPs whose lookup results are memoized
+CACHE_SIZE = 65536
+
+_COLUMN_ALIASES = {
+    'network': ('network', 'cidr', 'prefix'),
+    'start': ('start', 'range_start', 'start_ip', 'ip_start', 'first'),
+    'end': ('end', 'range_end', 'end_ip', 'ip_end', 'last'),
+    'asn': ('asn', 'as_number', 'autonomous_system_number'),
+    'org': ('org', 'organization', 'as_description', 'as_name', 'autonomous_system_organization'),
+    'country': ('country', 'country_code', 'iso_code', 'country_iso_code'),
+}
+
+
+def _ip_to_int(ip: str) -> Tuple[int, int]:
+    """Convert an address to (version, integer). Raises ValueError if invalid."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except OSError:
+        raise ValueError(f"Invalid IP address: {ip}")
+
+
+def _parse_asn(value: str) -> Optional[int]:
+    value = (value or '').strip().upper()
+    if value.startswith('AS'):
+        value = value[2:]
+    try:
+        asn = int(value)
+    except ValueError:
+        return None
+    # ip2asn marks unrouted ranges with AS 0
+    return asn or None
+
+
+def _flatten(entries: List[Tuple[int, int, Any]]) -> List[Tuple[int, int, Any]]:
+    """Split (start, end, record) ranges into disjoint ones sorted by start.
+
+    Where ranges overlap, the one starting last wins (for nested ranges, the
+    innermost), and the enclosing range resumes after it ends.
+    """
+    # Enclosing ranges first when several start at the same address
+    entries.sort(key=lambda entry: (entry[0], -entry[1]))
+    flat = []
+    # Ranges that started but have not ended yet, innermost last
+    open_ranges = []
+    position = 0
+
+    def emit(end, record):
+        nonlocal position
+        if position <= end:
+            flat.append((position, end, record))
+            position = end + 1
+
+    for start, end, record in entries:
+        while open_ranges and open_ranges[-1][0] < start:
+            emit(*open_ranges.pop())
+        if open_ranges:
+            emit(start - 1, open_ranges[-1][1])
+        position = start
+        open_ranges.append((end, record))
+    while open_ranges:
+        emit(*open_ranges.pop())
+    return flat
+
+
+class IPEnricher:
+    """Sorted-range index from IP address to ASN, organization and country."""
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        """Initialize an empty index."""
+        self._starts = {4: array('L'), 6: []}
+        self._ends = {4: array('L'), 6: []}
+        self._records = {4: [], 6: []}
+        self._mmdb = None
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return len(self._records[4]) + len(self._records[6])
+
+    @classmethod
+    def from_file(cls, path: str, cache_size: int = CACHE_SIZE) -> 'IPEnricher':
+        """Build an index from a CSV/TSV range file or an MMDB database."""
+        enricher = cls(cache_size)
+        if path.endswith('.mmdb'):
+            if maxminddb is None:
+                raise ImportError("The maxminddb package is required to read MMDB files")
+            enricher._mmdb = maxminddb.open_database(path)
+        else:
+            enricher.load_ranges(path)
+        return enricher
+
+    def load_ranges(self, path: str):
+        """Load a CSV or tab-separated range file into the sorted arrays."""
+        ranges = {4: [], 6: []}
+        # Organization names repeat for every range of an AS; share the strings
+        strings = {}
+
+        with open(path, newline='', encoding='utf-8', errors='replace') as f:
+            sample = f.readline()
+            f.seek(0)
+            delimiter = '\t' if '\t' in sample else ','
+            reader = csv.reader(f, delimiter=delimiter)
+            columns = self._header_columns(next(reader, []))
+            if columns is None:
+                # Headerless ip2asn layout
+                f.seek(0)
+                reader = csv.reader(f, delimiter=delimiter)
+                columns = {'start': 0, 'end': 1, 'asn': 2, 'country': 3, 'org': 4}
+
+            for row in reader:
+                try:
+                    version, start, end = self._row_range(row, columns)
+                except (ValueError, IndexError):
+                    continue
+                record = (
+                    _parse_asn(self._field(row, columns, 'asn')),
+                    strings.setdefault(self._field(row, columns, 'org'), self._field(row, columns, 'org')),
+                    strings.setdefault(self._field(row, columns, 'country').upper(),
+                                       self._field(row, columns, 'country').upper()),
+                )
+                ranges[version].append((start, end, record))
+
+        for version, entries in ranges.items():
+            entries = _flatten(entries)
+            starts = array('L') if version == 4 else []
+            ends = array('L') if version == 4 else []
+            starts.extend(entry[0] for entry in entries)
+            ends.extend(entry[1] for entry in entries)
+            self._starts[version] = starts
+            self._ends[version] = ends
+            self._records[version] = [entry[2] for entry in entries]
+        self.lookup.cache_clear()
+
+    @staticmethod
+    def _header_columns(header: List[str]) -> Optional[Dict[str, int]]:
+        """Map a header row to column positions, or None if the file has no header."""
+        names = [name.strip().lower() for name in header]
+        columns = {}
+        for key, aliases in _COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in names:
+                    columns[key] = names.index(alias)
+                    break
+        if 'network' in columns or ('start' in columns and 'end' in columns):
+            return columns
+        return None
+
+    @staticmethod
+    def _field(row: List[str], columns: Dict[str, int], key: str) -> str:
+        index = columns.get(key)
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    def _row_range(self, row: List[str], columns: Dict[str, int]) -> Tuple[int, int, int]:
+        """Get (version, first address, last address) of a row."""
+        if 'network' in columns:
+            network = ipaddress.ip_network(self._field(row, columns, 'network'), strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        version, start = _ip_to_int(self._field(row, columns, 'start'))
+        end_version, end = _ip_to_int(self._field(row, columns, 'end'))
+        if version != end_version or end < start:
+            raise ValueError("Invalid range")
+        return version, start, end
+
+    def _lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        try:
+            version, value = _ip_to_int(ip)
+        except ValueError:
+            return None
+
+        if self._mmdb is not None:
+            return self._mmdb_record(ip)
+
+        position = bisect_right(self._starts[version], value) - 1
+        if position < 0 or value > self._ends[version][position]:
+            return None
+        asn, org, country = self._records[version][position]
+        return {'asn': asn, 'org': org, 'country': country}
+
+    def _mmdb_record(self, ip: str) -> Optional[Dict[str, Any]]:
+        record = self._mmdb.get(ip)
+        if not record:
+            return None
+        country = record.get('country') or record.get('registered_country') or {}
+        return {
+            'asn': record.get('autonomous_system_number'),
+            'org': record.get('autonomous_system_organization', ''),
+            'country': country.get('iso_code', '') if isinstance(country, dict) else str(country),
+        }
+
+    def enrich(self, ip_addresses: List[str]) -> List[Dict[str, Any]]:
+        """Look up a list of hop IPs, keeping the hop order and skipping unknown addresses."""
+        results = []
+        for ip in ip_addresses:
+            info = self.lookup(ip)
+            if info:
+                results.append(dict(info, ip=ip))
+        return results
+
+
+_enricher = None
+
+
+def load(path: str = None, cache_size: int = CACHE_SIZE) -> IPEnricher:
+    """
+    Load the range file used by enrich().
+
+    Args:
+        path (str): Path to the range file, defaults to RANGES_PATH
+        cache_size (int): Number of distinct IPs to memoize
+
+    Returns:
+        IPEnricher: The loaded index
+    """
+    global _enricher
+    _enricher = IPEnricher.from_file(path or RANGES_PATH, cache_size)
+    return _enricher
+
+
+def get_enricher() -> IPEnricher:
+    """Get the shared index, loading RANGES_PATH on first use (empty if it does not exist)."""
+    global _enricher
+    if _enricher is None:
+        if os.path.exists(RANGES_PATH):
+            try:
+                return load(RANGES_PATH)
+            except Exception as e:
+                print(f"Error loading IP ranges from {RANGES_PATH}: {e}")
+        _enricher = IPEnricher()
+    return _enricher
+
+
+def enrich(ip_addresses: List[str]) -> List[Dict[str, Any]]:
+    """
+    Map hop IPs to their ASN, organization and country.
+
+    Args:
+        ip_addresses (List[str]): IP addresses as extracted from the Received headers
+
+    Returns:
+        List[Dict[str, Any]]: One entry (ip, asn, org, country) per address found in the ranges
+    """
+    return get_enricher().enrich(ip_addresses)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Load Test for the Email Metadata Extractor server
+
+This script sends concurrent requests to a running server and reports the
+throughput (requests per second), latency percentiles and errors of each
+endpoint. Responses mentioning "database is locked" are counted separately,
+since they are the failure mode of concurrent SQLite writers.
+
+Example:
+    gunicorn -c gunicorn.conf.py &
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 32 --requests 2000 --save-to-db
+"""
+
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable
+
+import requests
+
+ENDPOINTS = ('extract-metadata', 'search-email-metadata', 'search-databases')
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """Get the calling thread's HTTP session, so connections are kept alive."""
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _make_request(endpoint: str, base_url: str, email_bytes: bytes, save_to_db: bool) -> Callable[[int], requests.Response]:
+    """Build a function that sends request number i to an endpoint."""
+    url = f"{base_url.rstrip('/')}/api/{endpoint}"
+
+    if endpoint == 'extract-metadata':
+        def send(i):
+            return _session().post(
+                url,
+                files={'file': (f'load_test_{i}.eml', email_bytes)},
+                data={'save_to_db': 'true' if save_to_db else 'false'},
+            )
+    elif endpoint == 'search-email-metadata':
+        terms = ('example', 'gmail', 'test', 'report')
+        def send(i):
+            return _session().post(url, json={'search_term': terms[i % len(terms)], 'search_type': 'sender'})
+    else:
+        domains = ('gmail.com', 'yahoo.com', 'example.com')
+        def send(i):
+            return _session().post(url, json={'domains': [domains[i % len(domains)]], 'use_real_db': True})
+    return send
+
+
+def run_endpoint(endpoint: str, base_url: str, email_bytes: bytes, concurrency: int,
+                 total: int, save_to_db: bool = False) -> Dict[str, Any]:
+    """
+    Send total requests to one endpoint from concurrency threads.
+
+    Returns:
+        Dict[str, Any]: Throughput, latency percentiles (ms) and error counts
+    """
+    send = _make_request(endpoint, base_url, email_bytes, save_to_db)
+    latencies = []
+    errors = {'http': 0, 'locked': 0, 'connection': 0}
+    lock = threading.Lock()
+
+    def worker(i):
+        start = time.perf_counter()
+        try:
+            response = send(i)
+        except requests.RequestException:
+            with lock:
+                errors['connection'] += 1
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors['http'] += 1
+                if 'database is locked' in response.text:
+                    errors['locked'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1) if latencies else None
+
+    return {
+        'endpoint': endpoint,
+        'requests': total,
+        'seconds': round(duration, 2),
+        'requests_per_second': round(total / duration, 1) if duration else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'errors': errors,
+    }
+
+
+def main():
+    """Main function to run the load test from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor server load test')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL of the server')
+    parser.add_argument('--endpoint', '-e', action='append', choices=ENDPOINTS,
+                        help='Endpoint to test (repeatable, default: all)')
+    parser.add_argument('--concurrency', '-c', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--requests', '-n', type=int, default=500, help='Requests per endpoint')
+    parser.add_argument('--email', default='sample_email.eml', help='Email file uploaded to extract-metadata')
+    parser.add_argument('--save-to-db', '-s', action='store_true', help='Save extracted metadata (tests concurrent writes)')
+
+    args = parser.parse_args()
+
+    with open(args.email, 'rb') as f:
+        email_bytes = f.read()
+
+    results: List[Dict[str, Any]] = []
+    for endpoint in args.endpoint or ENDPOINTS:
+        result = run_endpoint(endpoint, args.url, email_bytes, args.concurrency, args.requests, args.save_to_db)
+        results.append(result)
+        print(f"{endpoint:24} {result['requests_per_second']:8.1f} req/s  "
+              f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  "
+              f"errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Mail Receiver for Email Metadata Extractor
+
+This script runs a local LMTP or SMTP listener built on asyncio so a mail
+relay can hand messages to the extractor directly. Each received message is
+parsed by EmailMetadataExtractor on a worker pool and saved through the
+batched database path (save_metadata_batch). The DATA command is only
+acknowledged once the message has been persisted, and new messages wait for
+room in a bounded queue, so a slow database pushes back on the sending relay
+instead of growing memory without bound.
+"""
+
+import os
+import json
+import asyncio
+import argparse
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+import streaming_analytics
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+# Maximum accepted message size in bytes
+MAX_MESSAGE_SIZE = 25 * 1024 * 1024
+
+# Maximum line length accepted outside of DATA
+MAX_COMMAND_LENGTH = 4096
+
+
+def _extract(content: bytes) -> Dict[str, Any]:
+    """Extract metadata from raw message bytes in a worker, as plain JSON types."""
+    extractor = EmailMetadataExtractor(email_content=content)
+    extractor.extract_metadata()
+    return json.loads(extractor.to_json())
+
+
+class MailReceiver:
+    """Asyncio LMTP/SMTP listener feeding received mail to the extractor."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8024, lmtp: bool = True,
+                 workers: int = None, queue_size: int = 1000, batch_size: int = 200,
+                 executor: Optional[Executor] = None,
+                 hostname: str = 'email-metadata-extractor'):
+        """Initialize the receiver.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free port)
+            lmtp: Speak LMTP (LHLO, one reply per recipient) instead of SMTP
+            workers: Number of extraction workers, defaults to the CPU count
+            queue_size: Messages waiting for extraction before sessions block
+            batch_size: Maximum number of messages saved per transaction
+            executor: Executor for extraction, defaults to a process pool
+            hostname: Name announced in the greeting
+        """
+        self.host = host
+        self.port = port
+        self.lmtp = lmtp
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.hostname = hostname
+        self.executor = executor
+        self.stats = {'received': 0, 'saved': 0, 'failed': 0}
+        self._owns_executor = executor is None
+        self._server = None
+        self._tasks = []
+        self._extract_queue = None
+        self._save_queue = None
+        # SQLite writes happen on one dedicated thread
+        self._db_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self):
+        """Start listening and processing messages."""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._extract_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._save_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._extract_worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._save_worker()))
+        self._server = await asyncio.start_server(
+            self._handle_session, self.host, self.port, limit=MAX_COMMAND_LENGTH
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening, finish queued messages and release the worker pools."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await self._extract_queue.join()
+        await self._save_queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._owns_executor:
+            self.executor.shutdown()
+        self._db_executor.shutdown()
+
+    async def serve_forever(self):
+        """Start the receiver and run until cancelled."""
+        await self.start()
+        print(f"{'LMTP' if self.lmtp else 'SMTP'} receiver listening on {self.host}:{self.port}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def submit(self, content: bytes) -> Optional[int]:
+        """Queue a raw message and wait until it has been saved.
+
+        Blocks while the extraction queue is full, which is what applies
+        backpressure to the SMTP sessions.
+
+        Returns:
+            Optional[int]: The ID of the metadata record, or None if the message could not be saved
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.stats['received'] += 1
+        await self._extract_queue.put((content, future))
+        return await future
+
+    async def _extract_worker(self):
+        loop = asyncio.get_running_loop()
+        record_in_parent = isinstance(self.executor, ProcessPoolExecutor)
+        while True:
+            content, future = await self._extract_queue.get()
+            try:
+                metadata = await loop.run_in_executor(self.executor, _extract, content)
+                if record_in_parent:
+                    # Sketches updated in a worker process would be lost
+                    streaming_analytics.record_metadata(metadata)
+                await self._save_queue.put((metadata, future))
+            except Exception as e:
+                print(f"Error extracting received message: {e}")
+                self.stats['failed'] += 1
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self._extract_queue.task_done()
+
+    async def _save_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Save whatever has queued up while the previous batch was being written
+            batch = [await self._save_queue.get()]
+            while len(batch) < self.batch_size and not self._save_queue.empty():
+                batch.append(self._save_queue.get_nowait())
+
+            try:
+                metadata_ids = await loop.run_in_executor(
+                    self._db_executor, save_metadata_batch, [metadata for metadata, _ in batch]
+                )
+            except Exception as e:
+                print(f"Error saving received messages: {e}")
+                metadata_ids = [None] * len(batch)
+
+            for (_, future), metadata_id in zip(batch, metadata_ids):
+                self.stats['saved' if metadata_id else 'failed'] += 1
+                if not future.done():
+                    future.set_result(metadata_id)
+                self._save_queue.task_done()
+
+    async def _handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Run one SMTP/LMTP session."""
+        async def reply(*lines: str):
+            writer.write(''.join(f"{line}\r\n" for line in lines).encode('ascii'))
+            await writer.drain()
+
+        greeting_verb = 'LHLO' if self.lmtp else 'EHLO'
+        mail_from = None
+        recipients = []
+        greeted = False
+
+        try:
+            await reply(f"220 {self.hostname} {'LMTP' if self.lmtp else 'ESMTP'} ready")
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await reply("500 5.5.2 Line too long")
+                    break
+                if not line:
+                    break
+
+                command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+                command = command.upper()
+
+                if command == greeting_verb or (command == 'HELO' and not self.lmtp):
+                    greeted = True
+                    mail_from, recipients = None, []
+                    if command == 'HELO':
+                        await reply(f"250 {self.hostname}")
+                    else:
+                        await reply(f"250-{self.hostname}", "250-PIPELINING", "250-8BITMIME",
+                                    f"250-SIZE {MAX_MESSAGE_SIZE}", "250 ENHANCEDSTATUSCODES")
+                elif command == 'MAIL':
+                    if not greeted:
+                        await reply(f"503 5.5.1 Send {greeting_verb} first")
+                    else:
+                        mail_from, recipients = argument, []
+                        await reply("250 2.1.0 OK")
+                elif command == 'RCPT':
+                    if mail_from is None:
+                        await reply("503 5.5.1 Need MAIL command")
+                    else:
+                        recipients.append(argument)
+                        await reply("250 2.1.5 OK")
+                elif command == 'DATA':
+                    if not recipients:
+                        await reply("503 5.5.1 Need RCPT command")
+                        continue
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    content = await self._read_data(reader)
+                    if content is None:
+                        status = "552 5.3.4 Message too big"
+                    else:
+                        metadata_id = await self.submit(content)
+                        status = ("250 2.0.0 OK" if metadata_id
+                                  else "451 4.3.0 Message could not be processed")
+                    # LMTP reports a status for each recipient
+                    await reply(*([status] * (len(recipients) if self.lmtp else 1)))
+                    mail_from, recipients = None, []
+                elif command == 'RSET':
+                    mail_from, recipients = None, []
+                    await reply("250 2.0.0 OK")
+                elif command == 'NOOP':
+                    await reply("250 2.0.0 OK")
+                elif command == 'QUIT':
+                    await reply("221 2.0.0 Bye")
+                    break
+                else:
+                    await reply("502 5.5.2 Command not recognized")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_data(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """Read a DATA payload, undoing dot-stuffing. Returns None if it exceeds MAX_MESSAGE_SIZE."""
+        lines = []
+        size = 0
+        # Whether the next piece read starts a line; only those can be the
+        # terminator or carry a stuffed dot
+        line_start = True
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.LimitOverrunError as e:
+                # Lines longer than the stream limit are read in pieces
+                line = await reader.readexactly(e.consumed)
+            except asyncio.IncompleteReadError as e:
+                line = e.partial
+                if not line:
+                    raise ConnectionError("Connection closed during DATA")
+            if line_start:
+                if line in (b'.\r\n', b'.\n'):
+                    break
+                if line.startswith(b'.'):
+                    line = line[1:]
+            line_start = line.endswith(b'\n')
+            size += len(line)
+            if size <= MAX_MESSAGE_SIZE:
+                lines.append(line)
+        return b''.join(lines) if size <= MAX_MESSAGE_SIZE else None
+
+
+def main():
+    """Main function to run the receiver from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor LMTP/SMTP receiver')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', '-p', type=int, default=8024, help='Port to listen on')
+    parser.add_argument('--smtp', action='store_true', help='Speak SMTP instead of LMTP')
+    parser.add_argument('--workers', '-w', type=int, help='Number of extraction worker processes')
+    parser.add_argument('--queue-size', type=int, default=1000, help='Messages queued before applying backpressure')
+    parser.add_argument('--batch-size', type=int, default=200, help='Messages saved per database transaction')
+
+    args = parser.parse_args()
+
+    receiver = MailReceiver(
+        args.host, args.port, lmtp=not args.smtp, workers=args.workers,
+        queue_size=args.queue_size, batch_size=args.batch_size
+    )
+    try:
+        asyncio.run(receiver.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental Maildir/Directory Watcher for Email Metadata Extractor
+
+This script ingests new and changed message files from Maildir or plain spool
+directories. Every ingested file is checkpointed in SQLite by (path, inode,
+mtime, size), and directories whose mtime has not changed since the last pass
+are not listed again, so a steady-state pass costs time proportional to the
+new mail rather than to the size of the spool. On Linux, inotify is used to
+pick up deliveries as they happen; elsewhere the watcher falls back to
+periodic incremental scans. Maildir renames (new/ -> cur/ with flags) are
+recognized by inode and are not parsed again.
+"""
+
+import os
+import json
+import time
+import select
+import struct
+import sqlite3
+import argparse
+import ctypes
+import ctypes.util
+from typing import Dict, List, Optional, Iterable, Tuple
+
+import database_config
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+# inotify constants from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+# Directories modified more recently than this are listed again on the next
+# pass, since a coarse mtime could hide a delivery made in the same tick
+_MTIME_SETTLE_NS = 2 * 10 ** 9
+
+
+def create_watcher_tables(cursor: sqlite3.Cursor):
+    """
+    Create the checkpoint tables of the directory watcher.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        path TEXT PRIMARY KEY,
+        directory TEXT NOT NULL,
+        inode INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        metadata_id INTEGER,
+        ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingested_files_directory "
+        "ON ingested_files (directory, path, inode, mtime_ns, size)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingested_files_inode "
+        "ON ingested_files (inode, size, mtime_ns)"
+    )
+
+    # Directories whose files are all checkpointed, with the mtime they had
+    # and their subdirectories, so unchanged directories are not listed
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS watched_directories (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        subdirectories TEXT
+    )
+    ''')
+
+
+def add_subdirectories_column(cursor: sqlite3.Cursor):
+    """
+    Add the subdirectories column to a watched_directories table created without it.
+
+    Directories checkpointed before then are listed once more on the next pass.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute("PRAGMA table_info(watched_directories)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and 'subdirectories' not in columns:
+        cursor.execute("ALTER TABLE watched_directories ADD COLUMN subdirectories TEXT")
+
+
+class _Inotify:
+    """Minimal inotify binding through ctypes (Linux only)."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add_watch(self, directory: str):
+        # IN_CREATE is only acted on for directories; see MaildirWatcher._event_paths
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def read_events(self, timeout: float) -> Iterable[Tuple[str, int]]:
+        """Wait up to timeout seconds and yield (path, mask) events."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self.watches.get(wd)
+            if mask & _IN_Q_OVERFLOW:
+                yield '', mask
+            elif directory is not None:
+                yield os.path.join(directory, os.fsdecode(name)), mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class MaildirWatcher:
+    """Incremental ingestion of message files from Maildir or spool directories."""
+
+    def __init__(self, directories: List[str], batch_size: int = 200, use_inotify: bool = True):
+        """Initialize the watcher.
+
+        Args:
+            directories: Maildir or spool directories to ingest, searched recursively
+            batch_size: Messages saved per database transaction
+            use_inotify: Use inotify when available instead of only periodic scans
+        """
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.batch_size = batch_size
+        self.use_inotify = use_inotify
+
+    def _is_message_file(self, name: str) -> bool:
+        # Skip dotfiles such as lock and index files
+        return not name.startswith('.')
+
+    def _walk(self, cursor: sqlite3.Cursor, full: bool,
+              checkpoints: List[Tuple[str, int, str]]) -> Iterable[Tuple[str, os.stat_result]]:
+        """Yield candidate files from directories that changed since the last pass.
+
+        Unchanged directories are only stat()ed; their subdirectories come from
+        the checkpoint. The (directory, mtime, subdirectories) checkpoints to
+        record once the files have been ingested are appended to checkpoints.
+        """
+        pending = list(self.directories)
+        while pending:
+            directory = pending.pop()
+            try:
+                dir_stat = os.stat(directory)
+            except OSError as e:
+                print(f"Warning: cannot read {directory}: {e}")
+                continue
+
+            cursor.execute(
+                "SELECT mtime_ns, subdirectories FROM watched_directories WHERE path = ?",
+                (directory,)
+            )
+            row = cursor.fetchone()
+            if not full and row and row[0] == dir_stat.st_mtime_ns and row[1] is not None:
+                # Adding or removing a subdirectory changes the mtime too
+                pending.extend(os.path.join(directory, name) for name in json.loads(row[1]))
+                continue
+
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                print(f"Warning: cannot read {directory}: {e}")
+                continue
+
+            subdirectories = sorted(entry.name for entry in entries
+                                    if entry.is_dir(follow_symlinks=False) and entry.name != 'tmp')
+            pending.extend(os.path.join(directory, name) for name in subdirectories)
+            if time.time_ns() - dir_stat.st_mtime_ns > _MTIME_SETTLE_NS:
+                checkpoints.append((directory, dir_stat.st_mtime_ns, json.dumps(subdirectories)))
+
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and self._is_message_file(entry.name):
+                    try:
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+    def _changed(self, cursor: sqlite3.Cursor, files: Iterable[Tuple[str, os.stat_result]],
+                 by_directory: bool = True) -> List[Tuple[str, os.stat_result]]:
+        """Filter files down to those not yet ingested, recording Maildir renames.
+
+        With by_directory, the checkpoints of each directory are loaded at once,
+        which suits listed directories; otherwise each file is looked up on its
+        own, so a few event paths do not load a whole cur/ directory.
+        """
+        changed = []
+        known = {}
+        for path, st in files:
+            directory = os.path.dirname(path)
+            if not by_directory:
+                cursor.execute(
+                    "SELECT inode, mtime_ns, size FROM ingested_files WHERE path = ?",
+                    (path,)
+                )
+                row = cursor.fetchone()
+                checkpoint = tuple(row) if row else None
+            else:
+                if directory not in known:
+                    cursor.execute(
+                        "SELECT path, inode, mtime_ns, size FROM ingested_files WHERE directory = ?",
+                        (directory,)
+                    )
+                    known[directory] = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+                checkpoint = known[directory].get(path)
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if checkpoint == signature:
+                continue
+
+            # A file that was only renamed keeps its inode, mtime and size
+            cursor.execute(
+                """SELECT path FROM ingested_files
+                   WHERE inode = ? AND size = ? AND mtime_ns = ?""",
+                (st.st_ino, st.st_size, st.st_mtime_ns)
+            )
+            moved = next((row[0] for row in cursor.fetchall() if not os.path.exists(row[0])), None)
+            if moved:
+                cursor.execute(
+                    "UPDATE ingested_files SET path = ?, directory = ? WHERE path = ?",
+                    (path, directory, moved)
+                )
+                continue
+
+            changed.append((path, st))
+        return changed
+
+    def _ingest(self, files: List[Tuple[str, os.stat_result]],
+                failed_directories: Optional[set] = None) -> Dict[str, int]:
+        """Extract, save and checkpoint files in batches.
+
+        The directories of files that failed are added to failed_directories.
+        """
+        stats = {'ingested': 0, 'failed': 0}
+        if failed_directories is None:
+            failed_directories = set()
+        for start in range(0, len(files), self.batch_size):
+            batch = []
+            for path, st in files[start:start + self.batch_size]:
+                try:
+                    batch.append((path, st, EmailMetadataExtractor(email_path=path).extract_metadata()))
+                except Exception as e:
+                    print(f"Error extracting {path}: {e}")
+                    stats['failed'] += 1
+                    failed_directories.add(os.path.dirname(path))
+            if not batch:
+                continue
+
+            metadata_ids = save_metadata_batch([metadata for _, _, metadata in batch])
+
+            conn = database_config.get_db_connection()
+            try:
+                conn.executemany(
+                    """INSERT OR REPLACE INTO ingested_files
+                       (path, directory, inode, mtime_ns, size, metadata_id)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    [(path, os.path.dirname(path), st.st_ino, st.st_mtime_ns, st.st_size, metadata_id)
+                     for (path, st, _), metadata_id in zip(batch, metadata_ids) if metadata_id]
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+            failed_directories.update(os.path.dirname(path) for (path, _, _), metadata_id
+                                      in zip(batch, metadata_ids) if not metadata_id)
+            saved = sum(1 for metadata_id in metadata_ids if metadata_id)
+            stats['ingested'] += saved
+            stats['failed'] += len(batch) - saved
+        return stats
+
+    def scan(self, full: bool = False) -> Dict[str, int]:
+        """Run one incremental pass over the watched directories.
+
+        Args:
+            full: List every directory even if its mtime is unchanged, to catch
+                  files modified in place
+
+        Returns:
+            Dict[str, int]: Counts of ingested and failed files
+        """
+        checkpoints = []
+        conn = database_config.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            changed = self._changed(cursor, list(self._walk(cursor, full, checkpoints)))
+            conn.commit()
+        finally:
+            conn.close()
+
+        failed_directories = set()
+        stats = self._ingest(changed, failed_directories)
+
+        # Only skip these directories next time once all their files are
+        # checkpointed, so files that failed are retried on the next pass
+        conn = database_config.get_db_connection()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO watched_directories (path, mtime_ns, subdirectories) VALUES (?, ?, ?)",
+                [checkpoint for checkpoint in checkpoints if checkpoint[0] not in failed_directories]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return stats
+
+    def ingest_paths(self, paths: Iterable[str]) -> Dict[str, int]:
+        """Ingest specific files (e.g. from inotify events) if they are new or changed."""
+        files = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path) and self._is_message_file(os.path.basename(path)):
+                files.append((path, st))
+
+        conn = database_config.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            changed = self._changed(cursor, files, by_directory=False)
+            conn.commit()
+        finally:
+            conn.close()
+        return self._ingest(changed)
+
+    def _event_paths(self, inotify: _Inotify, events: Iterable[Tuple[str, int]]) -> Optional[set]:
+        """Get the files to ingest from inotify events, or None if the event queue overflowed.
+
+        Files are only picked up once written (IN_CLOSE_WRITE) or moved in
+        (IN_MOVED_TO), since a file created in place may still be empty or
+        half-written; IN_CREATE only serves to watch new subdirectories.
+        """
+        paths = set()
+        for path, mask in events:
+            if not path:
+                return None
+            if mask & _IN_ISDIR:
+                if os.path.basename(path) != 'tmp':
+                    try:
+                        inotify.add_watch(path)
+                    except OSError:
+                        continue
+            elif (mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO)
+                  and os.path.basename(os.path.dirname(path)) != 'tmp'):
+                paths.add(path)
+        return paths
+
+    def run(self, interval: float = 300, max_passes: Optional[int] = None):
+        """Ingest continuously, using inotify when available.
+
+        Args:
+            interval: Seconds between reconciliation scans (the only pickup
+                      mechanism when inotify is unavailable)
+            max_passes: Stop after this many scans, mainly for testing
+        """
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify()
+                for directory in self.directories:
+                    for root, dirs, _ in os.walk(directory):
+                        dirs[:] = [d for d in dirs if d != 'tmp']
+                        inotify.add_watch(root)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}), falling back to periodic scans")
+                if inotify:
+                    inotify.close()
+                inotify = None
+
+        passes = 0
+        try:
+            while True:
+                stats = self.scan()
+                passes += 1
+                if stats['ingested'] or stats['failed']:
+                    print(f"Ingested {stats['ingested']} files, {stats['failed']} failed")
+                if max_passes is not None and passes >= max_passes:
+                    break
+
+                next_scan = time.monotonic() + interval
+                while inotify and time.monotonic() < next_scan:
+                    paths = self._event_paths(
+                        inotify, inotify.read_events(min(1.0, max(next_scan - time.monotonic(), 0)))
+                    )
+                    if paths is None:
+                        # Events were lost; reconcile with a scan
+                        break
+                    if paths:
+                        self.ingest_paths(sorted(paths))
+                if not inotify:
+                    time.sleep(max(next_scan - time.monotonic(), 0))
+        finally:
+            if inotify:
+                inotify.close()
+
+
+def main():
+    """Main function to run the watcher from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor - incremental directory ingestion')
+    parser.add_argument('directories', nargs='+', help='Maildir or spool directories to ingest')
+    parser.add_argument('--once', action='store_true', help='Run a single incremental pass and exit')
+    parser.add_argument('--full-rescan', action='store_true', help='List every directory, even unchanged ones')
+    parser.add_argument('--interval', '-i', type=float, default=300, help='Seconds between reconciliation scans')
+    parser.add_argument('--no-inotify', action='store_true', help='Only use periodic scans')
+
+    args = parser.parse_args()
+
+    watcher = MaildirWatcher(args.directories, use_inotify=not args.no_inotify)
+    if args.once or args.full_rescan:
+        stats = watcher.scan(full=args.full_rescan)
+        print(f"Ingested {stats['ingested']} files, {stats['failed']} failed")
+        return
+
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Memory-Mapped Mbox Reader for Email Metadata Extractor
+
+This module reads large mbox archives through mmap instead of the standard
+mailbox module. Message boundaries ("From " lines) are found in a single pass
+and saved to a sidecar offset index (<mbox>.idx), so re-opening an archive
+and fetching message N is a lookup instead of a rescan. When the archive has
+only been appended to, the index is extended from its last offset. Messages
+are handed to the parser as memoryview slices of the mapping, and archives can
+be split by message or byte range between parallel workers.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import argparse
+import contextlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+import profiling
+from columnar_export import ColumnarWriter
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+# Sidecar index layout: magic, mbox size, mbox mtime (ns), then one
+# native-endian unsigned 64-bit start offset per message
+INDEX_MAGIC = b'MBOXIDX1'
+_INDEX_HEADER = struct.Struct('=8sQQ')
+
+_BOUNDARY = b'\nFrom '
+
+
+class MboxReader:
+    """Random access to the messages of an mbox file through mmap."""
+
+    def __init__(self, path: str, index_path: str = None, use_index: bool = True):
+        """Open an mbox file and load or build its offset index.
+
+        Args:
+            path: Path to the mbox file
+            index_path: Path to the sidecar index, defaults to <path>.idx
+            use_index: Whether to read and write the sidecar index
+        """
+        self.path = path
+        self.index_path = index_path or f"{path}.idx"
+        self.use_index = use_index
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._index_file = None
+        self._index_mmap = None
+        self.offsets = self._load_index() if use_index else None
+        if self.offsets is None:
+            self.offsets = self._scan(array('Q'), 0)
+            if use_index:
+                self._write_index(self.offsets)
+
+    def close(self):
+        """Release the mappings and file handles."""
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        for resource in (self._index_mmap, self._index_file, self._mmap, self._file):
+            if resource is None:
+                continue
+            try:
+                resource.close()
+            except BufferError:
+                # A message memoryview is still alive; the mapping is released with it
+                pass
+        self._index_mmap = self._index_file = self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _scan(self, offsets: array, start: int) -> array:
+        """Append the start offset of every message at or after start."""
+        if not self._mmap:
+            return offsets
+        if start == 0 and self._mmap[:5] == b'From ':
+            offsets.append(0)
+        position = self._mmap.find(_BOUNDARY, max(start - 1, 0))
+        while position != -1:
+            offsets.append(position + 1)
+            position = self._mmap.find(_BOUNDARY, position + 1)
+        return offsets
+
+    def _load_index(self) -> Optional[Any]:
+        """Load the sidecar index, extending it if the mbox has grown. Returns None if unusable."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, size, mtime_ns = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != INDEX_MAGIC or size > self.size:
+            return None
+
+        if size == self.size and mtime_ns == self.mtime_ns:
+            # Map the offsets directly, without reading them into memory
+            self._index_file = open(self.index_path, 'rb')
+            self._index_mmap = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._index_mmap)[_INDEX_HEADER.size:].cast('Q')
+
+        # The mbox has changed. If it was only appended to, the indexed part is
+        # unchanged and scanning can resume from the last indexed message.
+        offsets = array('Q')
+        try:
+            with open(self.index_path, 'rb') as f:
+                f.seek(_INDEX_HEADER.size)
+                offsets.frombytes(f.read())
+        except (OSError, ValueError):
+            return None
+        if offsets and self._mmap[offsets[-1]:offsets[-1] + 5] != b'From ':
+            return None
+        resume = offsets.pop() if offsets else 0
+        offsets = self._scan(offsets, resume) if resume else self._scan(array('Q'), 0)
+        self._write_index(offsets)
+        return offsets
+
+    def _write_index(self, offsets: array):
+        """Write the sidecar index atomically."""
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(INDEX_MAGIC, self.size, self.mtime_ns))
+                f.write(offsets.tobytes())
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Warning: could not write mbox index {self.index_path}: {e}")
+
+    def get_bytes(self, index: int) -> memoryview:
+        """Get message index as a zero-copy memoryview, without its "From " envelope line."""
+        if index < 0:
+            index += len(self.offsets)
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        body_start = self._mmap.find(b'\n', start, end) + 1 or end
+        # Drop the line break that separates this message from the next envelope line
+        if end < self.size or self._mmap[end - 1:end] == b'\n':
+            end -= 1
+            if self._mmap[end - 1:end] == b'\r':
+                end -= 1
+        return memoryview(self._mmap)[body_start:max(end, body_start)]
+
+    def get_extractor(self, index: int) -> EmailMetadataExtractor:
+        """Get an EmailMetadataExtractor for message index."""
+        return EmailMetadataExtractor(email_content=self.get_bytes(index))
+
+    def iter_range(self, start: int = 0, end: int = None) -> Iterator[Tuple[int, memoryview]]:
+        """Iterate over (index, message bytes) for messages start <= index < end."""
+        end = len(self.offsets) if end is None else min(end, len(self.offsets))
+        for index in range(start, end):
+            yield index, self.get_bytes(index)
+
+    def index_range_for_bytes(self, start_offset: int, end_offset: int) -> Tuple[int, int]:
+        """Get the message index range of the messages starting within a byte range."""
+        return bisect_left(self.offsets, start_offset), bisect_left(self.offsets, end_offset)
+
+    def partition(self, parts: int) -> List[Tuple[int, int]]:
+        """Split the archive into contiguous index ranges of roughly equal byte size."""
+        if not len(self.offsets):
+            return []
+        bounds = [bisect_left(self.offsets, self.size * i // parts) for i in range(parts)]
+        bounds.append(len(self.offsets))
+        return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+
+def extract_range(path: str, start: int, end: int, save_to_db: bool = False,
+                  batch_size: int = 500, export_path: str = None) -> Dict[str, Any]:
+    """
+    Extract the metadata of a range of messages from an mbox file.
+
+    Runs in worker processes; each opens the mbox and its index itself.
+
+    Args:
+        path: Path to the mbox file
+        start: First message index
+        end: Message index to stop before
+        save_to_db: Save the metadata through save_metadata_batch()
+        batch_size: Messages per database transaction
+        export_path: Also write the metadata to this columnar file (see columnar_export.py)
+
+    Returns:
+        Dict[str, Any]: Counts of extracted, saved and failed messages
+    """
+    stats = {'extracted': 0, 'saved': 0, 'failed': 0}
+    batch = []
+    writer = ColumnarWriter(export_path) if export_path else None
+
+    def flush():
+        if batch:
+            with profiling.stage('save'):
+                ids = save_metadata_batch(batch)
+            stats['saved'] += sum(1 for metadata_id in ids if metadata_id)
+            stats['failed'] += sum(1 for metadata_id in ids if not metadata_id)
+            if writer:
+                # Exported after saving, so rows carry their campaign cluster
+                with profiling.stage('export'):
+                    writer.write_many(batch)
+            batch.clear()
+
+    with MboxReader(path) as reader, writer or contextlib.nullcontext():
+        for index, content in reader.iter_range(start, end):
+            try:
+                with profiling.stage('extract'), profiling.message(f"{path}#{index}", len(content)):
+                    metadata = EmailMetadataExtractor(email_content=content).extract_metadata()
+                stats['extracted'] += 1
+            except Exception as e:
+                print(f"Error extracting message {index}: {e}")
+                stats['failed'] += 1
+                continue
+            finally:
+                content.release()
+            if save_to_db:
+                batch.append(metadata)
+                if len(batch) >= batch_size:
+                    flush()
+            elif writer:
+                with profiling.stage('export'):
+                    writer.write(metadata)
+        flush()
+
+    return stats
+
+
+def main():
+    """Main function to process an mbox archive from command line."""
+    parser = argparse.ArgumentParser(description='Email Metadata Extractor - mbox archives')
+    parser.add_argument('mbox', help='Path to the mbox file')
+    parser.add_argument('--message', '-n', type=int, help='Print the metadata of message N only')
+    parser.add_argument('--index-only', action='store_true', help='Build or update the offset index and exit')
+    parser.add_argument('--save-to-db', '-s', action='store_true', help='Save extracted metadata to database')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--export', metavar='FILE',
+                        help='Write the metadata to a .parquet, .arrow or .csv file '
+                             '(one FILE-NNNN part per worker with --workers)')
+    parser.add_argument('--profile', nargs='?', const='mbox_profile', metavar='PREFIX',
+                        help='Profile the run and write PREFIX.prof, PREFIX.folded (flame graph) and PREFIX.txt')
+
+    args = parser.parse_args()
+
+    if args.profile and args.workers > 1:
+        # Worker processes cannot be profiled from here
+        print("Profiling runs in a single process; ignoring --workers", file=sys.stderr)
+        args.workers = 1
+
+    with MboxReader(args.mbox) as reader:
+        count = len(reader)
+        if args.index_only:
+            print(f"Indexed {count} messages in {args.mbox}")
+            return
+        if args.message is not None:
+            if not -count <= args.message < count:
+                print(f"Error: message {args.message} out of range (0-{count - 1})")
+                sys.exit(1)
+            extractor = reader.get_extractor(args.message)
+            extractor.extract_metadata()
+            print(extractor.to_json())
+            return
+        ranges = reader.partition(max(args.workers, 1))
+
+    # Each worker writes its own part of the export
+    if not args.export:
+        export_paths = [None] * len(ranges)
+    elif len(ranges) == 1:
+        export_paths = [args.export]
+    else:
+        stem, extension = os.path.splitext(args.export)
+        export_paths = [f"{stem}-{i:04d}{extension}" for i in range(len(ranges))]
+    jobs = [(args.mbox, lo, hi, args.save_to_db, 500, export_path)
+            for (lo, hi), export_path in zip(ranges, export_paths)]
+
+    totals = {'extracted': 0, 'saved': 0, 'failed': 0}
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(extract_range, *job) for job in jobs]
+            results = [future.result() for future in futures]
+    elif args.profile:
+        with profiling.Profiler() as profiler:
+            results = [extract_range(*job) for job in jobs]
+        paths = profiler.write(args.profile)
+        print(profiler.summary(), file=sys.stderr)
+        print(f"Profile written to {', '.join(paths)}", file=sys.stderr)
+    else:
+        results = [extract_range(*job) for job in jobs]
+
+    for result in results:
+        for key in totals:
+            totals[key] += result[key]
+    print(f"Processed {count} messages: {totals['extracted']} extracted, "
+          f"{totals['saved']} saved, {totals['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Profiling for Email Metadata Extractor
+
+This module profiles extraction runs without changing the code being
+profiled. A Profiler combines:
+
+  - cProfile, whose statistics are written as a .prof file that pstats,
+    snakeviz or gprof2dot can read
+  - a sampling thread that records the profiled thread's stack every few
+    milliseconds, written as folded stacks (.folded) for flamegraph.pl,
+    speedscope or inferno
+  - wall times of named stages (e.g. extract, save) and of each message,
+    summarized with the extraction steps and the slowest messages in a .txt
+    report
+
+Code marks stages and messages with the module-level stage() and message()
+context managers. They apply to the profiler running on the calling thread
+and do nothing when there is none, so they can stay in place permanently.
+
+Example:
+    profiler = Profiler()
+    with profiler:
+        with profiling.stage('extract'), profiling.message('sample.eml', size):
+            extractor.extract_metadata()
+    profiler.write('profile')   # profile.prof, profile.folded, profile.txt
+"""
+
+import io
+import os
+import sys
+import time
+import heapq
+import pstats
+import cProfile
+import threading
+import contextlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Optional, Tuple
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Number of slowest messages kept for the summary
+SLOWEST_MESSAGES = 20
+
+# Extraction steps reported in the summary: (label, file name, function name).
+# Their times are the cumulative times cProfile measured for the functions.
+EXTRACTION_STEPS = (
+    ('parse', 'email_metadata_extractor.py', '_load_headers'),
+    ('received headers', 'email_metadata_extractor.py', '_parse_received_headers'),
+    ('addresses', 'email_metadata_extractor.py', '_extract_email_addresses'),
+    ('ip addresses', 'email_metadata_extractor.py', '_extract_ip_addresses'),
+    ('ip enrichment', 'ip_enrichment.py', 'enrich'),
+    ('domains', 'email_metadata_extractor.py', '_extract_domains'),
+    ('auth verdicts', 'auth_results.py', 'extract_verdicts'),
+    ('attachments', 'email_metadata_extractor.py', '_inventory_attachments'),
+    ('analytics', 'streaming_analytics.py', 'record_metadata'),
+    ('save', 'email_metadata_extractor.py', 'save_metadata_batch'),
+)
+
+_local = threading.local()
+
+
+class Profiler:
+    """cProfile statistics, sampled stacks and stage/message timings of one thread."""
+
+    def __init__(self, sample_interval: float = SAMPLE_INTERVAL, slowest: int = SLOWEST_MESSAGES):
+        """Initialize an idle profiler.
+
+        Args:
+            sample_interval: Seconds between stack samples, 0 to disable sampling
+            slowest: Number of slowest messages kept
+        """
+        self.sample_interval = sample_interval
+        self.slowest = slowest
+        self.stage_times = defaultdict(float)
+        self.stage_counts = Counter()
+        self.samples = Counter()
+        self.messages = 0
+        self.message_bytes = 0
+        self.message_seconds = 0.0
+        self.elapsed = 0.0
+        self._slowest = []  # min-heap of (seconds, order, label, size)
+        self._stages = []
+        self._profile = cProfile.Profile()
+        self._thread_id = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._started = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start profiling the calling thread."""
+        if getattr(_local, 'profiler', None) is not None:
+            raise RuntimeError("A profiler is already running on this thread")
+        _local.profiler = self
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        if self.sample_interval > 0:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+        self._profile.enable()
+
+    def stop(self):
+        """Stop profiling."""
+        if getattr(_local, 'profiler', None) is not self:
+            return
+        self._profile.disable()
+        self.elapsed += time.perf_counter() - self._started
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        _local.profiler = None
+
+    def _sample(self):
+        """Record the folded stack of the profiled thread until stopped."""
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Stages are roots, so each stage is one tower of the flame graph
+            stages = list(self._stages) or ['(no stage)']
+            self.samples[';'.join(stages + names[::-1])] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time a named stage; stages may nest."""
+        self._stages.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages.pop()
+            self.stage_times[name] += time.perf_counter() - started
+            self.stage_counts[name] += 1
+
+    @contextlib.contextmanager
+    def message(self, label: str, size: int):
+        """Time the processing of one message."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_message(label, size, time.perf_counter() - started)
+
+    def record_message(self, label: str, size: int, seconds: float):
+        """Record the processing time of one message."""
+        self.messages += 1
+        self.message_bytes += size or 0
+        self.message_seconds += seconds
+        entry = (seconds, self.messages, label, size)
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def slowest_messages(self) -> List[Dict[str, Any]]:
+        """Get the slowest messages, slowest first."""
+        return [{'message': label, 'size': size, 'seconds': seconds}
+                for seconds, _, label, size in sorted(self._slowest, reverse=True)]
+
+    def stats(self) -> pstats.Stats:
+        """Get the cProfile statistics."""
+        return pstats.Stats(self._profile, stream=io.StringIO())
+
+    def extraction_steps(self) -> List[Tuple[str, int, float]]:
+        """Get (step, calls, cumulative seconds) of the EXTRACTION_STEPS that ran."""
+        totals = {}
+        for (filename, _, function), (_, calls, _, cumulative, _) in self.stats().stats.items():
+            totals[(os.path.basename(filename), function)] = (calls, cumulative)
+        return [(label, *totals[(filename, function)])
+                for label, filename, function in EXTRACTION_STEPS if (filename, function) in totals]
+
+    def summary(self, limit: int = 15) -> str:
+        """Get a text report of the stages, extraction steps, hot functions and slowest messages."""
+        out = io.StringIO()
+        out.write(f"Profiled {self.elapsed:.3f}s, {self.messages} messages "
+                  f"({self.message_bytes} bytes), {sum(self.samples.values())} stack samples\n")
+
+        if self.stage_times:
+            out.write("\nStages:\n")
+            for name, seconds in sorted(self.stage_times.items(), key=lambda item: -item[1]):
+                out.write(f"  {name:24} {seconds:10.4f}s  {self.stage_counts[name]:8} calls\n")
+
+        steps = self.extraction_steps()
+        if steps:
+            out.write("\nExtraction steps (cumulative):\n")
+            for label, calls, seconds in steps:
+                out.write(f"  {label:24} {seconds:10.4f}s  {calls:8} calls\n")
+
+        if self._slowest:
+            out.write("\nSlowest messages:\n")
+            for entry in self.slowest_messages():
+                out.write(f"  {entry['seconds']:10.4f}s  {entry['size']:>10} bytes  {entry['message']}\n")
+
+        out.write(f"\nTop {limit} functions by own time:\n")
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats('tottime').print_stats(limit)
+        return out.getvalue()
+
+    def write(self, prefix: str) -> List[str]:
+        """
+        Write prefix.prof (pstats), prefix.folded (flame graph input) and prefix.txt (summary).
+
+        Returns:
+            List[str]: The paths written
+        """
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        paths = [f"{prefix}.prof", f"{prefix}.folded", f"{prefix}.txt"]
+        self._profile.dump_stats(paths[0])
+        with open(paths[1], 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(paths[2], 'w', encoding='utf-8') as f:
+            f.write(self.summary())
+        return paths
+
+
+def current() -> Optional[Profiler]:
+    """Get the profiler running on the calling thread, if any."""
+    return getattr(_local, 'profiler', None)
+
+
+def stage(name: str):
+    """Time a stage with the calling thread's profiler; a no-op when not profiling."""
+    profiler = current()
+    return profiler.stage(name) if profiler is not None else contextlib.nullcontext()
+
+
+def message(label: str, size: int):
+    """Time a message with the calling thread's profiler; a no-op when not profiling."""
+    profiler = current()
+    return profiler.message(label, size) if profiler is not None else contextlib.nullcontext()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Response Caching for the Email Metadata Extractor server
+
+This module lets read-only endpoints answer repeated queries cheaply:
+
+  - A write generation counter, bumped by triggers on every change to the
+    tables the searches read, identifies the state of the database. It is
+    stored in the database itself, so every server worker process agrees on it.
+  - Responses carry an ETag derived from the generation and the query, plus a
+    Last-Modified time, so polling clients get 304 Not Modified until the data
+    changes.
+  - Identical queries against the same generation are served from a short-lived
+    in-process cache instead of being recomputed.
+  - Bodies are compressed with brotli (if the brotli package is installed) or
+    gzip, according to the client's Accept-Encoding.
+"""
+
+import gzip
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Any, Optional, Tuple
+
+from flask import Response, current_app, request
+
+import database_config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Seconds a cached response may be served for
+CACHE_TTL = 30
+
+# Maximum number of cached responses per worker process
+CACHE_SIZE = 256
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Tables whose changes invalidate cached responses: every table a cached
+# endpoint reads. campaign_lsh_buckets and volume_rollup_messages only change
+# together with campaign_signatures and volume_rollups, so they need no triggers.
+WATCHED_TABLES = ('email_metadata', 'domains', 'related_emails', 'auth_verdicts', 'attachments',
+                  'campaign_signatures', 'volume_rollups')
+
+_BUMP_GENERATION = """
+UPDATE write_generation
+SET generation = generation + 1,
+    changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+WHERE id = 1
+"""
+
+
+def create_generation_tables(cursor: sqlite3.Cursor):
+    """
+    Create the write generation counter and the triggers that bump it.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS write_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL,
+        changed_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO write_generation (id, generation, changed_at) "
+        "VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER))"
+    )
+    for table in WATCHED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_generation
+            AFTER {event} ON {table}
+            BEGIN{_BUMP_GENERATION};
+            END
+            ''')
+
+
+def bump_write_generation(cursor: sqlite3.Cursor):
+    """
+    Bump the write generation for changes the triggers do not see, such as
+    partition files being archived or removed.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database, committed by the caller
+    """
+    cursor.execute(_BUMP_GENERATION)
+
+
+def get_write_generation() -> Optional[Tuple[int, int]]:
+    """
+    Get the current write generation.
+
+    Returns:
+        Optional[Tuple[int, int]]: (generation, UTC epoch seconds of the last change),
+        or None if the database has no generation counter
+    """
+    conn = database_config.get_db_connection()
+    try:
+        row = conn.execute("SELECT generation, changed_at FROM write_generation WHERE id = 1").fetchone()
+        return (row[0], row[1]) if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of response bodies with a time to live."""
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        """Initialize an empty cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Get a live entry, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['expires'] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Tuple, body: bytes, mimetype: str) -> Dict[str, Any]:
+        """Store a response body; compressed variants are added to the entry on demand."""
+        entry = {'body': {'identity': body}, 'mimetype': mimetype, 'expires': time.monotonic() + self.ttl}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache()
+
+
+def _choose_encoding(size: int) -> str:
+    """Pick the response encoding from the request's Accept-Encoding."""
+    if size < MIN_COMPRESS_SIZE:
+        return 'identity'
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def _encoded_body(entry: Dict[str, Any], encoding: str) -> bytes:
+    bodies = entry['body']
+    if encoding not in bodies:
+        identity = bodies['identity']
+        bodies[encoding] = (brotli.compress(identity, quality=5) if encoding == 'br'
+                            else gzip.compress(identity, compresslevel=6))
+    return bodies[encoding]
+
+
+def _not_modified(etag: str, changed_at: int) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return changed_at <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_json(view):
+    """
+    Decorate a read-only JSON view with ETag/Last-Modified validation,
+    response caching and compression.
+
+    The cache key covers the path, the query string and the JSON body, so the
+    decorator works for both GET and POST searches. 304 responses are only
+    sent for GET and HEAD requests.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = get_write_generation()
+        if state is None:
+            return view(*args, **kwargs)
+        generation, changed_at = state
+
+        params = [request.path, request.args.to_dict(flat=False), request.get_json(silent=True)]
+        query_hash = hashlib.blake2b(
+            json.dumps(params, sort_keys=True, default=str).encode('utf-8'), digest_size=12
+        ).hexdigest()
+        etag = f"{generation}-{query_hash}"
+
+        headers = {
+            'ETag': f'W/"{etag}"',
+            'Last-Modified': formatdate(changed_at, usegmt=True),
+            # Clients may store the response but must revalidate it
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+
+        if request.method in ('GET', 'HEAD') and _not_modified(etag, changed_at):
+            return Response(status=304, headers=headers)
+
+        key = (query_hash, generation)
+        entry = cache.get(key)
+        if entry is None:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = cache.put(key, response.get_data(), response.mimetype)
+
+        encoding = _choose_encoding(len(entry['body']['identity']))
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(_encoded_body(entry, encoding), mimetype=entry['mimetype'], headers=headers)
+
+    return wrapper
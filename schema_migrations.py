@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Schema Migrations for Email Metadata Extractor
+
+This module versions the database schema. Each migration has a number, a
+description and a function that changes the schema through a cursor.
+apply_migrations() runs the migrations newer than the version recorded in
+the schema_version table, each inside its own savepoint, and records them as
+they succeed. Databases created before versioning existed start at version 0
+and receive every migration; migrations are written to tolerate changes that
+are already present.
+"""
+
+import sqlite3
+from typing import List, Tuple, Callable
+
+import database_config
+
+
+def _add_date_epoch(cursor: sqlite3.Cursor):
+    database_config.migrate_date_epoch(cursor)
+
+
+def _index_related_emails(cursor: sqlite3.Cursor):
+    # search_related_emails joins on domain_id and selects every column; the
+    # index covers them so the lookup never touches the table
+    cursor.execute(
+        """CREATE INDEX IF NOT EXISTS idx_related_emails_domain
+           ON related_emails (domain_id, email_address, description, last_updated)"""
+    )
+
+
+def _add_metadata_search_index(cursor: sqlite3.Cursor):
+    create_search_index(cursor)
+
+
+def create_search_index(cursor: sqlite3.Cursor, schema: str = 'main') -> bool:
+    """
+    Create the trigram full-text index of email_metadata if it is missing.
+
+    Substring searches (LIKE '%term%') cannot use a B-tree index; a trigram
+    full-text index answers them for terms of three or more characters. It
+    needs SQLite 3.34 or later built with FTS5. Since migration 3 is recorded
+    even where it is not available, initialize_database() calls this on every
+    start, so the index is built once the SQLite library supports it.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        schema (str): Database holding the email_metadata table, e.g. an attached partition
+
+    Returns:
+        bool: True if the index exists, False if SQLite cannot build it
+    """
+    cursor.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'email_metadata_fts'")
+    if cursor.fetchone() is not None:
+        return True
+
+    try:
+        cursor.execute(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.email_metadata_fts USING fts5(
+                   sender, recipient, subject, message_id,
+                   content='email_metadata', content_rowid='id', tokenize='trigram'
+               )"""
+        )
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5 (or older than 3.34); searches fall back to LIKE scans
+        print(f"Warning: metadata search index not available: {e}")
+        return False
+
+    # Triggers and the content table resolve in the schema of the index
+    cursor.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS {schema}.trg_email_metadata_fts_insert
+           AFTER INSERT ON email_metadata
+           BEGIN
+               INSERT INTO email_metadata_fts (rowid, sender, recipient, subject, message_id)
+               VALUES (new.id, new.sender, new.recipient, new.subject, new.message_id);
+           END"""
+    )
+    cursor.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS {schema}.trg_email_metadata_fts_delete
+           AFTER DELETE ON email_metadata
+           BEGIN
+               INSERT INTO email_metadata_fts (email_metadata_fts, rowid, sender, recipient, subject, message_id)
+               VALUES ('delete', old.id, old.sender, old.recipient, old.subject, old.message_id);
+           END"""
+    )
+    cursor.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS {schema}.trg_email_metadata_fts_update
+           AFTER UPDATE OF sender, recipient, subject, message_id ON email_metadata
+           BEGIN
+               INSERT INTO email_metadata_fts (email_metadata_fts, rowid, sender, recipient, subject, message_id)
+               VALUES ('delete', old.id, old.sender, old.recipient, old.subject, old.message_id);
+               INSERT INTO email_metadata_fts (rowid, sender, recipient, subject, message_id)
+               VALUES (new.id, new.sender, new.recipient, new.subject, new.message_id);
+           END"""
+    )
+    # Index the rows stored before the index existed
+    cursor.execute(f"INSERT INTO {schema}.email_metadata_fts (email_metadata_fts) VALUES ('rebuild')")
+    return True
+
+
+def _add_body_partition(cursor: sqlite3.Cursor):
+    # Name of the monthly partition holding metadata_json, NULL if it is in
+    # the main database; indexed for dropping a partition's rows
+    cursor.execute("PRAGMA table_info(email_metadata)")
+    if 'body_partition' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE email_metadata ADD COLUMN body_partition TEXT")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_email_metadata_body_partition ON email_metadata (body_partition)"
+    )
+
+
+def _add_rollup_counted_columns(cursor: sqlite3.Cursor):
+    import volume_rollups
+    volume_rollups.add_counted_columns(cursor)
+
+
+def _add_watched_subdirectories(cursor: sqlite3.Cursor):
+    import maildir_watcher
+    maildir_watcher.add_subdirectories_column(cursor)
+
+
+# (version, description, function), in the order they are applied. Never
+# renumber or edit a released migration; add a new one instead.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, 'Add parsed UTC date column to email_metadata', _add_date_epoch),
+    (2, 'Covering index for related email lookups by domain', _index_related_emails),
+    (3, 'Trigram full-text index for email metadata searches', _add_metadata_search_index),
+    (4, 'Monthly partition of the metadata body', _add_body_partition),
+    (5, 'Record the time and keys each message is counted under in the volume rollups', _add_rollup_counted_columns),
+    (6, 'Record the subdirectories of checkpointed watched directories', _add_watched_subdirectories),
+]
+
+
+def create_version_table(cursor: sqlite3.Cursor):
+    """
+    Create the table recording the applied migrations.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+
+def get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """
+    Get the version of the newest applied migration.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+
+    Returns:
+        int: The schema version, 0 if no migration has been applied
+    """
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(cursor: sqlite3.Cursor) -> List[int]:
+    """
+    Apply the pending migrations without committing.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+
+    Returns:
+        List[int]: The versions that were applied
+    """
+    create_version_table(cursor)
+    current = get_schema_version(cursor)
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor.execute("SAVEPOINT migration")
+        try:
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            cursor.execute("RELEASE migration")
+        except Exception:
+            cursor.execute("ROLLBACK TO migration")
+            cursor.execute("RELEASE migration")
+            raise
+        applied.append(version)
+
+    return applied
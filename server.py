@@ -10,89 +10,201 @@ extractor web interface. It handles API requests from the JavaScript frontend.
 
 import os
 import json
+import time
+import uuid
 import tempfile
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
-from email_metadata_extractor import EmailMetadataExtractor
+from email_metadata_extractor import EmailMetadataExtractor, DEFAULT_LIMITS, limit_metrics
 from werkzeug.utils import secure_filename
 
 # Import database configuration
 import database_config
-
-try:
-    from database_config import initialize_database
-    # Initialize the database when the server starts
-    initialize_database()
-    print("Database initialized successfully")
-except ImportError:
-    print("Warning: Database configuration not found. Using simulated database.")
-
-# Initialize Flask app
-app = Flask(__name__, static_folder='.')
-CORS(app)  # Enable CORS for all routes
+import campaign_clustering
+import streaming_analytics
+import volume_rollups
+import date_parsing
+import auth_results
+import attachment_inventory
+import profiling
+from response_cache import cached_json
 
 # Ensure the uploads directory exists
 UPLOADS_DIR = os.path.join(tempfile.gettempdir(), 'email_analyzer_uploads')
 UPLOAD_FOLDER = UPLOADS_DIR  # Define UPLOAD_FOLDER for save_to_database route
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# Largest page of search results returned at once
+MAX_PAGE_SIZE = 1000
+
+# Largest k of /api/top-k: each slot only tracks this many candidates
+MAX_TOP_K = streaming_analytics.SUMMARY_CAPACITY
+
+# Requests sent with an "X-Profile: 1" header are profiled when this is set.
+# It is off by default so clients cannot slow a production server down.
+PROFILING_ENABLED = os.environ.get('EMAIL_ANALYZER_PROFILING', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = (os.environ.get('EMAIL_ANALYZER_PROFILE_DIR')
+               or os.path.join(tempfile.gettempdir(), 'email_analyzer_profiles'))
+
+# All routes live on a blueprint so create_app() can build independent app instances
+api = Blueprint('api', __name__)
 
-@app.route('/')
+
+def create_app(init_db: bool = True) -> Flask:
+    """
+    Create and configure the Flask application.
+    
+    Under a preforking server (see gunicorn.conf.py) this runs once in every
+    worker process. The schema is then created once by the master before the
+    workers start, so init_db is False there.
+    
+    Args:
+        init_db (bool): Create the database tables when the app is created
+        
+    Returns:
+        Flask: The configured application
+    """
+    if init_db:
+        try:
+            from database_config import initialize_database
+            # Initialize the database when the server starts
+            initialize_database()
+            print("Database initialized successfully")
+        except ImportError:
+            print("Warning: Database configuration not found. Using simulated database.")
+    
+    # Initialize Flask app
+    app = Flask(__name__, static_folder='.')
+    CORS(app)  # Enable CORS for all routes
+    app.register_blueprint(api)
+    return app
+
+
+@api.route('/')
 def index():
     """Serve the main HTML page."""
     return send_from_directory('.', 'index.html')
 
 
-@app.route('/api/search-email-metadata', methods=['POST'])
+@api.before_request
+def start_profile():
+    """Profile the request if it asks for it and profiling is enabled."""
+    if PROFILING_ENABLED and request.headers.get('X-Profile', '').lower() in ('1', 'true'):
+        g.profiler = profiling.Profiler()
+        g.profiler.start()
+
+
+@api.after_request
+def finish_profile(response):
+    """
+    Write the profile of a profiled request to PROFILE_DIR.
+    
+    The response names the profile in X-Profile-Id and reports the stage
+    times in a Server-Timing header, which browser developer tools display.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    
+    upload = next(iter(request.files.values()), None)
+    label = f"{request.method} {request.path}" + (f" {upload.filename}" if upload else '')
+    profiler.record_message(label, request.content_length or 0, profiler.elapsed)
+    
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    try:
+        profiler.write(os.path.join(PROFILE_DIR, profile_id))
+        response.headers['X-Profile-Id'] = profile_id
+    except OSError as e:
+        print(f"Error writing profile: {e}")
+    
+    timings = [f"{name.replace(' ', '-')};dur={seconds * 1000:.1f}" for name, seconds in profiler.stage_times.items()]
+    response.headers['Server-Timing'] = ', '.join(timings + [f"total;dur={profiler.elapsed * 1000:.1f}"])
+    return response
+
+
+@api.teardown_request
+def stop_profile(exc):
+    """Stop the profiler of a request that failed before finish_profile() ran."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+def _search_params() -> dict:
+    """Get search parameters from the JSON body, or from the query string for GET requests."""
+    if request.method != 'GET':
+        return request.json
+    params = request.args.to_dict()
+    if 'domains' in params:
+        params['domains'] = [domain for domain in params['domains'].split(',') if domain]
+    if 'use_real_db' in params:
+        params['use_real_db'] = params['use_real_db'].lower() == 'true'
+    return params
+
+
+@api.route('/api/search-email-metadata', methods=['GET', 'POST'])
+@cached_json
 def search_email_metadata():
     """API endpoint to search for email metadata in the database."""
-    data = request.json
+    data = _search_params()
     if not data or 'search_term' not in data:
         return jsonify({'error': 'No search term provided'}), 400
     
     search_term = data['search_term']
     search_type = data.get('search_type', 'sender')  # Default to searching by sender
+    if search_type not in database_config.SEARCH_TYPES:
+        return jsonify({'error': 'Invalid search type'}), 400
     
+    # Optional date range, as epoch seconds or ISO 8601 (UTC if no offset)
     try:
-        conn = database_config.get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build the query based on search type
-        if search_type == 'sender':
-            query = "SELECT * FROM email_metadata WHERE sender LIKE ?"
-        elif search_type == 'recipient':
-            query = "SELECT * FROM email_metadata WHERE recipient LIKE ?"
-        elif search_type == 'subject':
-            query = "SELECT * FROM email_metadata WHERE subject LIKE ?"
-        elif search_type == 'message_id':
-            query = "SELECT * FROM email_metadata WHERE message_id LIKE ?"
-        else:
-            return jsonify({'error': 'Invalid search type'}), 400
-        
-        # Execute the query
-        cursor.execute(query, (f'%{search_term}%',))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        # Convert rows to dictionaries
-        results = [dict(row) for row in rows]
+        start = date_parsing.parse_time_bound(data.get('start'))
+        end = date_parsing.parse_time_bound(data.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid start or end date'}), 400
+    
+    # Optional paging; without a limit every match is returned. Pages after the
+    # first are best requested with after_id, the next_after_id of the previous
+    # page, which seeks in the primary key instead of skipping offset rows
+    try:
+        limit = int(data['limit']) if data.get('limit') is not None else None
+        offset = int(data.get('offset') or 0)
+        after_id = int(data['after_id']) if data.get('after_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit, offset or after_id'}), 400
+    if (limit is not None and not 1 <= limit <= MAX_PAGE_SIZE) or offset < 0:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE} and offset at least 0'}), 400
+    
+    try:
+        # Search the main database and the monthly partitions overlapping the date range
+        with profiling.stage('query'):
+            results = database_config.search_email_metadata(search_term, search_type, start, end,
+                                                            limit, offset, after_id=after_id)
         
-        return jsonify({
+        response = {
             'success': True,
             'count': len(results),
             'results': results
-        })
+        }
+        if limit is not None:
+            response.update({'offset': offset, 'limit': limit,
+                             'next_after_id': results[-1]['id'] if len(results) == limit else None})
+            # Clients keep the total from the first page, so later pages skip the count
+            if offset == 0 and after_id is None:
+                response['total'] = (len(results) if len(results) < limit else
+                                     database_config.count_email_metadata(search_term, search_type, start, end))
+        return jsonify(response)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/status', methods=['GET'])
+@api.route('/api/status', methods=['GET'])
 def status():
     """API endpoint to check if the server is running."""
     return jsonify({'status': 'ok', 'message': 'Server is running'})
 
 
-@app.route('/api/extract-metadata', methods=['POST'])
+@api.route('/api/extract-metadata', methods=['POST'])
 def extract_metadata():
     """API endpoint to extract metadata from an uploaded email file."""
     if 'file' not in request.files:
@@ -111,14 +223,16 @@ def extract_metadata():
         try:
             # Extract metadata
             extractor = EmailMetadataExtractor(temp_path)
-            metadata = extractor.extract_metadata()
+            with profiling.stage('extract'):
+                metadata = extractor.extract_metadata()
             
             # Save to database if save_to_db parameter is true
             save_to_db = request.form.get('save_to_db', 'false').lower() == 'true'
             metadata_id = None
             
             if save_to_db:
-                metadata_id = extractor.save_to_database()
+                with profiling.stage('save'):
+                    metadata_id = extractor.save_to_database()
                 if metadata_id:
                     metadata['database_id'] = metadata_id
                     metadata['saved_to_database'] = True
@@ -138,10 +252,11 @@ def extract_metadata():
             return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/search-databases', methods=['POST'])
+@api.route('/api/search-databases', methods=['GET', 'POST'])
+@cached_json
 def search_databases():
     """API endpoint to search related databases for information about domains."""
-    data = request.json
+    data = _search_params()
     if not data or 'domains' not in data:
         return jsonify({'error': 'No domains provided'}), 400
     
@@ -179,7 +294,7 @@ def search_databases():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/save-to-database', methods=['POST'])
+@api.route('/api/save-to-database', methods=['POST'])
 def save_to_database():
     """API endpoint to save extracted metadata to database."""
     if 'email_file' not in request.files:
@@ -197,10 +312,12 @@ def save_to_database():
         
         # Extract metadata
         extractor = EmailMetadataExtractor(email_path=file_path)
-        extractor.extract_metadata()
+        with profiling.stage('extract'):
+            extractor.extract_metadata()
         
         # Save to database
-        metadata_id = extractor.save_to_database()
+        with profiling.stage('save'):
+            metadata_id = extractor.save_to_database()
         
         if metadata_id:
             return jsonify({
@@ -217,7 +334,7 @@ def save_to_database():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/discover-alternates', methods=['POST'])
+@api.route('/api/discover-alternates', methods=['POST'])
 def discover_alternates():
     """API endpoint to discover potential alternate email addresses."""
     data = request.json
@@ -240,7 +357,7 @@ def discover_alternates():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/modify-email', methods=['POST'])
+@api.route('/api/modify-email', methods=['POST'])
 def modify_email():
     """API endpoint to modify an alternate email address."""
     data = request.json
@@ -274,9 +391,260 @@ def modify_email():
         }), 500
 
 
+@api.route('/api/modify-emails', methods=['POST'])
+def modify_emails():
+    """API endpoint to rename many related email addresses in one transaction.
+    
+    The mapping is an object of original to new addresses, or a list of
+    [original, new] pairs. Every pair gets a status (see
+    database_config.update_related_emails); nothing is changed if the
+    transaction fails.
+    """
+    data = request.json
+    if not data or 'mapping' not in data:
+        return jsonify({'error': 'Missing required parameters'}), 400
+    
+    mapping = data['mapping']
+    pairs = list(mapping.items()) if isinstance(mapping, dict) else mapping
+    if not isinstance(pairs, list) or not all(
+            isinstance(pair, (list, tuple)) and len(pair) == 2
+            and all(isinstance(email, str) and email for email in pair) for pair in pairs):
+        return jsonify({'error': 'mapping must map email addresses to email addresses'}), 400
+    
+    try:
+        results = database_config.update_related_emails(pairs)
+        if results is None:
+            return jsonify({
+                'success': False,
+                'message': 'Failed to modify email addresses'
+            }), 500
+    
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return jsonify({
+            'success': True,
+            'counts': counts,
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+
+@api.route('/api/export-email-metadata', methods=['GET'])
+def export_email_metadata():
+    """API endpoint to export stored metadata in a date range as JSON lines."""
+    try:
+        start = date_parsing.parse_time_bound(request.args.get('start'))
+        end = date_parsing.parse_time_bound(request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid start or end date'}), 400
+    
+    def generate():
+        for record in database_config.iter_email_metadata(start, end):
+            yield json.dumps(record, default=str) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@api.route('/api/auth-verdicts', methods=['GET'])
+@cached_json
+def auth_verdicts():
+    """API endpoint to find emails by DKIM/SPF/DMARC outcome, e.g. all dmarc=fail from a domain."""
+    mechanism = request.args.get('mechanism')
+    if not mechanism:
+        return jsonify({'error': 'No mechanism provided'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    try:
+        results = auth_results.search_verdicts(
+            mechanism, request.args.get('result'), request.args.get('domain'), limit
+        )
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/attachments', methods=['GET'])
+@cached_json
+def attachments():
+    """API endpoint to find emails carrying an attachment by SHA-256, or list an email's attachments."""
+    sha256 = request.args.get('sha256')
+    metadata_id = request.args.get('metadata_id')
+    if not sha256 and not metadata_id:
+        return jsonify({'error': 'No sha256 or metadata_id provided'}), 400
+    
+    try:
+        metadata_id = int(metadata_id) if metadata_id else None
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({'error': 'metadata_id and limit must be integers'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    try:
+        results = attachment_inventory.search_attachments(sha256, metadata_id, limit)
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/campaign-clusters', methods=['GET'])
+@cached_json
+def campaign_clusters():
+    """API endpoint to list the largest near-duplicate campaign clusters."""
+    try:
+        min_size = int(request.args.get('min_size', 2))
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'min_size and limit must be integers'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    try:
+        clusters = campaign_clustering.list_clusters(min_size, limit)
+        return jsonify({
+            'success': True,
+            'count': len(clusters),
+            'clusters': clusters
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/campaign-clusters/<int:cluster_id>', methods=['GET'])
+@cached_json
+def campaign_cluster_members(cluster_id):
+    """API endpoint to list the messages of a campaign cluster."""
+    try:
+        members = campaign_clustering.get_cluster_members(cluster_id)
+        if not members:
+            return jsonify({'error': 'Cluster not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'cluster_id': cluster_id,
+            'count': len(members),
+            'members': members
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/top-k', methods=['GET'])
+def top_k():
+    """API endpoint to get the approximate top sender domains, domains or relay IPs.
+    
+    Answers from the sketches in the database, which count the messages saved
+    by every worker process, so all workers give the same answer.
+    """
+    dimension = request.args.get('dimension', 'sender_domains')
+    if dimension not in streaming_analytics.DIMENSIONS:
+        return jsonify({'error': 'Invalid dimension'}), 400
+    
+    try:
+        k = int(request.args.get('k', 10))
+        window = int(request.args.get('window', 3600))
+    except ValueError:
+        return jsonify({'error': 'k and window must be integers'}), 400
+    max_window = streaming_analytics.SLOT_SECONDS * streaming_analytics.NUM_SLOTS
+    if not 1 <= k <= MAX_TOP_K or not 1 <= window <= max_window:
+        return jsonify({'error': f'k must be between 1 and {MAX_TOP_K} and window between 1 and {max_window}'}), 400
+    
+    try:
+        results = streaming_analytics.query_top_k(dimension, k, window)
+        return jsonify({
+            'success': True,
+            'dimension': dimension,
+            'window': window,
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/extraction-limits', methods=['GET'])
+def extraction_limits():
+    """API endpoint to get the extraction limits and how often messages hit them."""
+    try:
+        return jsonify({
+            'success': True,
+            'limits': DEFAULT_LIMITS,
+            'metrics': dict(limit_metrics)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/volume', methods=['GET'])
+@cached_json
+def volume():
+    """API endpoint to get message volume from the hourly/daily rollups.
+    
+    With a key, returns the time series of that sender or domain; without one,
+    returns the keys with the most messages in the range.
+    """
+    dimension = request.args.get('dimension', 'sender_domain')
+    granularity = request.args.get('granularity', 'day')
+    key = request.args.get('key')
+    
+    if dimension not in volume_rollups.DIMENSIONS:
+        return jsonify({'error': 'Invalid dimension'}), 400
+    if granularity not in volume_rollups.GRANULARITIES:
+        return jsonify({'error': 'Invalid granularity'}), 400
+    
+    try:
+        start = date_parsing.parse_time_bound(request.args.get('start'))
+        end = date_parsing.parse_time_bound(request.args.get('end'))
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid start, end or limit'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    try:
+        if key:
+            series = volume_rollups.get_volume_series(dimension, key, granularity, start, end)
+            return jsonify({
+                'success': True,
+                'dimension': dimension,
+                'key': key,
+                'granularity': granularity,
+                'series': series
+            })
+        
+        top = volume_rollups.get_top_keys(dimension, granularity, start, end, limit)
+        return jsonify({
+            'success': True,
+            'dimension': dimension,
+            'granularity': granularity,
+            'results': top
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # Note: We don't need to add a new search-email-metadata endpoint as it already exists
 
 
 if __name__ == '__main__':
-    # Run the Flask app
+    # Run the Flask development server; see gunicorn.conf.py for production serving
+    app = create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming Analytics for Email Metadata Extractor
+
+This module keeps approximate "top talker" statistics over the results of
+EmailMetadataExtractor.extract_metadata() without storing individual messages.
+Sender domains, recipient domains and relay IP addresses are counted with a
+Count-Min Sketch (point estimates) and a Space-Saving summary (heavy hitter
+candidates) per time slot. Slots rotate as time advances, so both memory use
+and query cost are bounded by the sketch sizes and the window length.
+
+Each StreamingAnalytics instance counts the messages its process extracted.
+Sketches are mergeable, and save() adds the counts a process has not saved
+yet to the state file, so several processes saving to the same file
+accumulate instead of overwriting each other.
+
+Saved messages are also counted in shared sketches stored in the metadata
+database (add_message(), in the save transaction), which query_top_k()
+answers from. Every server worker process sees the same counts there, so
+/api/top-k does not depend on which worker serves the request.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+import database_config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Sketch dimensions. Estimates overshoot the true count by at most
+# e/SKETCH_WIDTH of the slot total with probability 1 - e^-SKETCH_DEPTH.
+SKETCH_WIDTH = 1024
+SKETCH_DEPTH = 4
+
+# Number of heavy hitter candidates tracked per slot
+SUMMARY_CAPACITY = 100
+
+# Time window layout: 60 slots of one minute cover the last hour
+SLOT_SECONDS = 60
+NUM_SLOTS = 60
+
+# Dimensions tracked for every extracted message
+DIMENSIONS = ('sender_domains', 'domains', 'ip_addresses')
+
+# Default location of the persisted state
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streaming_analytics.json')
+
+
+def _hash_pair(item: str) -> Tuple[int, int]:
+    """Hash an item to two independent 64-bit values."""
+    digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+
+
+def _sketch_cells(item: str, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH) -> List[int]:
+    """Get the Count-Min Sketch cells, one per row, an item is counted in."""
+    h1, h2 = _hash_pair(item)
+    return [row * width + (h1 + row * h2) % width for row in range(depth)]
+
+
+class CountMinSketch:
+    """Count-Min Sketch giving upper-bound frequency estimates in fixed memory."""
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        """Initialize an empty sketch."""
+        self.width = width
+        self.depth = depth
+        self.table = array('I', bytes(4 * width * depth))
+        self.total = 0
+
+    def _cells(self, item: str) -> List[int]:
+        return _sketch_cells(item, self.width, self.depth)
+
+    def add(self, item: str, count: int = 1):
+        """Add count occurrences of item."""
+        for cell in self._cells(item):
+            self.table[cell] += count
+        self.total += count
+
+    def estimate(self, item: str) -> int:
+        """Estimate the number of occurrences of item."""
+        return min(self.table[cell] for cell in self._cells(item))
+
+    def merge(self, other: 'CountMinSketch'):
+        """Add the counts of a sketch of the same dimensions."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches of different dimensions")
+        for cell, count in enumerate(other.table):
+            if count:
+                self.table[cell] += count
+        self.total += other.total
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the sketch to a JSON-compatible dict."""
+        return {'width': self.width, 'depth': self.depth,
+                'total': self.total, 'table': self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CountMinSketch':
+        """Restore a sketch serialized by to_dict()."""
+        sketch = cls(data['width'], data['depth'])
+        sketch.table = array('I', data['table'])
+        sketch.total = data['total']
+        return sketch
+
+
+class SpaceSaving:
+    """Space-Saving summary tracking the most frequent items in fixed memory."""
+
+    def __init__(self, capacity: int = SUMMARY_CAPACITY):
+        """Initialize an empty summary."""
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, item: str, count: int = 1):
+        """Add count occurrences of item, evicting the least frequent candidate if full."""
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            evicted = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(evicted)
+            del self.errors[evicted]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        """Return the k candidates with the highest counts."""
+        return sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+    def merge(self, other: 'SpaceSaving'):
+        """Add the candidates of another summary, keeping the capacity most frequent."""
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+            self.errors[item] = self.errors.get(item, 0) + other.errors.get(item, 0)
+        if len(self.counts) > self.capacity:
+            for item, _ in self.top(len(self.counts))[self.capacity:]:
+                del self.counts[item]
+                del self.errors[item]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the summary to a JSON-compatible dict."""
+        return {'capacity': self.capacity, 'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpaceSaving':
+        """Restore a summary serialized by to_dict()."""
+        summary = cls(data['capacity'])
+        summary.counts = dict(data['counts'])
+        summary.errors = dict(data['errors'])
+        return summary
+
+
+class WindowedHeavyHitters:
+    """Heavy hitters over a sliding time window made of rotating slots."""
+
+    def __init__(self, slot_seconds: int = SLOT_SECONDS, num_slots: int = NUM_SLOTS):
+        """Initialize an empty window."""
+        self.slot_seconds = slot_seconds
+        self.num_slots = num_slots
+        # Slot index (epoch seconds // slot_seconds) -> (sketch, summary)
+        self.slots = {}
+
+    def _expire(self, current_slot: int):
+        """Drop the slots that have fallen out of the window."""
+        oldest = current_slot - self.num_slots + 1
+        for slot in [s for s in self.slots if s < oldest]:
+            del self.slots[slot]
+
+    def add(self, item: str, timestamp: float, count: int = 1):
+        """Record count occurrences of item at the given time."""
+        slot = int(timestamp // self.slot_seconds)
+        if slot not in self.slots:
+            self._expire(slot)
+            self.slots[slot] = (CountMinSketch(), SpaceSaving())
+        sketch, summary = self.slots[slot]
+        sketch.add(item, count)
+        summary.add(item, count)
+
+    def _window_slots(self, window_seconds: int, now: float) -> List[Tuple[CountMinSketch, SpaceSaving]]:
+        current_slot = int(now // self.slot_seconds)
+        span = min(self.num_slots, max(1, -(-window_seconds // self.slot_seconds)))
+        return [self.slots[s] for s in range(current_slot - span + 1, current_slot + 1) if s in self.slots]
+
+    def estimate(self, item: str, window_seconds: int, now: float) -> int:
+        """Estimate the occurrences of item within the window ending at now."""
+        return sum(sketch.estimate(item) for sketch, _ in self._window_slots(window_seconds, now))
+
+    def top(self, k: int, window_seconds: int, now: float) -> List[Dict[str, Any]]:
+        """Return the approximate top-k items within the window ending at now."""
+        slots = self._window_slots(window_seconds, now)
+        candidates = set()
+        for _, summary in slots:
+            candidates.update(item for item, _ in summary.top(k))
+
+        totals = [(item, sum(sketch.estimate(item) for sketch, _ in slots)) for item in candidates]
+        totals.sort(key=lambda kv: (-kv[1], kv[0]))
+        return [{'item': item, 'count': count} for item, count in totals[:k]]
+
+    def merge(self, other: 'WindowedHeavyHitters'):
+        """Add the slots of another window of the same layout."""
+        for slot, (sketch, summary) in other.slots.items():
+            if slot not in self.slots:
+                self.slots[slot] = (CountMinSketch(sketch.width, sketch.depth), SpaceSaving(summary.capacity))
+            self.slots[slot][0].merge(sketch)
+            self.slots[slot][1].merge(summary)
+        if self.slots:
+            self._expire(max(self.slots))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the window to a JSON-compatible dict."""
+        return {
+            'slot_seconds': self.slot_seconds,
+            'num_slots': self.num_slots,
+            'slots': {str(slot): {'sketch': sketch.to_dict(), 'summary': summary.to_dict()}
+                      for slot, (sketch, summary) in self.slots.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'WindowedHeavyHitters':
+        """Restore a window serialized by to_dict()."""
+        window = cls(data['slot_seconds'], data['num_slots'])
+        for slot, state in data['slots'].items():
+            window.slots[int(slot)] = (CountMinSketch.from_dict(state['sketch']),
+                                       SpaceSaving.from_dict(state['summary']))
+        return window
+
+
+class StreamingAnalytics:
+    """Approximate top sender domains, domains and relay IPs over recent mail."""
+
+    def __init__(self, slot_seconds: int = SLOT_SECONDS, num_slots: int = NUM_SLOTS):
+        """Initialize one window per tracked dimension."""
+        self.slot_seconds = slot_seconds
+        self.num_slots = num_slots
+        self.windows = {dimension: WindowedHeavyHitters(slot_seconds, num_slots)
+                        for dimension in DIMENSIONS}
+        # Counts observed since the last save(), which adds them to the state file
+        self.unsaved = {dimension: WindowedHeavyHitters(slot_seconds, num_slots)
+                        for dimension in DIMENSIONS}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _items(metadata: Dict[str, Any]) -> Dict[str, Iterable[str]]:
+        from_email = metadata.get('from_email') or ''
+        return {
+            'sender_domains': [from_email.split('@')[-1].lower()] if '@' in from_email else [],
+            'domains': [d.lower() for d in metadata.get('domains') or []],
+            'ip_addresses': metadata.get('ip_addresses') or [],
+        }
+
+    def observe(self, metadata: Dict[str, Any], timestamp: Optional[float] = None):
+        """Count the sender domain, domains and relay IPs of an extracted message."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            for dimension, items in self._items(metadata).items():
+                window = self.windows[dimension]
+                unsaved = self.unsaved[dimension]
+                for item in items:
+                    window.add(item, timestamp)
+                    unsaved.add(item, timestamp)
+
+    def top_k(self, dimension: str, k: int = 10, window_seconds: int = 3600,
+              now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return the approximate top-k items of a dimension over the last window_seconds."""
+        if dimension not in self.windows:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        now = time.time() if now is None else now
+        with self.lock:
+            return self.windows[dimension].top(k, window_seconds, now)
+
+    def estimate(self, dimension: str, item: str, window_seconds: int = 3600,
+                 now: Optional[float] = None) -> int:
+        """Estimate how often an item was seen over the last window_seconds."""
+        if dimension not in self.windows:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        now = time.time() if now is None else now
+        with self.lock:
+            return self.windows[dimension].estimate(item, window_seconds, now)
+
+    def save(self, path: str) -> bool:
+        """Add the counts observed since the last save to a JSON state file.
+
+        The file is locked while it is read and rewritten, so processes saving
+        to the same file each add their own counts.
+
+        Args:
+            path: Path to the state file
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        with self.lock:
+            unsaved = self.unsaved
+            self.unsaved = {dimension: WindowedHeavyHitters(self.slot_seconds, self.num_slots)
+                            for dimension in DIMENSIONS}
+
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(f"{path}.lock", 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            windows = self._read_state(path)
+            for dimension, window in unsaved.items():
+                if dimension in windows:
+                    windows[dimension].merge(window)
+                else:
+                    windows[dimension] = window
+
+            state = {dimension: window.to_dict() for dimension, window in windows.items()}
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Error saving streaming analytics state: {e}")
+            # Keep the counts for the next save
+            with self.lock:
+                for dimension, window in unsaved.items():
+                    self.unsaved[dimension].merge(window)
+            return False
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    @staticmethod
+    def _read_state(path: str) -> Dict[str, WindowedHeavyHitters]:
+        """Read the windows of a state file; a missing or empty file has none."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return {dimension: WindowedHeavyHitters.from_dict(state[dimension])
+                for dimension in DIMENSIONS if dimension in state}
+
+    def load(self, path: str) -> bool:
+        """Restore sketches persisted by save().
+
+        Args:
+            path: Path to the state file
+
+        Returns:
+            bool: True if the state was loaded, False otherwise
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            windows = self._read_state(path)
+            with self.lock:
+                self.windows.update(windows)
+            return True
+        except Exception as e:
+            print(f"Error loading streaming analytics state: {e}")
+            return False
+
+
+# Process-wide analytics fed by EmailMetadataExtractor.extract_metadata()
+analytics = StreamingAnalytics()
+
+
+def record_metadata(metadata: Dict[str, Any]):
+    """Feed extracted metadata into the process-wide analytics."""
+    analytics.observe(metadata)
+
+
+# Slot up to which this process last expired the shared sketches
+_expired_slot = None
+
+
+def create_sketch_tables(cursor: sqlite3.Cursor):
+    """
+    Create the tables of the shared sketches: the Count-Min Sketch cells and
+    the Space-Saving candidates of every dimension and time slot.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS topk_sketch_cells (
+        dimension TEXT NOT NULL,
+        slot INTEGER NOT NULL,
+        cell INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (dimension, slot, cell)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS topk_candidates (
+        dimension TEXT NOT NULL,
+        slot INTEGER NOT NULL,
+        item TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        error INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, slot, item)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_topk_candidates_count "
+        "ON topk_candidates (dimension, slot, count, item)"
+    )
+
+
+def _add_candidate(cursor: sqlite3.Cursor, dimension: str, slot: int, item: str):
+    """Space-Saving update of a slot's candidates, as SpaceSaving.add()."""
+    cursor.execute(
+        "UPDATE topk_candidates SET count = count + 1 WHERE dimension = ? AND slot = ? AND item = ?",
+        (dimension, slot, item)
+    )
+    if cursor.rowcount:
+        return
+
+    cursor.execute(
+        "SELECT COUNT(*) FROM topk_candidates WHERE dimension = ? AND slot = ?",
+        (dimension, slot)
+    )
+    floor = 0
+    if cursor.fetchone()[0] >= SUMMARY_CAPACITY:
+        cursor.execute(
+            """SELECT item, count FROM topk_candidates WHERE dimension = ? AND slot = ?
+               ORDER BY count, item LIMIT 1""",
+            (dimension, slot)
+        )
+        evicted, floor = cursor.fetchone()
+        cursor.execute(
+            "DELETE FROM topk_candidates WHERE dimension = ? AND slot = ? AND item = ?",
+            (dimension, slot, evicted)
+        )
+    cursor.execute(
+        "INSERT INTO topk_candidates (dimension, slot, item, count, error) VALUES (?, ?, ?, ?, ?)",
+        (dimension, slot, item, floor + 1, floor)
+    )
+
+
+def add_message(cursor: sqlite3.Cursor, metadata: Dict[str, Any], timestamp: Optional[float] = None):
+    """
+    Count a saved message in the shared sketches, inside the caller's save transaction.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata (Dict[str, Any]): The extracted metadata of the message
+        timestamp (Optional[float]): Time to count the message at, now if omitted
+    """
+    global _expired_slot
+    timestamp = time.time() if timestamp is None else timestamp
+    slot = int(timestamp // SLOT_SECONDS)
+
+    # Drop the slots that have fallen out of the window, once per slot
+    if _expired_slot != slot:
+        for dimension in DIMENSIONS:
+            for table in ('topk_sketch_cells', 'topk_candidates'):
+                cursor.execute(f"DELETE FROM {table} WHERE dimension = ? AND slot <= ?",
+                               (dimension, slot - NUM_SLOTS))
+        _expired_slot = slot
+
+    cells = []
+    for dimension, items in StreamingAnalytics._items(metadata).items():
+        for item in items:
+            cells.extend((dimension, slot, cell) for cell in _sketch_cells(item))
+            _add_candidate(cursor, dimension, slot, item)
+    cursor.executemany(
+        """INSERT INTO topk_sketch_cells (dimension, slot, cell, count) VALUES (?, ?, ?, 1)
+           ON CONFLICT (dimension, slot, cell) DO UPDATE SET count = count + 1""",
+        cells
+    )
+
+
+def query_top_k(dimension: str, k: int = 10, window_seconds: int = 3600,
+                now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Get the approximate top-k items of a dimension over the messages saved in
+    the last window_seconds, by any process.
+
+    Only the candidates of the window and their sketch cells are read, so the
+    cost is bounded by k, the summary capacity and the number of slots.
+
+    Args:
+        dimension (str): One of DIMENSIONS
+        k (int): Number of items to return
+        window_seconds (int): Window length, at most SLOT_SECONDS * NUM_SLOTS
+        now (Optional[float]): End of the window, now if omitted
+
+    Returns:
+        List[Dict[str, Any]]: Items with their estimated counts, most frequent first
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    now = time.time() if now is None else now
+    current_slot = int(now // SLOT_SECONDS)
+    span = min(NUM_SLOTS, max(1, -(-window_seconds // SLOT_SECONDS)))
+
+    # Rebuild the window from the stored candidates and the cells they hash to
+    window = WindowedHeavyHitters(SLOT_SECONDS, NUM_SLOTS)
+    conn = database_config.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT slot, item, count, error FROM topk_candidates
+               WHERE dimension = ? AND slot BETWEEN ? AND ?""",
+            (dimension, current_slot - span + 1, current_slot)
+        )
+        for slot, item, count, error in cursor.fetchall():
+            if slot not in window.slots:
+                window.slots[slot] = (CountMinSketch(), SpaceSaving())
+            summary = window.slots[slot][1]
+            summary.counts[item] = count
+            summary.errors[item] = error
+
+        candidates = {item for _, summary in window.slots.values() for item, _ in summary.top(k)}
+        cells = sorted({cell for item in candidates for cell in _sketch_cells(item)})
+        for slot, (sketch, _) in window.slots.items():
+            for start in range(0, len(cells), 500):
+                chunk = cells[start:start + 500]
+                cursor.execute(
+                    f"""SELECT cell, count FROM topk_sketch_cells
+                        WHERE dimension = ? AND slot = ? AND cell IN ({','.join('?' * len(chunk))})""",
+                    (dimension, slot, *chunk)
+                )
+                for cell, count in cursor.fetchall():
+                    sketch.table[cell] = count
+    finally:
+        conn.close()
+
+    return window.top(k, window_seconds, now)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the async facade
+
+This script runs extraction, batch saves and searches through
+AsyncEmailMetadataService against a temporary database.
+"""
+
+import unittest
+import os
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import database_config
+import streaming_analytics
+from async_extractor import AsyncEmailMetadataService, extract_metadata_dict
+
+
+def _message(i):
+    """Create a small raw test message."""
+    return (f"From: sender{i}@example.com\r\n"
+            f"To: recipient@example.org\r\n"
+            f"Subject: Async test {i}\r\n"
+            f"Date: Mon, 01 Jan 2023 12:00:00 +0000\r\n"
+            f"Message-ID: <async-{i}@example.com>\r\n"
+            f"\r\n"
+            f"body {i}\r\n").encode('utf-8')
+
+
+class TestAsyncEmailMetadataService(unittest.TestCase):
+    """Test cases for AsyncEmailMetadataService."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def test_extract_save_search(self):
+        """Test that messages extracted concurrently are saved and searchable."""
+        async def scenario():
+            service = AsyncEmailMetadataService(max_concurrency=3, executor=ThreadPoolExecutor(max_workers=2))
+            async with service:
+                metadata = await service.extract_many([_message(i) for i in range(10)])
+                ids = await service.save_batch(metadata)
+                results = await service.search('sender7', 'sender')
+                return metadata, ids, results
+
+        metadata, ids, results = asyncio.run(scenario())
+
+        self.assertEqual([m['subject'] for m in metadata], [f'Async test {i}' for i in range(10)])
+        self.assertEqual(len(ids), 10)
+        self.assertNotIn(None, ids)
+        self.assertEqual([row['message_id'] for row in results], ['<async-7@example.com>'])
+
+    def test_concurrency_is_bounded(self):
+        """Test that no more than max_concurrency messages are parsed at once."""
+        running = []
+        peak = []
+
+        def extract(email_path=None, email_content=None):
+            running.append(email_content)
+            peak.append(len(running))
+            try:
+                return extract_metadata_dict(email_path, email_content)
+            finally:
+                running.remove(email_content)
+
+        async def scenario():
+            service = AsyncEmailMetadataService(max_concurrency=2, executor=ThreadPoolExecutor(max_workers=8))
+            async with service:
+                with mock.patch('async_extractor.extract_metadata_dict', extract):
+                    return await service.extract_many([_message(i) for i in range(12)])
+
+        self.assertEqual(len(asyncio.run(scenario())), 12)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_process_pool(self):
+        """Test the default process pool, whose sketch updates are made in the parent."""
+        analytics = streaming_analytics.StreamingAnalytics()
+
+        async def scenario():
+            service = AsyncEmailMetadataService(workers=2, max_concurrency=2)
+            self.assertTrue(service._record_in_parent)
+            async with service:
+                return await service.extract_many([_message(i) for i in range(4)])
+
+        with mock.patch.object(streaming_analytics, 'analytics', analytics):
+            metadata = asyncio.run(scenario())
+
+        self.assertEqual([m['subject'] for m in metadata], [f'Async test {i}' for i in range(4)])
+        # Counted once each, in this process
+        self.assertEqual(analytics.estimate('sender_domains', 'example.com'), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
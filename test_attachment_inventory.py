@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the attachment inventory
+
+This script contains unit tests for the streaming MIME walker and the attachments table.
+"""
+
+import unittest
+import os
+import hashlib
+import tempfile
+from email import message_from_bytes
+from email.message import EmailMessage
+from email.policy import default
+
+import database_config
+import attachment_inventory
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+
+def _build_message() -> bytes:
+    """Build a nested multipart message with base64, quoted-printable and 7bit parts."""
+    msg = EmailMessage()
+    msg['From'] = 'sender@example.com'
+    msg['To'] = 'recipient@example.org'
+    msg['Subject'] = 'Quarterly report'
+    msg['Message-ID'] = '<attachments@example.com>'
+    msg.set_content('Body text\n')
+    msg.add_alternative('<p>Body text</p>\n', subtype='html')
+    msg.add_attachment(os.urandom(200000), maintype='application', subtype='pdf',
+                       filename='report.pdf')
+    msg.add_attachment('line one\nline two = café\n' * 50, subtype='plain',
+                       filename='notes.txt', cte='quoted-printable')
+    msg.add_attachment(b'--not a boundary\nplain bytes\n', maintype='application',
+                       subtype='octet-stream', filename='data.bin', cte='7bit')
+    return msg.as_bytes()
+
+
+class TestAttachmentScanner(unittest.TestCase):
+    """Test cases for the streaming attachment scanner."""
+
+    def test_matches_email_package(self):
+        """Test sizes and digests against the decoded payloads of the email package, at several chunk sizes."""
+        raw = _build_message()
+        expected = [
+            (part.get_filename(), part.get_content_type(), hashlib.sha256(part.get_payload(decode=True)).hexdigest())
+            for part in message_from_bytes(raw, policy=default).iter_attachments()
+        ]
+
+        for chunk_size in (7, 100, 4096, attachment_inventory.CHUNK_SIZE):
+            attachments = attachment_inventory.scan_attachments(raw, chunk_size=chunk_size)
+            self.assertEqual(
+                [(a['filename'], a['content_type'], a['sha256']) for a in attachments],
+                expected,
+                f"chunk_size={chunk_size}"
+            )
+        self.assertEqual(attachments[0]['size'], 200000)
+        self.assertEqual([a['part'] for a in attachments], ['2', '3', '4'])
+
+    def test_plain_message_has_no_attachments(self):
+        """Test that a text-only message yields an empty inventory."""
+        raw = b'From: a@example.com\r\nSubject: hi\r\n\r\nHello\r\n'
+        self.assertEqual(attachment_inventory.scan_attachments(raw), [])
+
+
+    def test_header_line_without_breaks(self):
+        """Test that an endless part header line is skipped instead of buffered."""
+        raw = (b'From: a@example.com\nContent-Type: multipart/mixed; boundary="b"\n\n'
+               b'--b\nX-Pad: ' + b'x' * 500000 + b'\n\nlost\n'
+               b'--b\nContent-Type: application/pdf\nContent-Disposition: attachment; filename="a.pdf"\n\n%PDF\n'
+               b'--b--\n')
+        scanner = attachment_inventory.AttachmentScanner(chunk_size=4096, max_header_section_bytes=8192)
+        peak = 0
+        for start in range(0, len(raw), 4096):
+            scanner.feed(raw[start:start + 4096])
+            peak = max(peak, len(scanner._buffer) + len(scanner._header_bytes))
+        attachments = scanner.close()
+
+        self.assertLess(peak, 16384)
+        self.assertEqual(scanner.truncated, 'max_header_section_bytes')
+        self.assertEqual([a['filename'] for a in attachments], ['a.pdf'])
+
+
+class TestAttachmentStorage(unittest.TestCase):
+    """Test cases for the attachments table."""
+
+    def setUp(self):
+        """Set up a temporary database."""
+        self.original_db_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database path and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_db_path
+        os.unlink(self.db_path)
+
+    def test_saved_and_searchable(self):
+        """Test that saved messages can be found by attachment hash."""
+        metadata = EmailMetadataExtractor(email_content=_build_message()).extract_metadata()
+        metadata_id = save_metadata_batch([metadata])[0]
+        self.assertIsNotNone(metadata_id)
+
+        pdf = metadata['attachments'][0]
+        results = attachment_inventory.search_attachments(sha256=pdf['sha256'])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['filename'], 'report.pdf')
+        self.assertEqual(results[0]['message_id'], '<attachments@example.com>')
+
+        # Saving the same message again replaces its inventory
+        save_metadata_batch([metadata])
+        self.assertEqual(len(attachment_inventory.search_attachments(metadata_id=metadata_id)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for authentication results parsing
+
+This script contains unit tests for the DKIM/SPF/DMARC verdict parser and index.
+"""
+
+import unittest
+import os
+import tempfile
+
+import database_config
+import auth_results
+
+
+class TestAuthResultsParsing(unittest.TestCase):
+    """Test cases for the authentication header parsers."""
+
+    def test_parse_authentication_results(self):
+        """Test parsing per-mechanism verdicts with comments and properties."""
+        header = ('mx.google.com; dkim=pass header.i=@example.com header.s=sel1 header.b=AbCd; '
+                  'spf=softfail (google.com: domain of a@bounce.example.com; transitioning) '
+                  'smtp.mailfrom=a@bounce.example.com; dmarc=FAIL (p=REJECT sp=REJECT dis=NONE) '
+                  'header.from=Example.com')
+        verdicts = auth_results.parse_authentication_results(header)
+
+        self.assertEqual(verdicts, [
+            {'mechanism': 'dkim', 'result': 'pass', 'domain': 'example.com', 'selector': 'sel1'},
+            {'mechanism': 'spf', 'result': 'softfail', 'domain': 'bounce.example.com', 'selector': ''},
+            {'mechanism': 'dmarc', 'result': 'fail', 'domain': 'example.com', 'selector': ''},
+        ])
+
+    def test_extract_verdicts_fallbacks(self):
+        """Test using Received-SPF and DKIM-Signature when Authentication-Results is missing."""
+        metadata = {
+            'authentication_results': '',
+            'spf': 'pass (mx.example.net: domain of a@example.org designates 192.0.2.1) '
+                   'client-ip=192.0.2.1; envelope-from="a@example.org";',
+            'dkim': 'v=1; a=rsa-sha256; d=Example.org; s=mail2023; h=from:to; bh=abc; b=def',
+        }
+        verdicts = auth_results.extract_verdicts(metadata)
+
+        self.assertIn({'mechanism': 'spf', 'result': 'pass', 'domain': 'example.org', 'selector': ''}, verdicts)
+        self.assertIn({'mechanism': 'dkim', 'result': 'none', 'domain': 'example.org', 'selector': 'mail2023'}, verdicts)
+
+
+class TestAuthVerdictIndex(unittest.TestCase):
+    """Test cases for storing and searching verdicts."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def test_search_verdicts(self):
+        """Test that dmarc=fail lookups by domain use the verdict index."""
+        for i, result in enumerate(['fail', 'pass', 'fail']):
+            metadata_id = database_config.save_email_metadata(
+                f'<{i}@example.com>', 'a@example.com', '', f'Message {i}', '', '{}'
+            )
+            auth_results.save_verdicts(metadata_id, auth_results.parse_authentication_results(
+                f'mx.example.net; dmarc={result} header.from=example.com'
+            ))
+
+        failed = auth_results.search_verdicts('dmarc', 'fail', 'example.com')
+        self.assertEqual([row['message_id'] for row in failed], ['<2@example.com>', '<0@example.com>'])
+
+        conn = database_config.get_db_connection()
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT metadata_id FROM auth_verdicts "
+            "WHERE mechanism = ? AND result = ? AND domain = ?", ('dmarc', 'fail', 'example.com')
+        ).fetchall()
+        conn.close()
+        self.assertIn('COVERING INDEX idx_auth_verdicts_lookup', ' '.join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
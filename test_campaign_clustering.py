@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for campaign clustering
+
+This script contains unit tests for the MinHash/LSH campaign clustering module.
+"""
+
+import unittest
+import os
+import tempfile
+
+import database_config
+import campaign_clustering
+from campaign_clustering import CampaignClusterer
+
+
+def _campaign_metadata(subject, mailer='BulkMailer 4.2', relay='relay1.bulk.example'):
+    """Build extracted metadata for a campaign message."""
+    return {
+        'subject': subject,
+        'x_headers': {'X-Mailer': mailer, 'X-Campaign': 'spring-sale'},
+        'received': [
+            f'from {relay} (unknown [10.0.0.1]) by mx.example.com with ESMTP id 1',
+            'from mx.example.com by inbox.example.com with LMTP id 2',
+        ],
+    }
+
+
+class TestCampaignClusterer(unittest.TestCase):
+    """Test cases for MinHash signatures and band keys."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.clusterer = CampaignClusterer()
+
+    def test_signature_is_deterministic(self):
+        """Test that the same metadata always gives the same signature."""
+        metadata = _campaign_metadata('Your order 1234 has shipped')
+        first = self.clusterer.signature(metadata)
+        second = CampaignClusterer().signature(metadata)
+
+        self.assertEqual(len(first), campaign_clustering.NUM_PERMUTATIONS)
+        self.assertEqual(first, second)
+
+    def test_similarity_of_near_duplicates(self):
+        """Test that messages differing only in numbers look identical."""
+        first = self.clusterer.signature(_campaign_metadata('Your order 1234 has shipped'))
+        second = self.clusterer.signature(_campaign_metadata('Your order 98765 has shipped'))
+        other = self.clusterer.signature(_campaign_metadata(
+            'Quarterly board meeting agenda', mailer='Thunderbird', relay='smtp.corp.example'
+        ))
+
+        self.assertEqual(self.clusterer.similarity(first, second), 1.0)
+        self.assertLess(self.clusterer.similarity(first, other), campaign_clustering.SIMILARITY_THRESHOLD)
+        self.assertEqual(self.clusterer.band_keys(first), self.clusterer.band_keys(second))
+
+
+class TestClusterAssignment(unittest.TestCase):
+    """Test cases for cluster assignment against the database."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def _save(self, message_id, metadata):
+        metadata_id = database_config.save_email_metadata(
+            message_id, 'sender@example.com', 'recipient@example.com',
+            metadata['subject'], '', '{}'
+        )
+        return metadata_id, campaign_clustering.assign_cluster(metadata_id, metadata)
+
+    def test_assign_cluster(self):
+        """Test that near-duplicates share a cluster and unrelated mail does not."""
+        first_id, first_cluster = self._save('<1@example.com>', _campaign_metadata('Flash sale: 20% off today'))
+        _, second_cluster = self._save('<2@example.com>', _campaign_metadata('Flash sale: 35% off today'))
+        _, other_cluster = self._save('<3@example.com>', _campaign_metadata(
+            'Lunch on Friday?', mailer='Apple Mail', relay='smtp.friend.example'
+        ))
+
+        self.assertEqual(first_cluster, first_id)
+        self.assertEqual(second_cluster, first_cluster)
+        self.assertNotEqual(other_cluster, first_cluster)
+        self.assertEqual(campaign_clustering.get_cluster_id(first_id), first_cluster)
+
+        members = campaign_clustering.get_cluster_members(first_cluster)
+        self.assertEqual([m['message_id'] for m in members], ['<1@example.com>', '<2@example.com>'])
+
+        clusters = campaign_clustering.list_clusters(min_size=2)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['cluster_id'], first_cluster)
+        self.assertEqual(clusters[0]['size'], 2)
+
+    def test_resaved_representative(self):
+        """Test that a representative re-saved with other features hands its cluster on."""
+        first_id, first_cluster = self._save('<1@example.com>', _campaign_metadata('Flash sale: 20% off today'))
+        second_id, _ = self._save('<2@example.com>', _campaign_metadata('Flash sale: 35% off today'))
+        other_id, other_cluster = self._save('<3@example.com>', _campaign_metadata(
+            'Lunch on Friday?', mailer='Apple Mail', relay='smtp.friend.example'
+        ))
+        self.assertEqual(first_cluster, first_id)
+        # Re-saving unchanged keeps the cluster
+        self.assertEqual(campaign_clustering.assign_cluster(first_id, _campaign_metadata('Flash sale: 20% off today')),
+                         first_id)
+
+        # The representative now looks like the other message and joins its cluster
+        moved = campaign_clustering.assign_cluster(first_id, _campaign_metadata(
+            'Lunch on Friday?', mailer='Apple Mail', relay='smtp.friend.example'
+        ))
+        self.assertEqual(moved, other_cluster)
+        self.assertEqual(campaign_clustering.get_cluster_id(second_id), second_id)
+
+        # New sale messages find the renumbered cluster through its buckets
+        _, sale_cluster = self._save('<4@example.com>', _campaign_metadata('Flash sale: 50% off today'))
+        self.assertEqual(sale_cluster, second_id)
+        self.assertEqual([m['id'] for m in campaign_clustering.get_cluster_members(other_cluster)],
+                         [first_id, other_id])
+
+    def test_featureless_messages_not_clustered(self):
+        """Test that messages with nothing to compare do not share one cluster."""
+        empty = {'subject': '', 'x_headers': {}, 'received': []}
+        self.assertEqual(CampaignClusterer().signature(empty), [])
+
+        first_id, first_cluster = self._save('<1@example.com>', empty)
+        _, second_cluster = self._save('<2@example.com>', empty)
+        self.assertIsNone(first_cluster)
+        self.assertIsNone(second_cluster)
+        self.assertEqual(campaign_clustering.list_clusters(min_size=1), [])
+
+        # A re-saved message that lost its features leaves its cluster
+        self.assertEqual(campaign_clustering.assign_cluster(first_id, _campaign_metadata('Flash sale')), first_id)
+        self.assertIsNone(campaign_clustering.assign_cluster(first_id, empty))
+        self.assertIsNone(campaign_clustering.get_cluster_id(first_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
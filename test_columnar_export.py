@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the columnar export
+
+This script exports metadata saved to a temporary database and checks the
+CSV output, the Parquet and Arrow output when pyarrow is installed, and the
+CSV fallback when it is not.
+"""
+
+import unittest
+import io
+import os
+import csv
+import contextlib
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+import database_config
+import columnar_export
+from email_metadata_extractor import EmailMetadataExtractor, save_metadata_batch
+
+SAMPLE_EMAIL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_email.eml')
+
+
+class TestColumnarExport(unittest.TestCase):
+    """Test cases for ColumnarWriter and export_database()."""
+
+    def setUp(self):
+        """Save the sample email to a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        self.directory = tempfile.mkdtemp()
+        database_config.DATABASE_PATH = os.path.join(self.directory, 'metadata.db')
+        database_config.initialize_database()
+
+        self.metadata = []
+        for i in range(5):
+            metadata = EmailMetadataExtractor(email_path=SAMPLE_EMAIL).extract_metadata()
+            metadata['message_id'] = f'<export-{i}@example.com>'
+            self.metadata.append(metadata)
+        save_metadata_batch(self.metadata)
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary files."""
+        database_config.DATABASE_PATH = self.original_path
+        shutil.rmtree(self.directory)
+
+    def test_export_database_csv(self):
+        """Test that list fields are JSON arrays and rows span several row groups."""
+        path = os.path.join(self.directory, 'export.csv')
+        self.assertEqual(columnar_export.export_database(path, row_group_size=2), 5)
+
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(list(rows[0]), [column for column, _, _ in columnar_export.COLUMNS])
+        self.assertEqual([row['message_id'] for row in rows], [f'<export-{i}@example.com>' for i in range(5)])
+        self.assertEqual(json.loads(rows[0]['to_emails']), self.metadata[0]['to_emails'])
+        self.assertEqual(json.loads(rows[0]['received']), [str(h) for h in self.metadata[0]['received']])
+        self.assertTrue(rows[0]['id'].isdigit())
+
+    def test_archived_bodies_skipped(self):
+        """Test that messages whose body partition is gone are skipped and counted."""
+        conn = database_config.get_db_connection()
+        conn.execute(
+            """INSERT INTO email_metadata (message_id, subject, date_epoch, metadata_json, body_partition)
+               VALUES ('<archived@example.com>', 'Archived', 1577836800, NULL, '2020_01')"""
+        )
+        conn.commit()
+        conn.close()
+
+        path = os.path.join(self.directory, 'export.csv')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(columnar_export.export_database(path), 5)
+        self.assertIn('skipped 1 messages', output.getvalue())
+        with open(path, newline='', encoding='utf-8') as f:
+            self.assertNotIn('<archived@example.com>', [row['message_id'] for row in csv.DictReader(f)])
+
+    def test_csv_fallback(self):
+        """Test that Parquet is replaced by CSV when pyarrow is missing."""
+        with mock.patch('columnar_export.pyarrow', None):
+            writer = columnar_export.ColumnarWriter(os.path.join(self.directory, 'export.parquet'))
+            with writer:
+                writer.write_many(self.metadata)
+        self.assertEqual(writer.format, 'csv')
+        self.assertTrue(writer.path.endswith('export.csv'))
+        self.assertEqual(writer.rows_written, 5)
+
+    @unittest.skipUnless(columnar_export.pyarrow, 'pyarrow is not installed')
+    def test_export_arrow_formats(self):
+        """Test list columns and row groups in Parquet and Arrow IPC files."""
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        path = os.path.join(self.directory, 'export.parquet')
+        columnar_export.export_database(path, row_group_size=2)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(str(table.schema.field('domains').type), 'list<element: string>')
+        self.assertEqual(table.column('domains')[0].as_py(), self.metadata[0]['domains'])
+
+        path = os.path.join(self.directory, 'export.arrow')
+        columnar_export.export_database(path, row_group_size=2)
+        reader = pyarrow.ipc.open_file(path)
+        self.assertEqual(reader.num_record_batches, 3)
+        self.assertEqual(reader.read_all().column('ip_addresses')[0].as_py(), self.metadata[0]['ip_addresses'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for database configuration
+
+This script contains unit tests for the database_config module.
+"""
+
+import unittest
+import os
+import sqlite3
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
+from unittest import mock
+
+import database_config
+import campaign_clustering
+import response_cache
+import volume_rollups
+from email_metadata_extractor import save_metadata_batch
+
+
+def _save_messages(worker: int) -> list:
+    """Save a batch of messages from a separate process."""
+    return save_metadata_batch([
+        {'message_id': f'<{worker}-{i}@example.com>', 'from': f'user{i}@example.com', 'domains': ['example.com']}
+        for i in range(20)
+    ])
+
+
+class TestDatabaseConfig(unittest.TestCase):
+    """Test cases for database_config functions."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def test_date_epoch_migration(self):
+        """Test that databases without date_epoch are migrated and backfilled."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE email_metadata (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, message_id TEXT UNIQUE, sender TEXT,
+            recipient TEXT, subject TEXT, date TEXT, metadata_json TEXT,
+            processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.executemany(
+            "INSERT INTO email_metadata (message_id, date) VALUES (?, ?)",
+            [('<1@example.com>', 'Mon, 01 Jan 2023 12:00:00 +0000'), ('<2@example.com>', 'bogus')]
+        )
+        conn.commit()
+        conn.close()
+
+        database_config.initialize_database()
+
+        conn = database_config.get_db_connection()
+        rows = conn.execute("SELECT message_id, date_epoch FROM email_metadata ORDER BY id").fetchall()
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM email_metadata WHERE date_epoch >= ?", (0,)
+        ).fetchall()
+        conn.close()
+
+        self.assertEqual([tuple(row) for row in rows], [('<1@example.com>', 1672574400), ('<2@example.com>', None)])
+        self.assertIn('idx_email_metadata_date_epoch', ' '.join(row[-1] for row in plan))
+
+        # The unparseable Date header is not retried on every start
+        with mock.patch.object(database_config, 'parse_date_header') as parse:
+            database_config.initialize_database()
+        parse.assert_not_called()
+
+    def test_search_date_range(self):
+        """Test filtering searches and exports by date range."""
+        database_config.initialize_database()
+        database_config.save_email_metadata('<1@example.com>', 'a@example.com', '', '', 'Mon, 01 Jan 2023 12:00:00 +0000', '{}')
+        database_config.save_email_metadata('<2@example.com>', 'b@example.com', '', '', 'Sun, 01 Jan 2023 00:00:00 +0000', '{}')
+        database_config.save_email_metadata('<3@example.com>', 'c@example.com', '', '', 'Wed, 01 Feb 2023 00:00:00 +0000', '{}')
+
+        january = database_config.search_email_metadata('example.com', 'sender', start=1672531200, end=1675209600)
+        self.assertEqual(sorted(row['message_id'] for row in january), ['<1@example.com>', '<2@example.com>'])
+
+        exported = [row['message_id'] for row in database_config.iter_email_metadata(start=1672531201)]
+        self.assertEqual(exported, ['<1@example.com>', '<3@example.com>'])
+
+        # Undated messages are only left out when a range is given
+        database_config.save_email_metadata('<4@example.com>', 'd@example.com', '', '', 'bogus', '{}')
+        exported = [row['message_id'] for row in database_config.iter_email_metadata()]
+        self.assertEqual(exported, ['<4@example.com>', '<2@example.com>', '<1@example.com>', '<3@example.com>'])
+        exported = [row['message_id'] for row in database_config.iter_email_metadata(end=1675209600)]
+        self.assertEqual(exported, ['<2@example.com>', '<1@example.com>'])
+
+    def test_concurrent_writers(self):
+        """Test that writers in several processes queue on the lock instead of failing."""
+        database_config.initialize_database()
+
+        conn = database_config.get_db_connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        conn.close()
+
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            results = pool.map(_save_messages, range(8))
+
+        self.assertTrue(all(metadata_id for batch in results for metadata_id in batch))
+        conn = database_config.get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM email_metadata").fetchone()[0], 160)
+        conn.close()
+
+    def test_update_related_emails(self):
+        """Test bulk renames, conflicts in input order and rollback on failure."""
+        database_config.initialize_database()
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany("INSERT INTO related_emails (email_address) VALUES (?)",
+                         [(f'user{i}@example.org',) for i in range(3000)])
+        conn.commit()
+        conn.close()
+
+        updates = [
+            ('admin@gmail.com', 'info@gmail.com'),      # swap with the next update
+            ('info@gmail.com', 'admin@gmail.com'),
+            ('support@gmail.com', 'help@gmail.com'),
+            ('admin@yahoo.com', 'help@gmail.com'),      # help@gmail.com was claimed first
+            ('info@yahoo.com', 'support@yahoo.com'),    # support@yahoo.com stays
+            ('support@yahoo.com', 'support@yahoo.com'),
+            ('admin@gmail.com', 'other@gmail.com'),
+            ('missing@gmail.com', 'new@gmail.com'),
+            ('admin@outlook.com', 'info@hotmail.com'),  # info@hotmail.com moves on but conflicts
+            ('info@hotmail.com', 'admin@yahoo.com'),
+        ] + [(f'user{i}@example.org', f'user{i + 1}@example.org') for i in range(3000)]
+        results = database_config.update_related_emails(updates)
+        statuses = [result['status'] for result in results]
+        self.assertEqual(statuses[:10], ['updated', 'updated', 'updated', 'conflict', 'conflict',
+                                         'unchanged', 'duplicate', 'not_found', 'conflict', 'conflict'])
+        # Each address takes over the next one, which moves on in turn
+        self.assertEqual(set(statuses[10:]), {'updated'})
+
+        emails = {row['email_address'] for domain in ('gmail.com', 'yahoo.com')
+                  for row in database_config.search_related_emails(domain)}
+        self.assertEqual(emails, {'info@gmail.com', 'admin@gmail.com', 'help@gmail.com',
+                                  'admin@yahoo.com', 'info@yahoo.com', 'support@yahoo.com'})
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM related_emails WHERE email_address LIKE 'user%'").fetchone()[0], 3000)
+        self.assertIsNone(conn.execute("SELECT id FROM related_emails WHERE email_address = 'user0@example.org'").fetchone())
+        conn.close()
+
+        # A long chain of renames ending at an address that stays conflicts as a whole
+        chain = [(f'user{i}@example.org', f'user{i - 1}@example.org') for i in range(2, 3001)]
+        chain.append(('user1@example.org', 'admin@yahoo.com'))
+        started = time.perf_counter()
+        results = database_config.update_related_emails(chain)
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual({result['status'] for result in results}, {'conflict'})
+        self.assertEqual(database_config.update_related_emails(chain[:-1])[0]['status'], 'conflict')
+
+        # A failing update changes nothing
+        self.assertIsNone(database_config.update_related_emails([('info@gmail.com', None)]))
+        self.assertIn('info@gmail.com', [row['email_address'] for row in database_config.search_related_emails('gmail.com')])
+
+
+class TestMonthlyPartitions(unittest.TestCase):
+    """Test cases for the monthly partitions of the email metadata."""
+
+    def setUp(self):
+        """Use a temporary database and partition directory."""
+        self.original_path = database_config.DATABASE_PATH
+        self.original_partition_dir = database_config.PARTITION_DIR
+        self.original_max_attached = database_config.MAX_ATTACHED_PARTITIONS
+        self.tmp_dir = tempfile.mkdtemp()
+        database_config.DATABASE_PATH = os.path.join(self.tmp_dir, 'metadata.db')
+        database_config.PARTITION_DIR = os.path.join(self.tmp_dir, 'partitions')
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the configuration and remove the temporary files."""
+        database_config.DATABASE_PATH = self.original_path
+        database_config.PARTITION_DIR = self.original_partition_dir
+        database_config.MAX_ATTACHED_PARTITIONS = self.original_max_attached
+        shutil.rmtree(self.tmp_dir)
+
+    def _metadata(self, message_id: str, date: str) -> dict:
+        return {'message_id': message_id, 'from': 'a@example.com', 'date': date, 'subject': f'Report {message_id}'}
+
+    def _partition_rows(self, partition: str) -> list:
+        conn = sqlite3.connect(database_config.partition_path(partition))
+        rows = conn.execute("SELECT message_id, body_partition FROM email_metadata ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    def test_routing_and_fan_out(self):
+        """Test that messages land in their month's file and are read back from it."""
+        # Two partitions per transaction forces the batch to be split
+        database_config.MAX_ATTACHED_PARTITIONS = 2
+        ids = save_metadata_batch([
+            self._metadata('<jan@example.com>', 'Mon, 16 Jan 2023 12:00:00 +0000'),
+            self._metadata('<feb@example.com>', 'Wed, 01 Feb 2023 00:00:00 +0000'),
+            self._metadata('<mar@example.com>', 'Wed, 01 Mar 2023 00:00:00 +0000'),
+            self._metadata('<undated@example.com>', ''),
+        ])
+        self.assertTrue(all(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual([info['partition'] for info in database_config.list_partitions()],
+                         ['2023_01', '2023_02', '2023_03'])
+
+        # Only undated messages stay in the main database
+        conn = database_config.get_db_connection()
+        rows = conn.execute("SELECT message_id, body_partition FROM email_metadata ORDER BY id")
+        self.assertEqual([tuple(row) for row in rows], [('<undated@example.com>', None)])
+        conn.close()
+        self.assertEqual(self._partition_rows('2023_02'), [('<feb@example.com>', '2023_02')])
+
+        results = database_config.search_email_metadata('example', 'message_id', limit=2, offset=1)
+        self.assertEqual([row['id'] for row in results], ids[1:3])
+        self.assertEqual(database_config.count_email_metadata('example', 'message_id'), 4)
+        results = database_config.search_email_metadata('feb', 'message_id')
+        self.assertEqual(json.loads(results[0]['metadata_json'])['message_id'], '<feb@example.com>')
+        exported = list(database_config.iter_email_metadata(start=1672531200))
+        self.assertEqual([json.loads(row['metadata_json'])['subject'] for row in exported],
+                         ['Report <jan@example.com>', 'Report <feb@example.com>', 'Report <mar@example.com>'])
+        self.assertEqual([row['message_id'] for row in database_config.iter_email_metadata()][0],
+                         '<undated@example.com>')
+
+        # A new Date header moves the message to the other month under the same ID
+        save_metadata_batch([self._metadata('<jan@example.com>', 'Thu, 02 Mar 2023 00:00:00 +0000')])
+        self.assertEqual(self._partition_rows('2023_01'), [])
+        moved = database_config.search_email_metadata('jan', 'message_id')[0]
+        self.assertEqual((moved['id'], moved['body_partition']), (ids[0], '2023_03'))
+        self.assertTrue(json.loads(moved['metadata_json'])['date'].startswith('Thu, 02 Mar'))
+
+    def test_date_bounded_queries_attach_overlapping_partitions(self):
+        """Test that date-bounded reads attach only the partitions of the range."""
+        save_metadata_batch([
+            self._metadata('<jan@example.com>', 'Mon, 16 Jan 2023 12:00:00 +0000'),
+            self._metadata('<feb@example.com>', 'Wed, 01 Feb 2023 00:00:00 +0000'),
+            self._metadata('<mar@example.com>', 'Wed, 01 Mar 2023 00:00:00 +0000'),
+        ])
+        statements = []
+        connect = database_config.get_db_connection
+
+        def traced_connection():
+            conn = connect()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        february = {'start': 1675209600, 'end': 1677628800}
+        with mock.patch.object(database_config, 'get_db_connection', traced_connection):
+            results = database_config.search_email_metadata('example', 'message_id', **february)
+            exported = list(database_config.iter_email_metadata(**february))
+        self.assertEqual([row['message_id'] for row in results], ['<feb@example.com>'])
+        self.assertEqual([row['message_id'] for row in exported], ['<feb@example.com>'])
+        attached = {statement.split(' AS ')[-1] for statement in statements if statement.startswith('ATTACH')}
+        self.assertEqual(attached, {'p_2023_02'})
+
+    def test_existing_rows_partitioned(self):
+        """Test that messages saved before partitioning was enabled are moved on start."""
+        database_config.PARTITION_DIR = None
+        dated = database_config.save_email_metadata('<old@example.com>', 'a@example.com', 'b@example.com', 'Old',
+                                                    'Mon, 16 Jan 2023 12:00:00 +0000', '{"subject": "Old"}')
+        undated = database_config.save_email_metadata('<undated@example.com>', 'a@example.com', 'b@example.com',
+                                                      'Undated', '', '{}')
+
+        database_config.PARTITION_DIR = os.path.join(self.tmp_dir, 'partitions')
+        database_config.initialize_database()
+        self.assertEqual(self._partition_rows('2023_01'), [('<old@example.com>', '2023_01')])
+        old = database_config.search_email_metadata('old', 'message_id')[0]
+        self.assertEqual((old['id'], json.loads(old['metadata_json'])), (dated, {'subject': 'Old'}))
+        self.assertEqual(database_config.count_email_metadata('example', 'message_id'), 2)
+
+        # New messages get IDs after the moved ones; re-saving keeps the ID
+        new_id = database_config.save_email_metadata('<new@example.com>', 'a@example.com', 'b@example.com',
+                                                     'New', 'Mon, 16 Jan 2023 13:00:00 +0000', '{}')
+        self.assertGreater(new_id, max(dated, undated))
+        self.assertEqual(database_config.save_email_metadata('<old@example.com>', 'a@example.com', 'b@example.com',
+                                                             'Old', 'Mon, 16 Jan 2023 12:00:00 +0000', '{}'), dated)
+
+    def test_drop_keeps_rollups_and_clusters(self):
+        """Test that dropped months stay in rebuilt rollups and clusters outlive their representative."""
+        def metadata(message_id, date):
+            return dict(self._metadata(message_id, date), subject='Weekly digest',
+                        from_email='news@bulk.example', domains=['bulk.example'])
+
+        ids = save_metadata_batch([
+            metadata('<jan@example.com>', 'Mon, 16 Jan 2023 12:00:00 +0000'),
+            metadata('<feb@example.com>', 'Wed, 01 Feb 2023 00:00:00 +0000'),
+            metadata('<mar@example.com>', 'Wed, 01 Mar 2023 00:00:00 +0000'),
+        ])
+        self.assertEqual({campaign_clustering.get_cluster_id(i) for i in ids}, {ids[0]})
+        before = volume_rollups.get_volume_series('sender', 'news@bulk.example')
+
+        self.assertTrue(database_config.drop_partition('2023_01'))
+        self.assertTrue(database_config.archive_partition('2023_02', os.path.join(self.tmp_dir, 'archive')))
+        # Only March is still stored; the other months count from their recorded keys
+        self.assertEqual(volume_rollups.rebuild_rollups(), 1)
+        self.assertEqual(volume_rollups.get_volume_series('sender', 'news@bulk.example'), before)
+
+        # The oldest remaining member represents the cluster and new copies still join it
+        self.assertEqual(campaign_clustering.get_cluster_id(ids[1]), ids[1])
+        new_id = save_metadata_batch([metadata('<apr@example.com>', 'Sat, 01 Apr 2023 00:00:00 +0000')])[0]
+        self.assertEqual(campaign_clustering.get_cluster_id(new_id), ids[1])
+        self.assertEqual(campaign_clustering.list_clusters()[0]['size'], 3)
+        self.assertEqual([member['id'] for member in campaign_clustering.get_cluster_members(ids[1])],
+                         [ids[2], new_id])
+
+    def test_retention(self):
+        """Test archiving and dropping whole partitions."""
+        save_metadata_batch([
+            self._metadata('<old@example.com>', 'Mon, 16 Jan 2023 12:00:00 +0000'),
+            self._metadata('<mid@example.com>', 'Wed, 01 Feb 2023 00:00:00 +0000'),
+            self._metadata('<new@example.com>', 'Wed, 01 Mar 2023 00:00:00 +0000'),
+        ])
+        march = 1678000000
+
+        archive_dir = os.path.join(self.tmp_dir, 'archive')
+        archived_path = os.path.join(archive_dir, 'email_metadata_2023_01.db')
+        generation = response_cache.get_write_generation()[0]
+        self.assertEqual(database_config.apply_retention(2, archive_dir, now=march), ['2023_01'])
+        self.assertGreater(response_cache.get_write_generation()[0], generation)
+        self.assertTrue(os.path.exists(archived_path))
+        self.assertEqual(database_config.search_email_metadata('old', 'message_id'), [])
+
+        # Saving into the archived month is refused instead of starting a new file
+        self.assertEqual(save_metadata_batch([
+            self._metadata('<old@example.com>', 'Mon, 16 Jan 2023 12:00:00 +0000'),
+            self._metadata('<late@example.com>', 'Tue, 17 Jan 2023 12:00:00 +0000'),
+            self._metadata('<old@example.com>', 'Wed, 01 Mar 2023 12:00:00 +0000'),
+        ]), [None, None, None])
+        self.assertFalse(os.path.exists(database_config.partition_path('2023_01')))
+
+        # Moving the file back restores the month
+        shutil.move(archived_path, database_config.partition_path('2023_01'))
+        self.assertEqual(len(database_config.search_email_metadata('old', 'message_id')), 1)
+
+        self.assertTrue(database_config.drop_partition('2023_02'))
+        self.assertEqual(database_config.search_email_metadata('mid', 'message_id'), [])
+        self.assertEqual([info['partition'] for info in database_config.list_partitions()],
+                         ['2023_01', '2023_03'])
+        # A dropped month starts over
+        self.assertIsNotNone(save_metadata_batch([self._metadata('<mid@example.com>', 'Wed, 01 Feb 2023 00:00:00 +0000')])[0])
+
+if __name__ == '__main__':
+    unittest.main()
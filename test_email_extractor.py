@@ -9,8 +9,10 @@ This script contains unit tests for the EmailMetadataExtractor class.
 
 import unittest
 import os
+import time
 import tempfile
 from email.message import EmailMessage
+import email_metadata_extractor
 from email_metadata_extractor import EmailMetadataExtractor
 
 
@@ -83,6 +85,9 @@ class TestEmailMetadataExtractor(unittest.TestCase):
         
         # Check IP addresses
         self.assertIn('192.168.1.1', metadata['ip_addresses'])
+        
+        # Check parsed date
+        self.assertEqual(metadata['date_epoch'], 1672574400)
 
     def test_extract_email_addresses(self):
         """Test extracting email addresses from header values."""
@@ -144,7 +149,95 @@ class TestEmailMetadataExtractor(unittest.TestCase):
         # Check that it's a valid JSON string
         self.assertIsInstance(json_str, str)
         self.assertTrue(json_str.startswith('{'))
-        self.assertTrue(json_str.endswith('}')
+        self.assertTrue(json_str.endswith('}'))
+
+    def test_ipv6_addresses(self):
+        """Test extracting IPv6 hop addresses next to IPv4 ones."""
+        raw = (b'Received: from a.example ([IPv6:2001:DB8::25]) by mx.example\n'
+               b'\twith ESMTPS; Mon, 2 Jan 2023 10:23:45 +0000\n'
+               b'Received: from b.example (b.example [2001:db8:0:1::7]) by a.example\n'
+               b'Received: from c.example ([192.0.2.1] helo=2001:db8::9) by b.example\n'
+               b'From: sender@example.com\nSubject: IPv6\n\nbody\n')
+        metadata = EmailMetadataExtractor(email_content=raw).extract_metadata()
+        self.assertEqual(metadata['ip_addresses'],
+                         ['2001:db8::25', '2001:db8:0:1::7', '192.0.2.1', '2001:db8::9'])
+
+    def test_limits(self):
+        """Test that pathological headers are cut at the limits and marked."""
+        raw = (b'From: sender@example.com\n'
+               + b''.join(b'Received: from h%d ([10.0.0.%d]) by mx\n' % (i, i % 256) for i in range(500))
+               + b'To: ' + b', '.join(b'user%d@example.com' % i for i in range(5000)) + b'\n'
+               + b'Cc: ' + b'a' * 300000 + b'\n'
+               + b'Subject: Limits\n\nbody\n')
+        limits = {'max_hops': 10, 'max_addresses': 50, 'max_ip_addresses': 5, 'max_header_bytes': 4096}
+        before = email_metadata_extractor.limit_metrics['truncated_messages']
+
+        started = time.perf_counter()
+        metadata = EmailMetadataExtractor(email_content=raw, limits=limits).extract_metadata()
+        self.assertLess(time.perf_counter() - started, 2)
+
+        self.assertEqual(len(metadata['received']), 10)
+        self.assertEqual(metadata['to_emails'][:2], ['user0@example.com', 'user1@example.com'])
+        self.assertEqual(len(metadata['to_emails']), 50)
+        self.assertEqual(len(metadata['ip_addresses']), 5)
+        self.assertEqual(metadata['cc_emails'], [])
+        self.assertEqual(metadata['subject'], 'Limits')
+        self.assertEqual(metadata['truncated'], {
+            'received': 'max_hops', 'to': 'max_header_bytes', 'to_emails': 'max_addresses',
+            'cc': 'max_header_bytes', 'ip_addresses': 'max_ip_addresses',
+        })
+        self.assertEqual(email_metadata_extractor.limit_metrics['truncated_messages'], before + 1)
+
+        # Ordinary messages are not marked
+        self.assertEqual(self.extractor.extract_metadata()['truncated'], {})
+
+    def test_oversized_header_is_skipped(self):
+        """Test that the headers after an oversized one are still read."""
+        raw = (b'To: ' + b', '.join(b'user%d@example.com' % i for i in range(80000)) + b'\n'
+               + b'From: sender@example.com\n'
+               + b'Subject: Quarterly report, final, ' + b'x' * 200 + b'\n'
+               + b'Date: Mon, 01 Jan 2024 12:00:00 +0000\n'
+               + b'Message-ID: <huge@example.com>\n\nbody\n')
+        self.assertGreater(len(raw), 1500000)
+
+        metadata = EmailMetadataExtractor(email_content=raw, limits={'max_header_bytes': 128}).extract_metadata()
+        self.assertEqual(metadata['from'], 'sender@example.com')
+        self.assertEqual(metadata['message_id'], '<huge@example.com>')
+        self.assertEqual(metadata['date_epoch'], 1704110400)
+        self.assertEqual(metadata['to_emails'][:2], ['user0@example.com', 'user1@example.com'])
+        self.assertTrue(all(address.endswith('@example.com') for address in metadata['to_emails']))
+        # Only address lists are cut between entries
+        self.assertEqual(len(metadata['subject']), 128 - len('Subject: '))
+        # The attachment scan does not cut single headers and skips the oversized header block
+        self.assertEqual(metadata['truncated'], {'to': 'max_header_bytes', 'subject': 'max_header_bytes',
+                                                 'attachments': 'max_header_section_bytes'})
+
+    def test_attachment_limits(self):
+        """Test that a limit of 0 means none and None means no limit."""
+        raw = (b'From: sender@example.com\nMIME-Version: 1.0\n'
+               b'Content-Type: multipart/mixed; boundary="b"\n\n'
+               b'--b\nContent-Type: text/plain\n\nhello\n'
+               b'--b\nContent-Type: application/pdf\nContent-Disposition: attachment; filename="a.pdf"\n\n%PDF\n'
+               b'--b--\n')
+        metadata = EmailMetadataExtractor(email_content=raw, limits={'max_attachments': 0}).extract_metadata()
+        self.assertEqual(metadata['attachments'], [])
+        self.assertEqual(metadata['truncated'], {'attachments': 'max_attachments'})
+
+        metadata = EmailMetadataExtractor(email_content=raw, limits={'max_attachments': None}).extract_metadata()
+        self.assertEqual([a['filename'] for a in metadata['attachments']], ['a.pdf'])
+
+    def test_header_section_and_time_limits(self):
+        """Test the header section limit and skipping optional steps once the time budget is spent."""
+        raw = b'From: sender@example.com\n' + b'X-Pad: ' + b'x' * 100 + b'\n' + b'Subject: Lost\n\nbody\n'
+        metadata = EmailMetadataExtractor(email_content=raw, limits={'max_header_section_bytes': 64}).extract_metadata()
+        self.assertEqual(metadata['from'], 'sender@example.com')
+        self.assertEqual(metadata['subject'], '')
+        self.assertEqual(metadata['truncated']['headers'], 'max_header_section_bytes')
+
+        metadata = EmailMetadataExtractor(email_path=self.temp_file.name, limits={'time_budget': 0}).extract_metadata()
+        self.assertEqual(metadata['attachments'], [])
+        self.assertEqual(metadata['truncated']['attachments'], 'time_budget')
+        self.assertIn('recipient@example.com', metadata['to_emails'])
 
 
 if __name__ == '__main__':
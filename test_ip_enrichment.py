@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for IP enrichment
+
+This script contains unit tests for the range-file index mapping IPs to ASN, organization and country.
+"""
+
+import unittest
+import os
+import tempfile
+
+import ip_enrichment
+
+
+class TestIPEnricher(unittest.TestCase):
+    """Test cases for IPEnricher."""
+
+    def _write(self, content: str, suffix: str = '.csv') -> str:
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, path)
+        return path
+
+    def test_network_csv(self):
+        """Test CIDR-keyed CSV files with IPv4 and IPv6 networks."""
+        path = self._write(
+            'network,autonomous_system_number,autonomous_system_organization,country\n'
+            '203.0.113.0/24,64500,Example Transit,NL\n'
+            '192.0.2.0/25,64496,Example Mail,US\n'
+            '2001:db8::/32,64501,Example IPv6,DE\n'
+        )
+        enricher = ip_enrichment.IPEnricher.from_file(path)
+        self.assertEqual(len(enricher), 3)
+
+        self.assertEqual(enricher.lookup('192.0.2.17'), {'asn': 64496, 'org': 'Example Mail', 'country': 'US'})
+        self.assertEqual(enricher.lookup('203.0.113.255')['asn'], 64500)
+        self.assertEqual(enricher.lookup('2001:db8:1::25')['org'], 'Example IPv6')
+        # Gap between ranges, outside all ranges, and invalid input
+        self.assertIsNone(enricher.lookup('192.0.2.200'))
+        self.assertIsNone(enricher.lookup('10.0.0.1'))
+        self.assertIsNone(enricher.lookup('not-an-ip'))
+
+    def test_ip2asn_tsv(self):
+        """Test headerless ip2asn ranges, which mark unrouted space with AS 0."""
+        path = self._write(
+            '1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n'
+            '1.0.1.0\t1.0.3.255\t0\tNone\tNot routed\n',
+            suffix='.tsv'
+        )
+        enricher = ip_enrichment.IPEnricher.from_file(path)
+
+        self.assertEqual(
+            enricher.enrich(['1.0.0.1', '8.8.8.8', '1.0.2.5']),
+            [{'asn': 13335, 'org': 'CLOUDFLARENET', 'country': 'US', 'ip': '1.0.0.1'},
+             {'asn': None, 'org': 'Not routed', 'country': 'NONE', 'ip': '1.0.2.5'}]
+        )
+        self.assertEqual(enricher.lookup.cache_info().currsize, 3)
+
+    def test_nested_ranges(self):
+        """Test that addresses after a nested range resolve to the enclosing one."""
+        path = self._write(
+            'network,asn,org,country\n'
+            '10.0.0.0/8,64500,Outer,US\n'
+            '10.1.0.0/16,64501,Middle,NL\n'
+            '10.1.2.0/24,64502,Inner,DE\n'
+            '10.1.2.128/25,64503,Innermost,FR\n'
+            '10.2.0.0/16,64504,Sibling,GB\n'
+        )
+        enricher = ip_enrichment.IPEnricher.from_file(path)
+
+        expected = {
+            '10.0.0.1': 'Outer', '10.1.0.1': 'Middle', '10.1.2.1': 'Inner',
+            '10.1.2.200': 'Innermost', '10.1.3.1': 'Middle', '10.1.255.255': 'Middle',
+            '10.2.0.1': 'Sibling', '10.3.0.1': 'Outer', '10.255.255.255': 'Outer',
+        }
+        for ip, org in expected.items():
+            self.assertEqual(enricher.lookup(ip)['org'], org, ip)
+        self.assertIsNone(enricher.lookup('11.0.0.1'))
+
+    def test_overlapping_ranges(self):
+        """Test that the later starting range wins where two ranges overlap."""
+        path = self._write(
+            'start,end,asn,org,country\n'
+            '192.0.2.0,192.0.2.100,64500,First,US\n'
+            '192.0.2.50,192.0.2.200,64501,Second,NL\n'
+        )
+        enricher = ip_enrichment.IPEnricher.from_file(path)
+
+        self.assertEqual(enricher.lookup('192.0.2.49')['org'], 'First')
+        self.assertEqual(enricher.lookup('192.0.2.50')['org'], 'Second')
+        self.assertEqual(enricher.lookup('192.0.2.150')['org'], 'Second')
+        self.assertIsNone(enricher.lookup('192.0.2.201'))
+
+
+if __name__ == '__main__':
+    unittest.main()
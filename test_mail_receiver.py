@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the LMTP/SMTP mail receiver
+
+This script sends messages to a local MailReceiver with smtplib and checks
+that they are extracted and saved.
+"""
+
+import unittest
+import os
+import asyncio
+import socket
+import smtplib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from unittest import mock
+
+import database_config
+import streaming_analytics
+from mail_receiver import MailReceiver
+
+
+def _message(i):
+    """Create a small test message."""
+    msg = EmailMessage()
+    msg['From'] = 'sender@example.com'
+    msg['To'] = 'recipient@example.com'
+    msg['Subject'] = f'Receiver test {i}'
+    msg['Date'] = 'Mon, 01 Jan 2023 12:00:00 +0000'
+    msg['Message-ID'] = f'<receiver-{i}@example.com>'
+    msg.set_content('.leading dot line\nbody\n')
+    return msg
+
+
+class TestMailReceiver(unittest.TestCase):
+    """Test cases for MailReceiver."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def _run(self, lmtp, send, executor=True):
+        async def scenario():
+            receiver = MailReceiver(port=0, lmtp=lmtp, workers=2, queue_size=2,
+                                    executor=ThreadPoolExecutor(max_workers=2) if executor else None)
+            await receiver.start()
+            try:
+                return await asyncio.to_thread(send, receiver.port), receiver.stats
+            finally:
+                await receiver.stop()
+        return asyncio.run(scenario())
+
+    def test_lmtp_delivery(self):
+        """Test that LMTP messages are saved and each recipient gets a status."""
+        def send(port):
+            with smtplib.LMTP('127.0.0.1', port) as client:
+                refused = [client.send_message(_message(i), to_addrs=['a@example.com']) for i in range(5)]
+
+            # smtplib reads a single reply after DATA, so check per-recipient replies directly
+            with socket.create_connection(('127.0.0.1', port)) as sock:
+                stream = sock.makefile('rwb')
+                stream.write(b'LHLO client\r\nMAIL FROM:<s@example.com>\r\n'
+                             b'RCPT TO:<a@example.com>\r\nRCPT TO:<b@example.com>\r\nDATA\r\n')
+                stream.flush()
+                for _ in range(10):  # greeting, 5 LHLO lines, MAIL, 2 RCPT, DATA
+                    stream.readline()
+                stream.write(_message(5).as_bytes().replace(b'\n', b'\r\n') + b'.\r\nQUIT\r\n')
+                stream.flush()
+                statuses = [stream.readline()[:3], stream.readline()[:3]]
+            return refused, statuses
+
+        (refused, statuses), stats = self._run(True, send)
+
+        self.assertEqual(refused, [{}] * 5)
+        self.assertEqual(statuses, [b'250', b'250'])
+        self.assertEqual(stats['saved'], 6)
+        rows = database_config.search_email_metadata('receiver-', 'message_id')
+        self.assertEqual(len(rows), 6)
+
+    def test_smtp_delivery(self):
+        """Test SMTP delivery with concurrent sessions over a small queue."""
+        def send(port):
+            def deliver(i):
+                with smtplib.SMTP('127.0.0.1', port) as client:
+                    return client.send_message(_message(i))
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                return list(pool.map(deliver, range(8)))
+
+        refused, stats = self._run(False, send)
+
+        self.assertEqual(refused, [{}] * 8)
+        self.assertEqual(stats, {'received': 8, 'saved': 8, 'failed': 0})
+        self.assertEqual(len(database_config.search_email_metadata('receiver-', 'message_id')), 8)
+
+    def test_process_pool_delivery(self):
+        """Test the default process pool, whose sketch updates are made in the parent."""
+        def send(port):
+            with smtplib.LMTP('127.0.0.1', port) as client:
+                return [client.send_message(_message(i), to_addrs=['a@example.com']) for i in range(3)]
+
+        analytics = streaming_analytics.StreamingAnalytics()
+        with mock.patch.object(streaming_analytics, 'analytics', analytics):
+            refused, stats = self._run(True, send, executor=False)
+
+        self.assertEqual(refused, [{}] * 3)
+        self.assertEqual(stats, {'received': 3, 'saved': 3, 'failed': 0})
+        self.assertEqual(analytics.estimate('sender_domains', 'example.com'), 3)
+
+    def test_long_lines_in_data(self):
+        """Test that only pieces starting a line are unstuffed or end DATA."""
+        async def scenario():
+            reader = asyncio.StreamReader(limit=8)
+            task = asyncio.create_task(MailReceiver()._read_data(reader))
+            # A line longer than the limit arrives in pieces; the piece read
+            # after the first does not start a line
+            for piece in (b'..' + b'A' * 12, b'.\r\n', b'..dot\r\n.\r\n'):
+                reader.feed_data(piece)
+                for _ in range(5):
+                    await asyncio.sleep(0)
+            return await asyncio.wait_for(task, 5)
+
+        self.assertEqual(asyncio.run(scenario()), b'.' + b'A' * 12 + b'.\r\n.dot\r\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the incremental Maildir watcher
+
+This script contains unit tests for MaildirWatcher checkpointing.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from email.message import EmailMessage
+
+import database_config
+import maildir_watcher
+from maildir_watcher import MaildirWatcher
+
+
+class TestMaildirWatcher(unittest.TestCase):
+    """Test cases for MaildirWatcher."""
+
+    def setUp(self):
+        """Create a Maildir and point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        self.temp_dir = tempfile.mkdtemp()
+        database_config.DATABASE_PATH = os.path.join(self.temp_dir, 'test.db')
+        database_config.initialize_database()
+        self.maildir = os.path.join(self.temp_dir, 'Maildir')
+        for sub in ('new', 'cur', 'tmp'):
+            os.makedirs(os.path.join(self.maildir, sub))
+        self.watcher = MaildirWatcher([self.maildir], use_inotify=False)
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary files."""
+        database_config.DATABASE_PATH = self.original_path
+        shutil.rmtree(self.temp_dir)
+
+    def _deliver(self, i, subdir='new'):
+        msg = EmailMessage()
+        msg['From'] = 'sender@example.com'
+        msg['To'] = 'recipient@example.com'
+        msg['Subject'] = f'Spool message {i}'
+        msg['Message-ID'] = f'<spool-{i}@example.com>'
+        msg.set_content('Hello')
+        path = os.path.join(self.maildir, subdir, f'{i}.host')
+        with open(path, 'wb') as f:
+            f.write(msg.as_bytes())
+        return path
+
+    def test_incremental_scan(self):
+        """Test that only new or changed files are ingested."""
+        for i in range(3):
+            self._deliver(i)
+        self._deliver(99, 'tmp')
+
+        self.assertEqual(self.watcher.scan(), {'ingested': 3, 'failed': 0})
+        self.assertEqual(self.watcher.scan(), {'ingested': 0, 'failed': 0})
+
+        self._deliver(3)
+        self.assertEqual(self.watcher.scan(), {'ingested': 1, 'failed': 0})
+        self.assertEqual(len(database_config.search_email_metadata('spool-', 'message_id')), 4)
+
+    def _settle(self):
+        """Backdate the Maildir directories so their mtimes are old enough to checkpoint."""
+        for root, _, _ in os.walk(self.maildir):
+            os.utime(root, ns=(10 ** 18, 10 ** 18))
+
+    def test_unchanged_directories_not_listed(self):
+        """Test that a steady-state pass only lists the directories that changed."""
+        self._deliver(0)
+        self._settle()
+        self.watcher.scan()
+
+        with mock.patch('maildir_watcher.os.scandir', wraps=os.scandir) as scandir:
+            self.assertEqual(self.watcher.scan(), {'ingested': 0, 'failed': 0})
+            self.assertEqual(scandir.call_count, 0)
+
+            self._deliver(1, 'cur')
+            self.assertEqual(self.watcher.scan(), {'ingested': 1, 'failed': 0})
+            self.assertEqual([call.args[0] for call in scandir.call_args_list], [os.path.join(self.maildir, 'cur')])
+
+    def test_failed_files_retried(self):
+        """Test that a directory with a failed file is not checkpointed."""
+        self._deliver(0)
+        self._settle()
+        with mock.patch('maildir_watcher.save_metadata_batch', side_effect=lambda batch: [None] * len(batch)):
+            self.assertEqual(self.watcher.scan(), {'ingested': 0, 'failed': 1})
+        self.assertEqual(self.watcher.scan(), {'ingested': 1, 'failed': 0})
+
+    def test_maildir_rename(self):
+        """Test that moving a message from new/ to cur/ does not parse it again."""
+        path = self._deliver(0)
+        self.watcher.scan()
+
+        os.rename(path, os.path.join(self.maildir, 'cur', '0.host:2,S'))
+        self.assertEqual(self.watcher.scan(), {'ingested': 0, 'failed': 0})
+
+        conn = database_config.get_db_connection()
+        paths = [row[0] for row in conn.execute("SELECT path FROM ingested_files")]
+        conn.close()
+        self.assertEqual(paths, [os.path.join(self.maildir, 'cur', '0.host:2,S')])
+
+    def test_ingest_paths(self):
+        """Test ingesting the files reported by inotify events."""
+        path = self._deliver(0)
+        self.assertEqual(self.watcher.ingest_paths([path]), {'ingested': 1, 'failed': 0})
+        self.assertEqual(self.watcher.ingest_paths([path]), {'ingested': 0, 'failed': 0})
+
+    def test_event_paths(self):
+        """Test that files are picked up once written or moved in, and new directories watched."""
+        inotify = mock.Mock()
+        new = os.path.join(self.maildir, 'new')
+        events = [
+            (os.path.join(new, '1.host'), maildir_watcher._IN_CREATE),
+            (os.path.join(new, '2.host'), maildir_watcher._IN_CLOSE_WRITE),
+            (os.path.join(self.maildir, 'cur', '3.host:2,S'), maildir_watcher._IN_MOVED_TO),
+            (os.path.join(self.maildir, 'tmp', '4.host'), maildir_watcher._IN_CLOSE_WRITE),
+            (os.path.join(self.maildir, '.Archive'), maildir_watcher._IN_CREATE | maildir_watcher._IN_ISDIR),
+        ]
+        self.assertEqual(self.watcher._event_paths(inotify, events),
+                         {os.path.join(new, '2.host'), os.path.join(self.maildir, 'cur', '3.host:2,S')})
+        inotify.add_watch.assert_called_once_with(os.path.join(self.maildir, '.Archive'))
+        self.assertIsNone(self.watcher._event_paths(inotify, [('', maildir_watcher._IN_Q_OVERFLOW)]))
+
+    def test_event_lookup_per_path(self):
+        """Test that a flag change in a large cur/ does not load the directory's checkpoints."""
+        for i in range(20):
+            self._deliver(i, 'cur')
+        self.watcher.scan()
+        path = os.path.join(self.maildir, 'cur', '0.host')
+        os.rename(path, path + ':2,S')
+
+        statements = []
+        connect = database_config.get_db_connection
+
+        def traced_connection():
+            conn = connect()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        with mock.patch.object(database_config, 'get_db_connection', traced_connection):
+            self.assertEqual(self.watcher.ingest_paths([path + ':2,S']), {'ingested': 0, 'failed': 0})
+        self.assertFalse([statement for statement in statements if 'WHERE directory' in statement])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the memory-mapped mbox reader
+
+This script contains unit tests for MboxReader and its sidecar offset index.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from email.message import EmailMessage
+
+from mbox_reader import MboxReader, extract_range
+
+
+def _mbox_entry(i):
+    """Create one mbox entry, envelope line included."""
+    msg = EmailMessage()
+    msg['From'] = f'sender{i}@example.com'
+    msg['To'] = 'recipient@example.com'
+    msg['Subject'] = f'Archived message {i}'
+    msg['Message-ID'] = f'<mbox-{i}@example.com>'
+    msg.set_content(f'Body of message {i}\n>From the archive\n')
+    return b'From sender@example.com Mon Jan  1 12:00:00 2023\n' + msg.as_bytes() + b'\n'
+
+
+class TestMboxReader(unittest.TestCase):
+    """Test cases for MboxReader."""
+
+    def setUp(self):
+        """Write a small mbox archive to a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, 'archive.mbox')
+        with open(self.mbox_path, 'wb') as f:
+            for i in range(10):
+                f.write(_mbox_entry(i))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_random_access(self):
+        """Test fetching messages by index from the mapped archive."""
+        with MboxReader(self.mbox_path) as reader:
+            self.assertEqual(len(reader), 10)
+            self.assertIsInstance(reader.get_bytes(3), memoryview)
+            metadata = reader.get_extractor(7).extract_metadata()
+            self.assertEqual(metadata['message_id'], '<mbox-7@example.com>')
+            self.assertEqual(reader.get_extractor(-1).extract_metadata()['subject'], 'Archived message 9')
+            self.assertFalse(bytes(reader.get_bytes(0)).startswith(b'From '))
+
+    def test_sidecar_index(self):
+        """Test that the index is reused and extended when the archive grows."""
+        with MboxReader(self.mbox_path) as reader:
+            first_offsets = list(reader.offsets)
+        self.assertTrue(os.path.exists(self.mbox_path + '.idx'))
+
+        with MboxReader(self.mbox_path) as reader:
+            self.assertIsInstance(reader.offsets, memoryview)
+            self.assertEqual(list(reader.offsets), first_offsets)
+
+        with open(self.mbox_path, 'ab') as f:
+            f.write(_mbox_entry(10))
+        with MboxReader(self.mbox_path) as reader:
+            self.assertEqual(len(reader), 11)
+            self.assertEqual(list(reader.offsets)[:10], first_offsets)
+            self.assertEqual(reader.get_extractor(10).extract_metadata()['message_id'], '<mbox-10@example.com>')
+
+    def test_partition(self):
+        """Test splitting the archive into ranges for parallel workers."""
+        with MboxReader(self.mbox_path) as reader:
+            ranges = reader.partition(3)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], 10)
+        self.assertEqual(sum(hi - lo for lo, hi in ranges), 10)
+
+        stats = [extract_range(self.mbox_path, lo, hi) for lo, hi in ranges]
+        self.assertEqual(sum(s['extracted'] for s in stats), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
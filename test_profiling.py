@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the profiler
+
+This script profiles extractions of the sample email and checks the pstats,
+folded stack and summary output.
+"""
+
+import unittest
+import os
+import re
+import time
+import pstats
+import shutil
+import tempfile
+
+import profiling
+from email_metadata_extractor import EmailMetadataExtractor
+
+SAMPLE_EMAIL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_email.eml')
+
+
+class TestProfiler(unittest.TestCase):
+    """Test cases for Profiler."""
+
+    def setUp(self):
+        """Create a directory for the profile output."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the profile output."""
+        shutil.rmtree(self.directory)
+
+    def test_profile_extraction(self):
+        """Test that stages, extraction steps and the slowest messages are reported."""
+        size = os.path.getsize(SAMPLE_EMAIL)
+        with profiling.Profiler(sample_interval=0.001, slowest=2) as profiler:
+            for i in range(3):
+                with profiling.stage('extract'), profiling.message(f'message {i}', size):
+                    EmailMetadataExtractor(email_path=SAMPLE_EMAIL).extract_metadata()
+            with profiling.stage('busy'):
+                deadline = time.perf_counter() + 0.05
+                while time.perf_counter() < deadline:
+                    pass
+
+        self.assertIsNone(profiling.current())
+        self.assertEqual(profiler.stage_counts['extract'], 3)
+        self.assertEqual(profiler.messages, 3)
+        self.assertEqual(profiler.message_bytes, 3 * size)
+        self.assertEqual(len(profiler.slowest_messages()), 2)
+        self.assertIn('parse', [step for step, _, _ in profiler.extraction_steps()])
+
+        prof, folded, summary = profiler.write(os.path.join(self.directory, 'run'))
+        self.assertGreater(pstats.Stats(prof).total_calls, 0)
+        with open(folded, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r'^\S.* \d+$')
+        self.assertTrue(any(line.startswith('busy;') for line in lines))
+        with open(summary, encoding='utf-8') as f:
+            report = f.read()
+        self.assertIn('Slowest messages:', report)
+        self.assertRegex(report, re.compile(r'^\s+extract\s+[\d.]+s\s+3 calls$', re.MULTILINE))
+
+    def test_helpers_without_profiler(self):
+        """Test that stage() and message() do nothing when no profiler is running."""
+        self.assertIsNone(profiling.current())
+        with profiling.stage('extract'), profiling.message('message', 10):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
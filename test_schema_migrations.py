@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for schema migrations and query plans
+
+This script contains unit tests for the migration layer, and a harness that
+records every statement run by the database_config functions and the server
+endpoints and checks with EXPLAIN QUERY PLAN that none of them scans a table.
+"""
+
+import unittest
+import io
+import os
+import re
+import sqlite3
+import tempfile
+from unittest import mock
+
+import database_config
+import schema_migrations
+import server
+
+# Plan details that read a whole table or index
+_FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)')
+# Full-text lookups show up as SCAN of the virtual table with an index string
+_VIRTUAL_INDEX_RE = re.compile(r'VIRTUAL TABLE INDEX \d+:\S+')
+
+# Statements that may scan because they must visit every row they return
+ALLOWED_SCANS = (
+    # Aggregates over all campaign clusters (list_clusters)
+    'FROM campaign_signatures\n           GROUP BY cluster_id',
+    # FTS5 reading its one-row configuration shadow table
+    "FROM 'main'.'email_metadata_fts_config'",
+    # Schema probe, run once per database file (_has_search_index)
+    "sqlite_master WHERE type = 'table' AND name = 'email_metadata_fts'",
+    # The staged renames of update_related_emails, all of which are applied
+    'FROM temp.related_email_updates',
+)
+
+
+def _full_scans(cursor: sqlite3.Cursor, statement: str) -> list:
+    """Get the plan details of a statement that scan a table."""
+    plan = cursor.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [row[-1] for row in plan
+            if _FULL_SCAN_RE.match(row[-1]) and not _VIRTUAL_INDEX_RE.search(row[-1])]
+
+
+class TestSchemaMigrations(unittest.TestCase):
+    """Test cases for the migration layer."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def test_upgrade_unversioned_database(self):
+        """Test that a database from before versioning is migrated and its rows indexed."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE email_metadata (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, message_id TEXT UNIQUE, sender TEXT,
+            recipient TEXT, subject TEXT, date TEXT, metadata_json TEXT,
+            processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute("INSERT INTO email_metadata (message_id, sender, date) VALUES "
+                     "('<old@example.com>', 'legacy@example.org', 'Mon, 01 Jan 2023 12:00:00 +0000')")
+        conn.commit()
+        conn.close()
+
+        database_config.initialize_database()
+
+        conn = database_config.get_db_connection()
+        cursor = conn.cursor()
+        self.assertEqual(schema_migrations.get_schema_version(cursor), schema_migrations.MIGRATIONS[-1][0])
+        # Nothing is pending the second time
+        self.assertEqual(schema_migrations.apply_migrations(cursor), [])
+        conn.close()
+
+        results = database_config.search_email_metadata('legacy', 'sender')
+        self.assertEqual([row['message_id'] for row in results], ['<old@example.com>'])
+        self.assertEqual(results[0]['date_epoch'], 1672574400)
+
+    def test_search_index_follows_updates(self):
+        """Test that the full-text index tracks inserts, updates and deletes."""
+        database_config.initialize_database()
+        database_config.save_email_metadata('<1@example.com>', 'alice@example.com', '', 'Invoice', '', '{}')
+        database_config.save_email_metadata('<1@example.com>', 'bob@example.com', '', 'Invoice', '', '{}')
+
+        self.assertEqual(database_config.search_email_metadata('alice', 'sender'), [])
+        self.assertEqual(len(database_config.search_email_metadata('bob', 'sender')), 1)
+        # Short terms fall back to a LIKE scan
+        self.assertEqual(len(database_config.search_email_metadata('bo', 'sender')), 1)
+
+        conn = database_config.get_db_connection()
+        conn.execute("DELETE FROM email_metadata")
+        conn.commit()
+        conn.close()
+        self.assertEqual(database_config.search_email_metadata('invoice', 'subject'), [])
+
+
+    def test_search_index_retried(self):
+        """Test that a search index SQLite could not build is built on a later start."""
+        with mock.patch.object(schema_migrations, 'create_search_index', return_value=False):
+            database_config.initialize_database()
+        database_config.save_email_metadata('<1@example.com>', 'alice@example.com', '', 'Invoice', '', '{}')
+
+        conn = database_config.get_db_connection()
+        self.assertEqual(schema_migrations.get_schema_version(conn.cursor()), schema_migrations.MIGRATIONS[-1][0])
+        self.assertFalse(database_config._has_search_index(conn.cursor()))
+        conn.close()
+
+        database_config.initialize_database()
+        conn = database_config.get_db_connection()
+        rows = conn.execute("SELECT rowid FROM email_metadata_fts WHERE sender LIKE '%alice%'").fetchall()
+        conn.close()
+        self.assertEqual(len(rows), 1)
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Run the database and server code paths and check every query plan for full scans."""
+
+    def setUp(self):
+        """Record the statements run on every connection to a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        self.original_connect = database_config.get_db_connection
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        self.statements = set()
+
+        def traced_connection():
+            conn = self.original_connect()
+            conn.set_trace_callback(self.statements.add)
+            return conn
+
+        database_config.get_db_connection = traced_connection
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.get_db_connection = self.original_connect
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def _exercise(self):
+        """Call every query path of database_config and server.py."""
+        client = server.create_app().test_client()
+
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_email.eml'), 'rb') as f:
+            sample = f.read()
+        response = client.post('/api/extract-metadata', data={'file': (io.BytesIO(sample), 'sample.eml'), 'save_to_db': 'true'},
+                               content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        metadata_id = response.get_json()['database_id']
+        client.post('/api/save-to-database', data={'email_file': (io.BytesIO(sample), 'sample.eml')},
+                    content_type='multipart/form-data')
+
+        database_config.save_email_metadata('<1@example.com>', 'alice@example.com', 'bob@example.org',
+                                            'Invoice', 'Mon, 01 Jan 2023 12:00:00 +0000', '{}')
+        database_config.add_or_update_domain('example.com', 'Registrar', '2000-01-01', '2030-01-01')
+        database_config.add_or_update_domain('new.example', 'Registrar', '2000-01-01', '2030-01-01')
+        database_config.search_domain_info('gmail.com')
+        database_config.search_related_emails('gmail.com')
+        list(database_config.iter_email_metadata(start=1672531200, end=1675209600))
+
+        for search_type in database_config.SEARCH_TYPES:
+            for dates in ({}, {'start': 1672531200, 'end': 1675209600}):
+                database_config.search_email_metadata('example', search_type, **dates)
+                database_config.count_email_metadata('example', search_type, **dates)
+                database_config.search_email_metadata('example', search_type, limit=50, offset=50, **dates)
+                database_config.search_email_metadata('example', search_type, limit=50, after_id=50, **dates)
+                client.post('/api/search-email-metadata',
+                            json=dict({'search_term': 'example', 'search_type': search_type}, **dates))
+
+        client.post('/api/search-databases', json={'domains': ['gmail.com', 'example.com'], 'use_real_db': True})
+        client.post('/api/modify-email', json={'original_email': 'info@gmail.com', 'new_email': 'contact@gmail.com'})
+        client.post('/api/modify-emails', json={'mapping': {'admin@gmail.com': 'info@gmail.com', 'contact@gmail.com': 'admin@gmail.com'}})
+        client.get('/api/export-email-metadata?start=2023-01-01&end=2023-02-01').get_data()
+        client.get('/api/auth-verdicts?mechanism=dmarc&result=fail&domain=example.com')
+        client.get(f'/api/attachments?metadata_id={metadata_id}')
+        client.get('/api/attachments?sha256=' + '0' * 64)
+        client.get('/api/campaign-clusters')
+        client.get(f'/api/campaign-clusters/{metadata_id}')
+        client.get('/api/volume?dimension=sender_domain&granularity=day&start=2023-01-01&end=2023-02-01')
+        client.get('/api/volume?dimension=sender_domain&granularity=hour&key=example.com')
+        client.get('/api/top-k?dimension=domains&k=5&window=600')
+
+    def test_no_full_scans(self):
+        """Test that no recorded query scans a whole table."""
+        self._exercise()
+
+        conn = self.original_connect()
+        cursor = conn.cursor()
+        database_config.create_email_update_table(cursor)
+        failures = []
+        checked = 0
+        for statement in sorted(self.statements):
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE|WITH)\b', statement, re.IGNORECASE):
+                continue
+            if any(allowed in statement for allowed in ALLOWED_SCANS):
+                continue
+            checked += 1
+            scans = _full_scans(cursor, statement)
+            if scans:
+                failures.append(f"{' '.join(statement.split())}\n    -> {scans}")
+        conn.close()
+
+        self.assertGreater(checked, 30)
+        self.assertEqual(failures, [], "Queries with full scans:\n" + "\n".join(failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
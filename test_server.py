@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the Flask server
+
+This script contains unit tests for the application factory and the search endpoints.
+"""
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import gzip
+
+import database_config
+import response_cache
+import server
+
+
+class TestServer(unittest.TestCase):
+    """Test cases for apps built by server.create_app()."""
+
+    def setUp(self):
+        """Create an app on a temporary database."""
+        self.original_db_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        response_cache.cache.clear()
+        self.client = server.create_app().test_client()
+
+    def tearDown(self):
+        """Restore the database path and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_db_path
+        os.unlink(self.db_path)
+
+    def test_status(self):
+        """Test that the factory registers the API routes."""
+        response = self.client.get('/api/status')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'ok')
+
+    def test_search_email_metadata(self):
+        """Test searching saved metadata by sender."""
+        database_config.save_email_metadata('<1@example.com>', 'alice@example.com', '', 'Hi', '', '{}')
+
+        response = self.client.post('/api/search-email-metadata',
+                                    json={'search_term': 'alice', 'search_type': 'sender'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['count'], 1)
+
+        response = self.client.post('/api/search-email-metadata',
+                                    json={'search_term': 'alice', 'search_type': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_email_metadata_pages(self):
+        """Test that paged searches return stable pages and the total on the first page."""
+        for i in range(25):
+            database_config.save_email_metadata(f'<{i}@example.com>', f'user{i}@example.com', '', 'Page', '', '{}')
+
+        pages = []
+        for offset in (0, 10, 20):
+            response = self.client.get(f'/api/search-email-metadata?search_term=example.com'
+                                       f'&search_type=sender&limit=10&offset={offset}')
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.get_json())
+
+        self.assertEqual(pages[0]['total'], 25)
+        self.assertNotIn('total', pages[1])
+        self.assertEqual([page['count'] for page in pages], [10, 10, 5])
+        message_ids = [row['message_id'] for page in pages for row in page['results']]
+        self.assertEqual(message_ids, [f'<{i}@example.com>' for i in range(25)])
+
+        # Keyset pages continue from the last ID of the previous page
+        keyset_ids = []
+        after_id = None
+        while True:
+            query = f'&after_id={after_id}' if after_id is not None else ''
+            page = self.client.get(f'/api/search-email-metadata?search_term=example.com'
+                                   f'&search_type=sender&limit=10{query}').get_json()
+            keyset_ids += [row['message_id'] for row in page['results']]
+            self.assertEqual('total' in page, after_id is None)
+            after_id = page['next_after_id']
+            if after_id is None:
+                break
+        self.assertEqual(keyset_ids, message_ids)
+
+        response = self.client.get('/api/search-email-metadata?search_term=example.com&limit=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_modify_emails(self):
+        """Test that bulk renames report a status per address."""
+        response = self.client.post('/api/modify-emails', json={'mapping': {
+            'admin@gmail.com': 'contact@gmail.com', 'info@gmail.com': 'contact@gmail.com'}})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['counts'], {'updated': 1, 'conflict': 1})
+        self.assertEqual([result['status'] for result in data['results']], ['updated', 'conflict'])
+
+        response = self.client.post('/api/modify-emails', json={'mapping': [['info@gmail.com', '']]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_extraction_limits(self):
+        """Test that the limits and truncation counters are reported."""
+        response = self.client.get('/api/extraction-limits')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['limits']['max_hops'], server.DEFAULT_LIMITS['max_hops'])
+        self.assertIsInstance(data['metrics'], dict)
+
+    def test_profile_header(self):
+        """Test that requests are profiled only when enabled and asked for."""
+        profile_dir = tempfile.mkdtemp()
+        original = (server.PROFILING_ENABLED, server.PROFILE_DIR)
+        server.PROFILE_DIR = profile_dir
+        try:
+            server.PROFILING_ENABLED = False
+            response = self.client.get('/api/search-email-metadata?search_term=example', headers={'X-Profile': '1'})
+            self.assertNotIn('X-Profile-Id', response.headers)
+
+            server.PROFILING_ENABLED = True
+            response = self.client.get('/api/search-email-metadata?search_term=profiled', headers={'X-Profile': '1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('query;dur=', response.headers['Server-Timing'])
+            profile_id = response.headers['X-Profile-Id']
+            self.assertEqual(sorted(os.listdir(profile_dir)),
+                             [f'{profile_id}.folded', f'{profile_id}.prof', f'{profile_id}.txt'])
+
+            response = self.client.get('/api/status')
+            self.assertNotIn('X-Profile-Id', response.headers)
+        finally:
+            server.PROFILING_ENABLED, server.PROFILE_DIR = original
+            shutil.rmtree(profile_dir)
+
+    def test_conditional_requests(self):
+        """Test ETag revalidation, invalidation on writes and gzip negotiation."""
+        for i in range(50):
+            database_config.save_email_metadata(f'<{i}@example.com>', f'user{i}@example.com', '', 'Report', '', '{}')
+        url = '/api/search-email-metadata?search_term=example.com&search_type=sender'
+
+        first = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(first.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(len(json.loads(gzip.decompress(first.get_data()))['results']), 50)
+
+        etag = first.headers['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code, 304
+        )
+
+        # The identical POST search is answered from the cache
+        hits = response_cache.cache.hits
+        self.client.post('/api/search-email-metadata', json={'search_term': 'example.com', 'search_type': 'sender'})
+        self.client.post('/api/search-email-metadata', json={'search_term': 'example.com', 'search_type': 'sender'})
+        self.assertEqual(response_cache.cache.hits, hits + 1)
+
+        # Any write changes the ETag
+        database_config.save_email_metadata('<new@example.com>', 'new@example.com', '', '', '', '{}')
+        changed = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        self.assertEqual(changed.get_json()['count'], 51)
+
+    def test_limits_bounded(self):
+        """Test that negative or huge limits, k and windows are rejected."""
+        for url in ('/api/top-k?k=-1', '/api/top-k?k=100000', '/api/top-k?window=0',
+                    '/api/top-k?window=999999999', '/api/auth-verdicts?mechanism=dkim&limit=-1',
+                    '/api/attachments?metadata_id=1&limit=100000', '/api/campaign-clusters?limit=0',
+                    '/api/volume?limit=-5'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+        self.assertEqual(self.client.get('/api/top-k?k=5&window=600').status_code, 200)
+
+    def test_dashboard_etags(self):
+        """Test that writes to the tables behind the dashboard endpoints change their ETags."""
+        database_config.save_email_metadata('<a@example.com>', 'a@example.com', '', '', '', '{}')
+        url = '/api/auth-verdicts?mechanism=dmarc&result=fail'
+        first = self.client.get(url)
+        self.assertEqual(first.get_json()['count'], 0)
+
+        conn = database_config.get_db_connection()
+        conn.execute("INSERT INTO auth_verdicts (metadata_id, mechanism, result, domain) "
+                     "VALUES (1, 'dmarc', 'fail', 'example.com')")
+        conn.commit()
+        conn.close()
+        changed = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
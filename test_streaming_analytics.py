@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for streaming analytics
+
+This script contains unit tests for the Count-Min Sketch, Space-Saving and
+time-windowed top-K structures.
+"""
+
+import unittest
+import os
+import tempfile
+
+import database_config
+import streaming_analytics
+from streaming_analytics import CountMinSketch, SpaceSaving, StreamingAnalytics
+
+
+class TestSketches(unittest.TestCase):
+    """Test cases for the bounded-memory sketches."""
+
+    def test_count_min_sketch(self):
+        """Test that estimates never undercount."""
+        sketch = CountMinSketch()
+        for i in range(500):
+            sketch.add(f"domain{i % 50}.example")
+        sketch.add('big.example', 1000)
+
+        self.assertGreaterEqual(sketch.estimate('domain7.example'), 10)
+        self.assertGreaterEqual(sketch.estimate('big.example'), 1000)
+        self.assertEqual(sketch.total, 1500)
+
+    def test_space_saving(self):
+        """Test that heavy hitters survive eviction of rare items."""
+        summary = SpaceSaving(capacity=5)
+        for i in range(200):
+            summary.add('heavy.example')
+            summary.add(f"rare{i}.example")
+
+        top = summary.top(1)
+        self.assertEqual(top[0][0], 'heavy.example')
+        self.assertLessEqual(len(summary.counts), 5)
+
+
+class TestStreamingAnalytics(unittest.TestCase):
+    """Test cases for windowed top-K queries."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.analytics = StreamingAnalytics(slot_seconds=60, num_slots=60)
+        self.metadata = {
+            'from_email': 'news@bulk.example',
+            'domains': ['bulk.example', 'example.com'],
+            'ip_addresses': ['192.0.2.1'],
+        }
+
+    def test_top_k(self):
+        """Test top-K over the window."""
+        for _ in range(3):
+            self.analytics.observe(self.metadata, timestamp=1000)
+        self.analytics.observe({'from_email': 'a@other.example'}, timestamp=1000)
+
+        top = self.analytics.top_k('sender_domains', k=1, now=1000)
+        self.assertEqual(top, [{'item': 'bulk.example', 'count': 3}])
+        self.assertEqual(self.analytics.estimate('ip_addresses', '192.0.2.1', now=1000), 3)
+
+    def test_window_rotation(self):
+        """Test that slots older than the window are dropped."""
+        self.analytics.observe(self.metadata, timestamp=0)
+        self.analytics.observe({'from_email': 'a@later.example'}, timestamp=7200)
+
+        self.assertEqual(self.analytics.estimate('sender_domains', 'bulk.example', now=7200), 0)
+        top = self.analytics.top_k('sender_domains', now=7200)
+        self.assertEqual([entry['item'] for entry in top], ['later.example'])
+
+    def test_persistence(self):
+        """Test saving and loading the sketches."""
+        self.analytics.observe(self.metadata, timestamp=1000)
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            self.assertTrue(self.analytics.save(path))
+            restored = StreamingAnalytics()
+            self.assertTrue(restored.load(path))
+            self.assertEqual(restored.top_k('domains', now=1000), self.analytics.top_k('domains', now=1000))
+        finally:
+            for leftover in (path, f"{path}.lock"):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+
+    def test_save_merges_processes(self):
+        """Test that processes saving to the same file add up their counts."""
+        other = StreamingAnalytics(slot_seconds=60, num_slots=60)
+        self.analytics.observe(self.metadata, timestamp=1000)
+        other.observe(self.metadata, timestamp=1000)
+        other.observe(dict(self.metadata, from_email='a@other.example'), timestamp=1000)
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            self.assertTrue(self.analytics.save(path))
+            self.assertTrue(other.save(path))
+            # A second save only adds what was observed since the first
+            self.assertTrue(self.analytics.save(path))
+            restored = StreamingAnalytics(slot_seconds=60, num_slots=60)
+            self.assertTrue(restored.load(path))
+            self.assertEqual(restored.estimate('sender_domains', 'bulk.example', now=1000), 2)
+            self.assertEqual(restored.estimate('sender_domains', 'other.example', now=1000), 1)
+        finally:
+            for leftover in (path, f"{path}.lock"):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+
+
+class TestSharedSketches(unittest.TestCase):
+    """Test cases for the top-K sketches stored in the metadata database."""
+
+    def setUp(self):
+        """Use a temporary database."""
+        self.original_db_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database path and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_db_path
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def _save(self, metadata_list, timestamp):
+        # Each call stands in for the save transaction of another worker process
+        conn = database_config.get_db_connection()
+        for metadata in metadata_list:
+            streaming_analytics.add_message(conn.cursor(), metadata, timestamp)
+        conn.commit()
+        conn.close()
+
+    def test_counts_shared_between_connections(self):
+        """Test that the top-K combines the messages saved through every connection."""
+        self._save([{'from_email': 'news@bulk.example', 'ip_addresses': ['192.0.2.1']}] * 2, 1000)
+        self._save([{'from_email': 'news@bulk.example'}, {'from_email': 'a@other.example'}], 1030)
+
+        self.assertEqual(streaming_analytics.query_top_k('sender_domains', k=2, now=1030),
+                         [{'item': 'bulk.example', 'count': 3}, {'item': 'other.example', 'count': 1}])
+        self.assertEqual(streaming_analytics.query_top_k('ip_addresses', now=1030),
+                         [{'item': '192.0.2.1', 'count': 2}])
+
+    def test_eviction_and_window(self):
+        """Test that heavy hitters survive eviction and old slots fall out of the window."""
+        metadata_list = []
+        for i in range(streaming_analytics.SUMMARY_CAPACITY * 2):
+            metadata_list.append({'from_email': 'a@heavy.example'})
+            metadata_list.append({'from_email': f'a@rare{i}.example'})
+        self._save(metadata_list, 1000)
+
+        top = streaming_analytics.query_top_k('sender_domains', k=1, now=1000)
+        self.assertEqual(top[0]['item'], 'heavy.example')
+        self.assertGreaterEqual(top[0]['count'], streaming_analytics.SUMMARY_CAPACITY * 2)
+
+        self._save([{'from_email': 'a@later.example'}], 1000 + 7200)
+        self.assertEqual(streaming_analytics.query_top_k('sender_domains', now=1000 + 7200),
+                         [{'item': 'later.example', 'count': 1}])
+
+        conn = database_config.get_db_connection()
+        count = conn.execute("SELECT COUNT(*) FROM topk_candidates WHERE slot < ?", (7200 // 60,)).fetchone()[0]
+        conn.close()
+        self.assertEqual(count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for volume rollups
+
+This script contains unit tests for the hourly and daily volume rollup tables.
+"""
+
+import unittest
+import os
+import json
+import tempfile
+
+import database_config
+import volume_rollups
+from date_parsing import parse_time_bound
+
+
+class TestVolumeRollups(unittest.TestCase):
+    """Test cases for incremental and rebuilt volume rollups."""
+
+    def setUp(self):
+        """Point the database configuration at a temporary database."""
+        self.original_path = database_config.DATABASE_PATH
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_config.DATABASE_PATH = self.db_path
+        database_config.initialize_database()
+
+    def tearDown(self):
+        """Restore the database configuration and remove the temporary database."""
+        database_config.DATABASE_PATH = self.original_path
+        os.unlink(self.db_path)
+
+    def _save(self, message_id, date, from_email='news@bulk.example'):
+        metadata = {
+            'date': date,
+            'from_email': from_email,
+            'domains': [from_email.split('@')[1], 'example.com'],
+        }
+        metadata_id = database_config.save_email_metadata(
+            message_id, from_email, 'user@example.com', 'Subject', date, json.dumps(metadata)
+        )
+        volume_rollups.record_message(metadata_id, metadata)
+        return metadata_id
+
+    def test_parse_date_header(self):
+        """Test parsing Date headers to UTC epoch seconds."""
+        self.assertEqual(volume_rollups.parse_date_header('Mon, 01 Jan 2023 12:00:00 +0000'), 1672574400)
+        self.assertEqual(volume_rollups.parse_date_header('Mon, 01 Jan 2023 14:00:00 +0200'), 1672574400)
+        self.assertIsNone(volume_rollups.parse_date_header('not a date'))
+        self.assertIsNone(volume_rollups.parse_date_header(''))
+        # Fields out of range are rejected instead of rolling over
+        self.assertIsNone(volume_rollups.parse_date_header('Sat, 31 Feb 2024 12:00:00 +0000'))
+        self.assertIsNone(volume_rollups.parse_date_header('Mon, 01 Jan 2024 12:00:61 +0000'))
+        self.assertIsNone(volume_rollups.parse_date_header('31 Feb 2024 12:00:00 GMT'))
+        self.assertEqual(volume_rollups.parse_date_header('Thu, 29 Feb 2024 00:00:00 +0000'), 1709164800)
+
+    def test_incremental_rollups(self):
+        """Test that saved messages are counted once per bucket."""
+        self._save('<1@bulk.example>', 'Mon, 01 Jan 2023 12:00:00 +0000')
+        metadata_id = self._save('<2@bulk.example>', 'Mon, 01 Jan 2023 12:30:00 +0000')
+        self._save('<3@bulk.example>', 'Tue, 02 Jan 2023 08:00:00 +0000')
+
+        # Re-recording a saved message does not count it again
+        self.assertFalse(volume_rollups.record_message(metadata_id, {
+            'date': 'Mon, 01 Jan 2023 12:30:00 +0000',
+            'from_email': 'news@bulk.example',
+            'domains': ['bulk.example', 'example.com'],
+        }))
+
+        daily = volume_rollups.get_volume_series('sender_domain', 'bulk.example', 'day')
+        self.assertEqual([entry['count'] for entry in daily], [2, 1])
+        self.assertEqual(daily[0]['time'], '2023-01-01T00:00:00+00:00')
+
+        hourly = volume_rollups.get_volume_series(
+            'domain', 'example.com', 'hour',
+            start=parse_time_bound('2023-01-01'),
+            end=parse_time_bound('2023-01-02')
+        )
+        self.assertEqual(hourly, [{'bucket': 1672574400, 'time': '2023-01-01T12:00:00+00:00', 'count': 2}])
+
+    def test_changed_date_moves_counts(self):
+        """Test that a message re-saved with another Date is counted in its new bucket only."""
+        metadata_id = self._save('<1@bulk.example>', 'Mon, 01 Jan 2023 12:00:00 +0000')
+        self._save('<2@bulk.example>', 'Mon, 01 Jan 2023 12:00:00 +0000')
+
+        self.assertTrue(volume_rollups.record_message(metadata_id, {
+            'date': 'Tue, 03 Jan 2023 09:00:00 +0000',
+            'from_email': 'news@bulk.example',
+            'domains': ['bulk.example', 'example.com'],
+        }))
+        daily = volume_rollups.get_volume_series('sender', 'news@bulk.example', 'day')
+        self.assertEqual([(entry['time'][:10], entry['count']) for entry in daily],
+                         [('2023-01-01', 1), ('2023-01-03', 1)])
+
+        # Moving the other message too leaves no empty bucket behind
+        self._save('<2@bulk.example>', 'Tue, 03 Jan 2023 10:00:00 +0000')
+        hourly = volume_rollups.get_volume_series('domain', 'example.com', 'hour')
+        self.assertEqual([entry['count'] for entry in hourly], [1, 1])
+        self.assertEqual(hourly[0]['time'], '2023-01-03T09:00:00+00:00')
+
+    def test_changed_keys_move_counts(self):
+        """Test that a message re-saved at the same Date with another sender moves its counts."""
+        metadata_id = self._save('<1@bulk.example>', 'Mon, 01 Jan 2023 12:00:00 +0000')
+
+        self.assertTrue(volume_rollups.record_message(metadata_id, {
+            'date': 'Mon, 01 Jan 2023 12:00:00 +0000',
+            'from_email': 'news@other.example',
+            'domains': ['other.example'],
+        }))
+        self.assertEqual(volume_rollups.get_volume_series('sender_domain', 'bulk.example', 'day'), [])
+        self.assertEqual(volume_rollups.get_volume_series('domain', 'example.com', 'day'), [])
+        self.assertEqual([entry['count'] for entry in
+                          volume_rollups.get_volume_series('sender_domain', 'other.example', 'day')], [1])
+
+    def test_rebuild_rollups(self):
+        """Test that a bulk rebuild matches the incremental counts."""
+        self._save('<1@bulk.example>', 'Mon, 01 Jan 2023 12:00:00 +0000')
+        self._save('<2@other.example>', 'Mon, 01 Jan 2023 13:00:00 +0000', 'a@other.example')
+        self._save('<3@other.example>', 'garbage', 'a@other.example')
+        before = volume_rollups.get_top_keys('domain')
+
+        self.assertEqual(volume_rollups.rebuild_rollups(), 2)
+        self.assertEqual(volume_rollups.get_top_keys('domain'), before)
+        self.assertEqual(before[0], {'key': 'example.com', 'count': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
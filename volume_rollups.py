@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Volume Rollups for Email Metadata Extractor
+
+This module maintains pre-aggregated message counts per UTC hour and day for
+each sender, sender domain and domain seen in the saved metadata. The rollups
+are updated incrementally when a message is saved and can be rebuilt in bulk
+from the email_metadata table, so volume time series are served from a small
+indexed table instead of parsing the free-text date column of every row.
+"""
+
+import json
+import sqlite3
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+import database_config
+from date_parsing import parse_date_header
+
+# Bucket sizes in seconds, keyed by granularity name
+GRANULARITIES = {
+    'hour': 3600,
+    'day': 86400,
+}
+
+# Rollup dimensions
+DIMENSIONS = ('sender', 'sender_domain', 'domain')
+
+
+def _rollup_keys(metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Get the (dimension, key) pairs a message counts towards."""
+    keys = []
+    from_email = (metadata.get('from_email') or '').lower()
+    if from_email:
+        keys.append(('sender', from_email))
+        if '@' in from_email:
+            keys.append(('sender_domain', from_email.split('@')[-1]))
+    for domain in sorted(set(d.lower() for d in metadata.get('domains') or [])):
+        keys.append(('domain', domain))
+    return keys
+
+
+def _rollup_rows(timestamp: int, keys: List[Tuple[str, str]]) -> Iterable[Tuple[str, int, str, str]]:
+    """Get the (granularity, bucket, dimension, key) rows a message counts towards."""
+    for granularity, size in GRANULARITIES.items():
+        bucket = timestamp - timestamp % size
+        for dimension, key in keys:
+            yield granularity, bucket, dimension, key
+
+
+def _update_counts(cursor: sqlite3.Cursor, timestamp: int, keys: List[Tuple[str, str]], delta: int):
+    """Add delta to the rollup rows of a message, removing rows that drop to zero."""
+    rows = list(_rollup_rows(timestamp, keys))
+    cursor.executemany(
+        """INSERT INTO volume_rollups (granularity, bucket, dimension, rollup_key, message_count)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (dimension, rollup_key, granularity, bucket)
+           DO UPDATE SET message_count = message_count + excluded.message_count""",
+        [(*row, delta) for row in rows]
+    )
+    if delta < 0:
+        cursor.executemany(
+            """DELETE FROM volume_rollups
+               WHERE granularity = ? AND bucket = ? AND dimension = ? AND rollup_key = ?
+                 AND message_count <= 0""",
+            rows
+        )
+
+
+def create_rollup_tables(cursor: sqlite3.Cursor):
+    """
+    Create the volume rollup table and its indexes.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS volume_rollups (
+        dimension TEXT NOT NULL,
+        rollup_key TEXT NOT NULL,
+        granularity TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, rollup_key, granularity, bucket)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_volume_rollups_bucket "
+        "ON volume_rollups (dimension, granularity, bucket, rollup_key, message_count)"
+    )
+
+    # Messages already counted, with the time and keys they were counted
+    # under, so re-saving a message does not count it twice and a changed
+    # Date moves its counts
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS volume_rollup_messages (
+        metadata_id INTEGER PRIMARY KEY,
+        date_epoch INTEGER,
+        rollup_keys TEXT
+    )
+    ''')
+
+
+def add_counted_columns(cursor: sqlite3.Cursor):
+    """
+    Add the date_epoch and rollup_keys columns to a volume_rollup_messages table created without them.
+
+    Messages counted before then keep NULL columns; their counts are not
+    moved when they are re-saved with another Date.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+    """
+    cursor.execute("PRAGMA table_info(volume_rollup_messages)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and 'date_epoch' not in columns:
+        cursor.execute("ALTER TABLE volume_rollup_messages ADD COLUMN date_epoch INTEGER")
+        cursor.execute("ALTER TABLE volume_rollup_messages ADD COLUMN rollup_keys TEXT")
+
+
+def record_message(metadata_id: int, metadata: Dict[str, Any]) -> bool:
+    """
+    Add a saved message to the volume rollups.
+
+    Args:
+        metadata_id (int): The ID of the email_metadata record
+        metadata (Dict[str, Any]): The extracted metadata of the message
+
+    Returns:
+        bool: True if the message was counted, False if it has no usable date,
+              was already counted or the operation failed
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        counted = add_message(cursor, metadata_id, metadata)
+        conn.commit()
+        return counted
+    except Exception as e:
+        print(f"Error updating volume rollups: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def add_message(cursor: sqlite3.Cursor, metadata_id: int, metadata: Dict[str, Any]) -> bool:
+    """
+    Add a saved message to the volume rollups without committing.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the metadata database
+        metadata_id (int): The ID of the email_metadata record
+        metadata (Dict[str, Any]): The extracted metadata of the message
+
+    Returns:
+        bool: True if the message was counted, False if it has no usable date or was already counted
+              at the same time under the same keys
+    """
+    timestamp = metadata.get('date_epoch')
+    if timestamp is None:
+        timestamp = parse_date_header(str(metadata.get('date', '')))
+    keys = _rollup_keys(metadata)
+
+    cursor.execute(
+        "SELECT date_epoch, rollup_keys FROM volume_rollup_messages WHERE metadata_id = ?",
+        (metadata_id,)
+    )
+    counted = cursor.fetchone()
+    if counted is not None:
+        if counted[1] is None:
+            return False
+        counted_keys = [tuple(key) for key in json.loads(counted[1])]
+        if counted[0] == timestamp and counted_keys == keys:
+            return False
+        # The message was re-saved with another Date or other senders and
+        # domains; take back its old counts
+        _update_counts(cursor, counted[0], counted_keys, -1)
+        cursor.execute("DELETE FROM volume_rollup_messages WHERE metadata_id = ?", (metadata_id,))
+
+    if timestamp is None:
+        return False
+
+    cursor.execute(
+        "INSERT INTO volume_rollup_messages (metadata_id, date_epoch, rollup_keys) VALUES (?, ?, ?)",
+        (metadata_id, timestamp, json.dumps(keys))
+    )
+    _update_counts(cursor, timestamp, keys, 1)
+    return True
+
+
+def rebuild_rollups() -> Optional[int]:
+    """
+    Rebuild all volume rollups from the email_metadata table.
+
+    Messages whose partition is archived or dropped, like legacy rows whose
+    body is archived, are counted under the keys recorded when they were
+    counted.
+
+    Returns:
+        Optional[int]: The number of stored messages counted, or None if the operation failed
+    """
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        counts = Counter()
+        counted = []
+        seen = set()
+        # Messages may be stored in monthly partitions
+        for row in database_config.iter_email_metadata():
+            seen.add(row['id'])
+            timestamp = row['date_epoch']
+            if timestamp is None:
+                continue
+            if row['metadata_json'] is None:
+                cursor.execute(
+                    "SELECT rollup_keys FROM volume_rollup_messages WHERE metadata_id = ?",
+                    (row['id'],)
+                )
+                recorded = cursor.fetchone()
+                if recorded is None or recorded[0] is None:
+                    continue
+                keys = [tuple(key) for key in json.loads(recorded[0])]
+            else:
+                try:
+                    keys = _rollup_keys(json.loads(row['metadata_json']))
+                except ValueError:
+                    continue
+            counts.update(_rollup_rows(timestamp, keys))
+            counted.append((row['id'], timestamp, json.dumps(keys)))
+
+        cursor.execute(
+            "SELECT metadata_id, date_epoch, rollup_keys FROM volume_rollup_messages WHERE rollup_keys IS NOT NULL"
+        )
+        for metadata_id, timestamp, keys in cursor.fetchall():
+            if metadata_id not in seen:
+                counts.update(_rollup_rows(timestamp, [tuple(key) for key in json.loads(keys)]))
+
+        cursor.execute("DELETE FROM volume_rollups")
+        cursor.executemany(
+            "DELETE FROM volume_rollup_messages WHERE metadata_id = ?", [(metadata_id,) for metadata_id in seen]
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO volume_rollup_messages (metadata_id, date_epoch, rollup_keys) VALUES (?, ?, ?)",
+            counted
+        )
+        cursor.executemany(
+            """INSERT INTO volume_rollups (granularity, bucket, dimension, rollup_key, message_count)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(*row, count) for row, count in counts.items()]
+        )
+        conn.commit()
+        return len(counted)
+    except Exception as e:
+        print(f"Error rebuilding volume rollups: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def get_volume_series(dimension: str, key: str, granularity: str = 'day',
+                      start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Get the message volume time series of a sender, sender domain or domain.
+
+    Args:
+        dimension (str): One of 'sender', 'sender_domain' or 'domain'
+        key (str): The sender address or domain name
+        granularity (str): 'hour' or 'day'
+        start (Optional[int]): Inclusive start of the range in epoch seconds
+        end (Optional[int]): Exclusive end of the range in epoch seconds
+
+    Returns:
+        List[Dict[str, Any]]: Buckets with their start time and message count, oldest first
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Invalid dimension: {dimension}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity: {granularity}")
+
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """SELECT bucket, message_count FROM volume_rollups
+           WHERE dimension = ? AND rollup_key = ? AND granularity = ?
+             AND bucket >= ? AND bucket < ?
+           ORDER BY bucket""",
+        (dimension, key.lower(), granularity,
+         start if start is not None else -2 ** 63, end if end is not None else 2 ** 63 - 1)
+    )
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [
+        {
+            'bucket': row['bucket'],
+            'time': datetime.fromtimestamp(row['bucket'], timezone.utc).isoformat(),
+            'count': row['message_count'],
+        }
+        for row in rows
+    ]
+
+
+def get_top_keys(dimension: str, granularity: str = 'day', start: Optional[int] = None,
+                 end: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Get the senders or domains with the most messages in a time range.
+
+    Args:
+        dimension (str): One of 'sender', 'sender_domain' or 'domain'
+        granularity (str): Rollup granularity to aggregate, 'hour' or 'day'
+        start (Optional[int]): Inclusive start of the range in epoch seconds
+        end (Optional[int]): Exclusive end of the range in epoch seconds
+        limit (int): Maximum number of keys to return
+
+    Returns:
+        List[Dict[str, Any]]: Keys with their total message count, largest first
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Invalid dimension: {dimension}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity: {granularity}")
+
+    conn = database_config.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """SELECT rollup_key, SUM(message_count) AS total FROM volume_rollups
+           WHERE dimension = ? AND granularity = ? AND bucket >= ? AND bucket < ?
+           GROUP BY rollup_key
+           ORDER BY total DESC, rollup_key
+           LIMIT ?""",
+        (dimension, granularity,
+         start if start is not None else -2 ** 63, end if end is not None else 2 ** 63 - 1, limit)
+    )
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [{'key': row['rollup_key'], 'count': row['total']} for row in rows]
+
+
+if __name__ == "__main__":
+    counted = rebuild_rollups()
+    if counted is not None:
+        print(f"Volume rollups rebuilt from {counted} messages")